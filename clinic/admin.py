@@ -1,16 +1,65 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
 from django.urls import path
 from django.http import HttpResponse
 from django.utils.html import format_html
-from .models import Patient, Staff, Department, Appointment, MedicalRecord, Prescription, Diagnosis, InsuranceCompany, CustomUser
+from .models import (
+    Patient, Staff, Department, Appointment, MedicalRecord, Prescription, Diagnosis, InsuranceCompany, CustomUser,
+    StaffScheduleException
+)
+from .exports import streaming_export_response
+from .querybudget import QueryBudgetAdminMixin, query_budget
+from .routers import ReplicaAdminMixin, replica_method
 import csv
 
 
+class StreamingExportAdminMixin:
+    """Ссылки на потоковую выгрузку всей таблицы: <changelist>/export_all_csv/ и export_all_jsonl/"""
+    export_name = None
+
+    def get_urls(self):
+        urls = super().get_urls()
+        info = self.model._meta.app_label, self.model._meta.model_name
+        custom_urls = [
+            path('export_all_csv/', self.admin_site.admin_view(self.export_all_csv_view),
+                 name='%s_%s_export_all_csv' % info),
+            path('export_all_jsonl/', self.admin_site.admin_view(self.export_all_jsonl_view),
+                 name='%s_%s_export_all_jsonl' % info),
+        ]
+        return custom_urls + urls
+
+    def _export_all(self, request, export_format):
+        # admin_view пропускает любого сотрудника с is_staff — нужно право на просмотр модели
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return streaming_export_response(self.export_name, export_format)
+
+    @replica_method
+    def export_all_csv_view(self, request):
+        """Выгрузка всей таблицы в CSV"""
+        return self._export_all(request, 'csv')
+
+    @replica_method
+    def export_all_jsonl_view(self, request):
+        """Выгрузка всей таблицы в JSON Lines"""
+        return self._export_all(request, 'jsonl')
+
+
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, StreamingExportAdminMixin, admin.ModelAdmin):
+    export_name = 'patients'
+    changelist_query_budget = 12
     list_display = ['full_name', 'date_of_birth', 'gender', 'phone', 'export_buttons']
-    search_fields = ['full_name', 'insurance_number', 'phone']
+    # Поиск идет по FTS-индексу (префиксы слов ФИО и телефона) и слепым индексам
+    # полиса и паспорта — см. PatientQuerySet.search; LIKE по таблице не выполняется
+    search_fields = ['full_name', 'phone']
+    search_help_text = 'Начало фамилии, имени или телефона; номер полиса или паспорта целиком'
     list_filter = ['gender', 'insurance_company']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.search(search_term), False
     
     def export_buttons(self, obj):
         """Кнопки экспорта"""
@@ -33,6 +82,8 @@ class PatientAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
     
+    @replica_method
+    @query_budget(4)
     def export_txt_view(self, request, patient_id):
         """Экспорт в TXT"""
         patient = Patient.objects.get(id=patient_id)
@@ -58,7 +109,10 @@ class PatientAdmin(admin.ModelAdmin):
 ╚════════════════════════════════════════════════════════════╝
 """
         
-        records = MedicalRecord.objects.filter(patient=patient).order_by('-record_date')[:10]
+        records = (
+            MedicalRecord.objects.filter(patient=patient)
+            .select_related('doctor', 'diagnosis').order_by('-record_date')[:10]
+        )
         for i, record in enumerate(records, 1):
             content += f"""
 Запись #{i}:
@@ -73,6 +127,8 @@ class PatientAdmin(admin.ModelAdmin):
         response.write(content)
         return response
     
+    @replica_method
+    @query_budget(4)
     def export_csv_view(self, request, patient_id):
         """Экспорт в CSV с правильными колонками"""
         patient = Patient.objects.get(id=patient_id)
@@ -103,7 +159,10 @@ class PatientAdmin(admin.ModelAdmin):
         writer.writerow(['МЕДИЦИНСКИЕ ЗАПИСИ'])
         writer.writerow(['Дата', 'Врач', 'Симптомы', 'Диагноз', 'Лечение', 'Подписано'])
         
-        records = MedicalRecord.objects.filter(patient=patient).order_by('-record_date')[:10]
+        records = (
+            MedicalRecord.objects.filter(patient=patient)
+            .select_related('doctor', 'diagnosis').order_by('-record_date')[:10]
+        )
         for record in records:
             writer.writerow([
                 str(record.record_date.date()),
@@ -116,13 +175,19 @@ class PatientAdmin(admin.ModelAdmin):
         
         return response
     
+    @replica_method
+    @query_budget(4)
     def export_json_view(self, request, patient_id):
         """Экспорт в JSON"""
         import json
         patient = Patient.objects.get(id=patient_id)
         
         records_data = []
-        for record in MedicalRecord.objects.filter(patient=patient).order_by('-record_date')[:10]:
+        records = (
+            MedicalRecord.objects.filter(patient=patient)
+            .select_related('doctor', 'diagnosis').order_by('-record_date')[:10]
+        )
+        for record in records:
             records_data.append({
                 'date': str(record.record_date.date()),
                 'doctor': record.doctor.full_name,
@@ -154,57 +219,99 @@ class PatientAdmin(admin.ModelAdmin):
         return response
 
 
+class StaffScheduleExceptionInline(admin.TabularInline):
+    model = StaffScheduleException
+    fields = ['kind', 'date_from', 'date_to', 'work_hours', 'reason']
+    extra = 0
+
+
 @admin.register(Staff)
-class StaffAdmin(admin.ModelAdmin):
+class StaffAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ['full_name', 'position', 'specialty', 'department', 'phone']
+    list_select_related = ['department']
+    changelist_query_budget = 12
     list_filter = ['position', 'department']
     search_fields = ['full_name', 'specialty']
+    inlines = [StaffScheduleExceptionInline]
+
+
+@admin.register(StaffScheduleException)
+class StaffScheduleExceptionAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, admin.ModelAdmin):
+    list_display = ['staff', 'kind', 'date_from', 'date_to', 'work_hours']
+    list_select_related = ['staff']
+    changelist_query_budget = 12
+    list_filter = ['kind', 'date_from']
+    search_fields = ['staff__full_name']
+    autocomplete_fields = ['staff']
+    date_hierarchy = 'date_from'
 
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, StreamingExportAdminMixin, admin.ModelAdmin):
+    export_name = 'appointments'
     list_display = ['patient', 'doctor', 'appointment_date', 'appointment_time', 'status']
+    # Выпадающие списки загружали бы всех пациентов и вызывали __str__ для каждой строки
+    autocomplete_fields = ['patient', 'doctor']
+    changelist_query_budget = 12
     list_filter = ['status', 'appointment_date']
     search_fields = ['patient__full_name', 'doctor__full_name']
     date_hierarchy = 'appointment_date'
 
+    def get_queryset(self, request):
+        # __str__ приема использует пациента и врача: список, автодополнение, формы.
+        # Заданный здесь select_related заменяет list_select_related
+        return super().get_queryset(request).select_related('patient', 'doctor')
+
 
 @admin.register(Department)
-class DepartmentAdmin(admin.ModelAdmin):
+class DepartmentAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'phone', 'cabinet_number']
     search_fields = ['name']
 
 
 @admin.register(MedicalRecord)
-class MedicalRecordAdmin(admin.ModelAdmin):
+class MedicalRecordAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, StreamingExportAdminMixin, admin.ModelAdmin):
+    export_name = 'medical_records'
     list_display = ['patient', 'doctor', 'record_date', 'diagnosis', 'is_signed']
+    autocomplete_fields = ['patient', 'appointment', 'doctor', 'diagnosis']
+    changelist_query_budget = 12
     list_filter = ['is_signed', 'record_date']
     search_fields = ['patient__full_name']
     date_hierarchy = 'record_date'
 
+    def get_queryset(self, request):
+        # __str__ записи использует пациента (автодополнение в рецептах), список — врача и диагноз.
+        # Заданный здесь select_related заменяет list_select_related
+        return super().get_queryset(request).select_related('patient', 'doctor', 'diagnosis')
+
 
 @admin.register(Prescription)
-class PrescriptionAdmin(admin.ModelAdmin):
+class PrescriptionAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ['patient', 'doctor', 'medication_name', 'dosage', 'valid_until']
+    list_select_related = ['patient', 'doctor']
+    autocomplete_fields = ['medical_record', 'patient', 'doctor']
+    changelist_query_budget = 12
     list_filter = ['valid_until']
     search_fields = ['patient__full_name', 'medication_name']
 
 
 @admin.register(Diagnosis)
-class DiagnosisAdmin(admin.ModelAdmin):
+class DiagnosisAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['code', 'name', 'is_active']
     search_fields = ['code', 'name']
     list_filter = ['is_active']
 
 
 @admin.register(InsuranceCompany)
-class InsuranceCompanyAdmin(admin.ModelAdmin):
+class InsuranceCompanyAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'license_number', 'phone']
     search_fields = ['name', 'license_number']
 
 
 @admin.register(CustomUser)
-class CustomUserAdmin(admin.ModelAdmin):
+class CustomUserAdmin(ReplicaAdminMixin, QueryBudgetAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'role', 'is_active']
+    list_select_related = ['user']
+    changelist_query_budget = 12
     list_filter = ['role', 'is_active']
     search_fields = ['user__username']
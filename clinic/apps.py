@@ -4,3 +4,6 @@ class ClinicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic'
     verbose_name = 'Медицинская клиника'
+
+    def ready(self):
+        from . import signals  # noqa: F401
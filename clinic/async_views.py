@@ -0,0 +1,233 @@
+"""
+Асинхронные версии читающих действий API для запуска под ASGI.
+
+Django REST Framework 3.14 не поддерживает async-представления, поэтому
+самые нагруженные GET-действия PatientViewSet, StaffViewSet и
+AppointmentViewSet продублированы обычными async-представлениями Django
+с теми же URL, форматом ответа, ETag и аудитом. Данные читаются
+асинхронным ORM, синхронные части (аудит, индекс слотов, рендеринг PDF)
+выполняются в пуле потоков через sync_to_async, поэтому медленная выгрузка
+не занимает воркер целиком.
+
+Маршруты подключаются перед роутером DRF при ASYNC_READ_VIEWS = True
+(под WSGI включать не нужно: каждый async-вызов выполнялся бы через
+async_to_sync в отдельном цикле событий). Аутентификация — тот же JWT
+без обращения к БД, затем сессия. Бюджеты запросов — те же, что у
+соответствующих действий синхронных viewset'ов.
+"""
+from datetime import datetime, timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import Http404, HttpResponse
+from django.urls import path
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+from .audit import log_audit
+from .conditional import Validators
+from .models import Appointment, MedicalRecord, Patient, Prescription, Staff
+from .pdf import aget_medical_card_pdf, amedical_card_records, medical_card_cache_key
+from .querybudget import query_budget
+from .routers import ais_sticky, read_from_replica
+from .serializers import (
+    AppointmentSerializer, MedicalRecordSerializer, PatientSerializer, PrescriptionSerializer
+)
+from .views import AppointmentViewSet, PatientViewSet, StaffViewSet, available_slots_data
+
+_jwt = JWTStatelessUserAuthentication()
+
+
+def json_response(data, status=200):
+    # Тот же рендерер, что и у DRF: ответы совпадают побайтно
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def authenticate(request):
+    """Пользователь запроса: JWT из заголовка (без БД), иначе сессия"""
+    header = _jwt.get_header(request)
+    if header is not None:
+        raw_token = _jwt.get_raw_token(header)
+        if raw_token is not None:
+            return _jwt.get_user(_jwt.get_validated_token(raw_token))
+    return await sync_to_async(get_user)(request)
+
+
+def _unauthorized(request, data):
+    response = json_response(data, status=401)
+    response['WWW-Authenticate'] = _jwt.authenticate_header(request)
+    return response
+
+
+def async_api_view(view):
+    """GET-представление для аутентифицированных пользователей (аналог IsAuthenticated)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return json_response({'detail': f'Метод "{request.method}" не разрешен.'}, status=405)
+        try:
+            user = await authenticate(request)
+        except AuthenticationFailed as e:
+            # InvalidToken — подкласс AuthenticationFailed; тело ответа — как у DRF
+            data = e.detail if isinstance(e.detail, (list, dict)) else {'detail': e.detail}
+            return _unauthorized(request, data)
+        except TokenError as e:
+            return _unauthorized(request, {'detail': str(e)})
+        if not user or not user.is_authenticated:
+            return _unauthorized(request, {'detail': 'Учетные данные не были предоставлены.'})
+        request.user = user
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404:
+            return json_response({'detail': 'Не найдено.'}, status=404)
+    return wrapper
+
+
+def async_query_budget(viewset, action):
+    """Бюджет запросов того же действия синхронного viewset'а (QueryBudgetMixin)"""
+    limit = viewset.query_budgets.get(action, viewset.query_budget)
+    name = f'{viewset.__name__}.{action} (async)'
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            async with query_budget(limit, name):
+                return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def async_replica_reads(view):
+    """Чтение с реплики, как у replica_actions синхронных viewset'ов"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        with read_from_replica(not await ais_sticky(request)):
+            return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _get_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404
+
+
+async def _audit(request, action, model_name, object_id):
+    await sync_to_async(log_audit)(request.user, action, model_name, str(object_id))
+
+
+# ============ ПАЦИЕНТЫ ============
+
+@async_query_budget(PatientViewSet, 'medical_records')
+@async_api_view
+async def patient_medical_records(request, pk):
+    patient = await _get_or_404(Patient.objects.all(), pk=pk)
+    records = MedicalRecord.objects.filter(patient=patient)
+    validators = await Validators.afor_sources(records, key=('medical_records', patient.pk))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    data = MedicalRecordSerializer([record async for record in records], many=True).data
+    return validators.apply(json_response(data))
+
+
+@async_query_budget(PatientViewSet, 'prescriptions')
+@async_api_view
+async def patient_prescriptions(request, pk):
+    patient = await _get_or_404(Patient.objects.all(), pk=pk)
+    prescriptions = Prescription.objects.filter(patient=patient)
+    validators = await Validators.afor_sources(prescriptions, key=('prescriptions', patient.pk))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    data = PrescriptionSerializer([item async for item in prescriptions], many=True).data
+    return validators.apply(json_response(data))
+
+
+@async_query_budget(PatientViewSet, 'export_json')
+@async_api_view
+@async_replica_reads
+async def patient_export_json(request, pk):
+    patient = await _get_or_404(Patient.objects.all(), pk=pk)
+    records = MedicalRecord.objects.filter(patient=patient)
+    appointments = Appointment.objects.filter(patient=patient)
+    validators = await Validators.afor_sources(patient, records, appointments, key=('export_json', patient.pk))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    data = {
+        'patient': PatientSerializer(patient).data,
+        'medical_records': MedicalRecordSerializer([record async for record in records], many=True).data,
+        'appointments': AppointmentSerializer([item async for item in appointments], many=True).data,
+        'exported_at': datetime.now().isoformat()
+    }
+    await _audit(request, 'export_json', 'Patient', patient.id)
+    return validators.apply(json_response(data))
+
+
+@async_query_budget(PatientViewSet, 'export_pdf')
+@async_api_view
+@async_replica_reads
+async def patient_export_pdf(request, pk):
+    patient = await _get_or_404(Patient.objects.all(), pk=pk)
+    records = await amedical_card_records(patient)
+    validators = await Validators.afor_sources(
+        patient, MedicalRecord.objects.filter(patient=patient),
+        key=('export_pdf', medical_card_cache_key(patient, records)),
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    response = HttpResponse(await aget_medical_card_pdf(patient, records), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="patient_{patient.full_name}.pdf"'
+    await _audit(request, 'export_pdf', 'Patient', patient.id)
+    return validators.apply(response)
+
+
+# ============ ПЕРСОНАЛ ============
+
+@async_query_budget(StaffViewSet, 'schedule')
+@async_api_view
+@async_replica_reads
+async def staff_schedule(request, pk):
+    doctor = await _get_or_404(Staff.objects.all(), pk=pk)
+    today = timezone.now().date()
+    appointments = Appointment.objects.filter(
+        doctor=doctor,
+        appointment_date__gte=today,
+        appointment_date__lte=today + timedelta(days=7)
+    ).order_by('appointment_date', 'appointment_time')
+    validators = await Validators.afor_sources(appointments, key=('schedule', doctor.pk, today))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    data = AppointmentSerializer([item async for item in appointments], many=True).data
+    return validators.apply(json_response(data))
+
+
+# ============ ПРИЁМЫ ============
+
+@async_query_budget(AppointmentViewSet, 'available_slots')
+@async_api_view
+async def appointment_available_slots(request):
+    # Индекс слотов синхронный (блокировка, догрузка дней из БД) — в пуле потоков
+    data, code = await sync_to_async(available_slots_data)(request.GET)
+    return json_response(data, status=code)
+
+
+# Пути совпадают с маршрутами DefaultRouter: при ASYNC_READ_VIEWS они
+# подключаются раньше роутера и перехватывают только эти GET-действия
+urlpatterns = [
+    path('patients/<uuid:pk>/medical_records/', patient_medical_records, name='async-patient-medical-records'),
+    path('patients/<uuid:pk>/prescriptions/', patient_prescriptions, name='async-patient-prescriptions'),
+    path('patients/<uuid:pk>/export_json/', patient_export_json, name='async-patient-export-json'),
+    path('patients/<uuid:pk>/export_pdf/', patient_export_pdf, name='async-patient-export-pdf'),
+    path('staff/<uuid:pk>/schedule/', staff_schedule, name='async-staff-schedule'),
+    path('appointments/available_slots/', appointment_available_slots, name='async-appointment-available-slots'),
+]
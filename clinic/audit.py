@@ -0,0 +1,221 @@
+"""
+Пакетная запись журнала аудита.
+
+События складываются в очередь внутри процесса, а фоновый поток пишет их
+в таблицу audit_logs через bulk_create — по достижении размера пакета или
+по таймеру. При блокировке БД пакет не теряется, запись повторяется с
+нарастающей задержкой. Если пакет не записывается из-за отдельных событий
+(нарушение целостности), он делится пополам, и в лог попадают только
+они. При завершении процесса очередь сбрасывается.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _user_id(user):
+    """ID пользователя или None для анонимных запросов и системных действий"""
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return None
+    return user.pk
+
+
+class AuditLogWriter:
+    """Очередь событий аудита с фоновым сбросом в БД"""
+
+    def __init__(self, batch_size=200, flush_interval=1.0, max_queue_size=50000,
+                 max_retry_delay=30.0, shutdown_retries=5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_retry_delay = max_retry_delay
+        self.shutdown_retries = shutdown_retries
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_async(self):
+        return getattr(settings, 'AUDIT_LOG_ASYNC', True)
+
+    def log(self, user, action, model_name, object_id, changes=None, ip_address=None):
+        """Поставить событие в очередь (или записать сразу, если AUDIT_LOG_ASYNC выключен)"""
+        from .models import AuditLog
+
+        event = AuditLog(
+            user_id=_user_id(user),
+            action=action,
+            model_name=model_name,
+            object_id=str(object_id),
+            changes=changes or {},
+            ip_address=ip_address,
+            timestamp=timezone.now(),
+        )
+        self.log_events([event])
+
+    def log_events(self, events):
+        """Поставить в очередь готовые (несохраненные) объекты AuditLog"""
+        if not self.is_async:
+            self._write(list(events), retries=self.shutdown_retries)
+            return
+
+        self._ensure_started()
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                # БД недоступна слишком долго — не блокируем запросы, оставляем след в логе
+                self._dump([event], 'очередь аудита переполнена')
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Процесс-потомок после fork: очередь и поток родителя недоступны
+                self._reset()
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def _drain(self, limit, timeout):
+        """Забрать из очереди до limit событий, ожидая первое не дольше timeout"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        pending = []
+        delay = self.flush_interval
+        while not self._stop.is_set():
+            if not pending:
+                pending = self._drain(self.batch_size, self.flush_interval)
+            if not pending:
+                continue
+            if self._write(pending):
+                pending = []
+                delay = self.flush_interval
+            else:
+                # Пакет остается у потока, новые события копятся в очереди
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+        if pending:
+            self._write(pending, retries=self.shutdown_retries)
+        close_old_connections()
+
+    def _write(self, events, retries=0):
+        """
+        bulk_create пакета. Временные ошибки (БД заблокирована, обрыв соединения)
+        повторяются, после последней попытки пакет сбрасывается в лог
+        """
+        delay = 0.1
+        for attempt in range(retries + 1):
+            try:
+                self._insert(events)
+                return True
+            except OperationalError as e:
+                logger.warning(f"Не удалось записать пакет аудита ({len(events)} событий): {str(e)}")
+                close_old_connections()
+                if attempt < retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+            except DatabaseError as e:
+                # Повтор не поможет (например, нарушение целостности) — ищем виновные события
+                logger.error(f"Ошибка при записи пакета аудита: {str(e)}")
+                self._write_halves(events)
+                return True
+        if retries:
+            self._dump(events, 'БД недоступна')
+        return False
+
+    def _insert(self, events):
+        from .models import AuditLog
+
+        # Точка сохранения: ошибка не ломает внешнюю транзакцию при синхронной записи
+        with self._write_lock, transaction.atomic():
+            AuditLog.objects.bulk_create(events, batch_size=self.batch_size)
+
+    def _write_halves(self, events):
+        """Записать пакет, который целиком не записывается: делением пополам до отдельных событий"""
+        if len(events) == 1:
+            self._dump(events, 'ошибка БД')
+            return
+        middle = len(events) // 2
+        for part in (events[:middle], events[middle:]):
+            try:
+                self._insert(part)
+            except DatabaseError:
+                self._write_halves(part)
+
+    def _dump(self, events, reason):
+        for event in events:
+            logger.error("Событие аудита не записано в БД (%s): %s", reason, json.dumps({
+                'user_id': event.user_id,
+                'action': event.action,
+                'model_name': event.model_name,
+                'object_id': event.object_id,
+                'changes': event.changes,
+                'ip_address': event.ip_address,
+                'timestamp': event.timestamp.isoformat(),
+            }, ensure_ascii=False, default=str))
+
+    def flush(self):
+        """Синхронно записать все события из очереди"""
+        while True:
+            batch = self._drain(self.batch_size, 0)
+            if not batch:
+                return
+            self._write(batch, retries=self.shutdown_retries)
+
+    def stop(self, timeout=10.0):
+        """Остановить фоновый поток и сбросить очередь (вызывается при завершении процесса)"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+audit_writer = AuditLogWriter(
+    batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 200),
+    flush_interval=getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 1.0),
+)
+atexit.register(audit_writer.stop)
+
+
+def log_audit(user, action, model_name, object_id, changes=None, ip_address=None):
+    """
+    Логирование действий в системе для аудита
+    """
+    try:
+        audit_writer.log(user, action, model_name, object_id, changes, ip_address)
+    except Exception as e:
+        logger.error(f"Ошибка при логировании действия: {str(e)}")
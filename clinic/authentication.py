@@ -0,0 +1,87 @@
+"""
+JWT-аутентификация без обращения к БД.
+
+Токен содержит роль пользователя (CustomUser.role), поэтому проверки
+прав в permissions.py не читают ни сессию, ни таблицу custom_users.
+Роль берется из БД при входе и при каждом обновлении токена (refresh):
+отключенный пользователь новый токен не получит, а смена роли вступает
+в силу не позже чем через ACCESS_TOKEN_LIFETIME.
+"""
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+
+def get_user_role(user):
+    """Роль пользователя из CustomUser (None, если профиль не создан)"""
+    customuser = getattr(user, 'customuser', None)
+    return customuser.role if customuser is not None else None
+
+
+class ClinicTokenUser(TokenUser):
+    """Пользователь, восстановленный из claims токена"""
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+    def get_full_name(self):
+        return self.token.get('full_name', '')
+
+
+def set_user_claims(token, user):
+    """Роль и имя пользователя в claims токена"""
+    token['role'] = get_user_role(user)
+    token['username'] = user.get_username()
+    token['full_name'] = user.get_full_name()
+    return token
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача пары токенов с ролью и именем пользователя в claims"""
+
+    @classmethod
+    def get_token(cls, user):
+        return set_user_claims(super().get_token(user), user)
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Обновление токенов с повторной проверкой пользователя: claims refresh-токена
+    (в том числе роль) при ротации копировались бы бессрочно, поэтому роль
+    перечитывается из БД, а отключенный пользователь получает отказ
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = (
+            get_user_model().objects.select_related('customuser')
+            .filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)})
+            .first()
+        )
+        customuser = getattr(user, 'customuser', None) if user is not None else None
+        if (
+            user is None
+            or not api_settings.USER_AUTHENTICATION_RULE(user)
+            or (customuser is not None and not customuser.is_active)
+        ):
+            raise AuthenticationFailed('Пользователь не найден или отключен', code='user_inactive')
+
+        # access_token копирует claims refresh-токена — обновляем их до выпуска
+        set_user_claims(refresh, user)
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Приложение token_blacklist не установлено
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -0,0 +1,222 @@
+"""
+Набор замеров производительности API и админки.
+
+Каждый сценарий — HTTP-запрос через тестовый клиент Django к текущей БД.
+Сценарий выполняется warmup раз без учета, затем repeat раз с замером
+полного времени ответа (включая чтение потоковых ответов) и числа SQL-запросов
+ко всем подключениям (основная БД и реплики). Запросы выполняются от имени
+суперпользователя benchmark_admin; он создается только по явному запросу
+(run_benchmarks --create-user или --populate), а не в любой БД, куда
+направлен замер.
+Результаты сохраняются в JSON, два файла можно сравнить (compare_results).
+"""
+import platform
+import subprocess
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .authentication import RoleTokenObtainPairSerializer
+from .models import Appointment, CustomUser, Patient, Staff
+
+BENCHMARK_USERNAME = 'benchmark_admin'
+RESULTS_VERSION = 1
+
+
+@dataclass
+class Scenario:
+    name: str
+    url: str
+    api: bool = True
+
+
+def percentile(sorted_values, fraction):
+    """Процентиль по ближайшему рангу для отсортированного списка"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def benchmark_user(create=False):
+    """
+    Суперпользователь с ролью admin, от имени которого выполняются запросы.
+    Без create отсутствующий пользователь не создается — None
+    """
+    if not create:
+        return User.objects.filter(username=BENCHMARK_USERNAME, is_superuser=True).first()
+    user, created = User.objects.get_or_create(
+        username=BENCHMARK_USERNAME,
+        defaults={'is_staff': True, 'is_superuser': True, 'email': 'benchmark@clinic.ru'},
+    )
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    CustomUser.objects.get_or_create(user=user, defaults={'role': 'admin'})
+    return user
+
+
+def _next_weekday(day):
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def build_scenarios():
+    """Сценарии на самых «тяжелых» объектах текущего набора данных"""
+    patient = (
+        Patient.objects.annotate(records=Count('medical_records'))
+        .order_by('-records', 'pk').first()
+    )
+    doctor = (
+        Staff.objects.filter(position='doctor').annotate(visits=Count('appointments'))
+        .order_by('-visits', 'pk').first()
+    )
+    if patient is None or doctor is None:
+        return []
+
+    day = _next_weekday(timezone.now().date() + timedelta(days=1))
+    all_doctors = ','.join(str(pk) for pk in Staff.objects.filter(position='doctor')
+                           .order_by('pk').values_list('pk', flat=True)[:20])
+    patient_url = reverse('patient-detail', args=[patient.pk])
+    return [
+        Scenario('patients.list', reverse('patient-list')),
+        Scenario('patients.retrieve', patient_url),
+        Scenario('patients.export_json', reverse('patient-export-json', args=[patient.pk])),
+        Scenario('patients.export_csv', reverse('patient-export-csv', args=[patient.pk])),
+        Scenario('patients.export_pdf', reverse('patient-export-pdf', args=[patient.pk])),
+        Scenario('staff.schedule', reverse('staff-schedule', args=[doctor.pk])),
+        Scenario('staff.patients', reverse('staff-patients', args=[doctor.pk])),
+        Scenario('appointments.available_slots',
+                 f"{reverse('appointment-available-slots')}?doctor_id={doctor.pk}&date={day}"),
+        Scenario('appointments.available_slots_week',
+                 f"{reverse('appointment-available-slots')}?doctor_id={all_doctors}"
+                 f"&date_from={day}&date_to={day + timedelta(days=6)}"),
+        Scenario('admin.patient_changelist', reverse('admin:clinic_patient_changelist'), api=False),
+        Scenario('admin.appointment_changelist', reverse('admin:clinic_appointment_changelist'), api=False),
+        Scenario('admin.medicalrecord_changelist', reverse('admin:clinic_medicalrecord_changelist'), api=False),
+        Scenario('admin.patient_export_txt',
+                 reverse('admin:patient-export-txt', args=[patient.pk]), api=False),
+        Scenario('admin.patient_export_csv',
+                 reverse('admin:patient-export-csv', args=[patient.pk]), api=False),
+        Scenario('admin.patient_export_json',
+                 reverse('admin:patient-export-json', args=[patient.pk]), api=False),
+    ]
+
+
+def _clients(user):
+    api = Client()
+    token = RoleTokenObtainPairSerializer.get_token(user).access_token
+    api.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    admin = Client()
+    admin.force_login(user)
+    return api, admin
+
+
+def _request(client, url):
+    response = client.get(url)
+    # Потоковые ответы замеряются до последнего байта
+    size = sum(len(chunk) for chunk in response) if response.streaming else len(response.content)
+    return response.status_code, size
+
+
+def run_scenario(scenario, client, warmup=2, repeat=10):
+    for _ in range(warmup):
+        _request(client, scenario.url)
+
+    timings, queries = [], []
+    status_code = size = None
+    for _ in range(repeat):
+        with ExitStack() as stack:
+            # Чтения могут уйти на реплики: запросы считаются по всем подключениям
+            captured = [stack.enter_context(CaptureQueriesContext(conn)) for conn in connections.all()]
+            started = time.perf_counter()
+            status_code, size = _request(client, scenario.url)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(sum(len(context.captured_queries) for context in captured))
+
+    timings.sort()
+    return {
+        'url': scenario.url,
+        'status': status_code,
+        'bytes': size,
+        'runs': repeat,
+        'min_ms': round(timings[0], 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': max(queries),
+        'queries_min': min(queries),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(user, warmup=2, repeat=10, only=None, progress=None):
+    """Замеры всех сценариев (или с префиксами only) от имени user (см. benchmark_user)"""
+    api_client, admin_client = _clients(user)
+    scenarios = [s for s in build_scenarios() if not only or any(s.name.startswith(o) for o in only)]
+
+    results = {}
+    for scenario in scenarios:
+        result = run_scenario(scenario, api_client if scenario.api else admin_client, warmup, repeat)
+        results[scenario.name] = result
+        if progress is not None:
+            progress(scenario.name, result)
+
+    return {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'started_at': timezone.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'warmup': warmup,
+            'repeat': repeat,
+            'rows': {
+                'patients': Patient.objects.count(),
+                'staff': Staff.objects.count(),
+                'appointments': Appointment.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2, metric='p95_ms'):
+    """
+    Сравнение двух прогонов. Регрессия — рост metric больше чем на threshold
+    или увеличение числа запросов. Возвращает [(имя, было, стало, изменение, регрессия)].
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            rows.append((name, None, result, None, False))
+            continue
+        change = (result[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+        regression = change > threshold or result['queries'] > before['queries']
+        rows.append((name, before, result, change, regression))
+    return rows
@@ -0,0 +1,94 @@
+"""
+Условные GET-запросы (ETag, Last-Modified) для расписаний и документов пациента.
+
+Валидаторы ответа строятся без сериализации: по MAX(updated_at) и числу
+строк каждого источника данных. Изменение строки сдвигает MAX(updated_at),
+удаление уменьшает COUNT, поэтому ETag меняется при любом изменении
+содержимого. Если клиент прислал совпадающий If-None-Match, возвращается
+304 без чтения самих строк.
+
+Last-Modified отдаётся только для ответов из отдельных объектов. Для
+списков MAX(updated_at) не сдвигается при удалении строки или её выходе
+из окна выборки, и клиент с If-Modified-Since получил бы 304 на
+устаревший список — такие ответы проверяются только по ETag.
+
+ETag слабый (W/): тело ответа может отличаться несущественно
+(например, exported_at в экспорте JSON), смысл — нет.
+"""
+import hashlib
+from calendar import timegm
+
+from django.db import models
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def source_state(source, field='updated_at'):
+    """(последнее изменение, число строк) для queryset или объекта модели"""
+    if isinstance(source, models.Model):
+        return getattr(source, field), 1
+    state = source.order_by().aggregate(last_modified=Max(field), total=Count('pk'))
+    return state['last_modified'], state['total']
+
+
+async def asource_state(source, field='updated_at'):
+    if isinstance(source, models.Model):
+        return getattr(source, field), 1
+    state = await source.order_by().aaggregate(last_modified=Max(field), total=Count('pk'))
+    return state['last_modified'], state['total']
+
+
+class Validators:
+    def __init__(self, etag, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def for_sources(cls, *sources, key=()):
+        """
+        Валидаторы по источникам (queryset или объект с updated_at).
+        key — параметры, от которых зависит ответ помимо данных (действие, период).
+        """
+        return cls.from_states([source_state(source) for source in sources], key, cls._dated(sources))
+
+    @classmethod
+    async def afor_sources(cls, *sources, key=()):
+        """Асинхронный вариант for_sources (асинхронный ORM)"""
+        states = [await asource_state(source) for source in sources]
+        return cls.from_states(states, key, cls._dated(sources))
+
+    @staticmethod
+    def _dated(sources):
+        # Last-Modified надёжен, только если все источники — отдельные объекты
+        return all(isinstance(source, models.Model) for source in sources)
+
+    @classmethod
+    def from_states(cls, states, key=(), dated=True):
+        parts = [str(part) for part in key]
+        last_modified = None
+        for modified, total in states:
+            parts.append(f'{modified.isoformat() if modified else ""}:{total}')
+            if modified is not None and (last_modified is None or modified > last_modified):
+                last_modified = modified
+        etag = 'W/"%s"' % hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+        return cls(etag, last_modified if dated else None)
+
+    @property
+    def timestamp(self):
+        if self.last_modified is None:
+            return None
+        return timegm(self.last_modified.utctimetuple())
+
+    def not_modified(self, request):
+        """Ответ 304 (или 412), если у клиента актуальная версия; иначе None"""
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.timestamp)
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.timestamp)
+        # Данные пациента не должны попадать в общие кеши; браузер обязан перепроверять
+        response['Cache-Control'] = 'private, no-cache'
+        return response
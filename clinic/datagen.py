@@ -0,0 +1,345 @@
+"""
+Детерминированный генератор синтетических данных.
+
+Строит согласованный набор данных произвольного размера: страховые
+компании, отделения, диагнозы, процедуры, персонал, пациентов, приемы,
+медицинские записи, рецепты, выполненные процедуры и журнал аудита.
+Все вставки выполняются порциями через bulk_create, пароли хешируются
+один раз, а идентификаторы вычисляются из seed, поэтому одинаковые
+параметры дают одинаковый набор данных.
+"""
+import random
+import uuid
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    AppointmentStatus, AuditLog, Appointment, CustomUser, Department, Diagnosis,
+    InsuranceCompany, MedicalRecord, Patient, Prescription, Procedure,
+    ProcedureRecord, Staff,
+)
+from .slots import DEFAULT_DAY_END, DEFAULT_DAY_START, DEFAULT_SLOT_MINUTES, minute_to_time
+
+DEFAULT_PASSWORD = 'password123'
+
+MALE_SURNAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов',
+                 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев',
+                 'Семенов', 'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев']
+MALE_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Иван',
+              'Михаил', 'Николай', 'Петр', 'Владимир', 'Евгений']
+FEMALE_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Екатерина', 'Татьяна',
+                'Ирина', 'Светлана', 'Юлия', 'Дарья', 'Полина']
+PATRONYMICS = ['Александров', 'Сергеев', 'Дмитриев', 'Андреев', 'Алексеев', 'Иванов',
+               'Михайлов', 'Николаев', 'Петров', 'Владимиров']
+
+DEPARTMENTS = ['Терапия', 'Кардиология', 'Хирургия', 'Неврология', 'Педиатрия',
+               'Офтальмология', 'Эндокринология', 'Гастроэнтерология']
+
+DIAGNOSES = [
+    ('J06.9', 'ОРВИ'), ('I10', 'Гипертония'), ('E11', 'Сахарный диабет 2 типа'),
+    ('M54.5', 'Боль в пояснице'), ('K29.7', 'Гастрит'), ('J20.9', 'Острый бронхит'),
+    ('I25.1', 'Атеросклеротическая болезнь сердца'), ('G43.9', 'Мигрень'),
+    ('H52.1', 'Миопия'), ('E03.9', 'Гипотиреоз'), ('K21.9', 'Гастроэзофагеальный рефлюкс'),
+    ('M17.9', 'Гонартроз'), ('J45.9', 'Астма'), ('N39.0', 'Инфекция мочевых путей'),
+]
+
+MEDICATIONS = [('Парацетамол', '500мг'), ('Ибупрофен', '200мг'), ('Амоксициллин', '500мг'),
+               ('Лизиноприл', '10мг'), ('Метформин', '850мг'), ('Омепразол', '20мг')]
+
+WORK_SCHEDULE = {day: '09:00-17:00' for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday')}
+
+
+class SyntheticDataGenerator:
+    """
+    Генератор набора данных заданного масштаба.
+
+    patients, doctors, nurses — количество записей; years — глубина истории
+    приемов; visits_per_day — средняя загрузка врача (слотов в день из 16).
+    prefix добавляется к логинам, чтобы несколько наборов могли жить в одной БД.
+    """
+
+    def __init__(self, patients=10, doctors=5, nurses=1, years=1, visits_per_day=6, seed=42,
+                 chunk_size=5000, prefix='', anchor_date=None, stdout=None):
+        self.patients = patients
+        self.doctors = doctors
+        self.nurses = nurses
+        self.years = years
+        self.visits_per_day = max(0, min(visits_per_day, self._slots_per_day()))
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.prefix = prefix
+        self.anchor_date = anchor_date or date.today()
+        self.stdout = stdout
+        # Префикс входит в seed: наборы с разными префиксами не пересекаются по id
+        self.rng = random.Random(f'{seed}:{prefix}')
+        self.password_hash = make_password(DEFAULT_PASSWORD)
+        self.stats = {}
+
+    # ---------- общие помощники ----------
+
+    @staticmethod
+    def _slots_per_day():
+        return (DEFAULT_DAY_END - DEFAULT_DAY_START) // DEFAULT_SLOT_MINUTES
+
+    def _uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def _insert(self, model, objects):
+        if objects:
+            with transaction.atomic():
+                model.objects.bulk_create(objects, batch_size=self.chunk_size)
+            self.stats[model.__name__] = self.stats.get(model.__name__, 0) + len(objects)
+
+    def _person(self, gender):
+        surname = self.rng.choice(MALE_SURNAMES)
+        patronymic = self.rng.choice(PATRONYMICS)
+        if gender == 'F':
+            return surname + 'а', self.rng.choice(FEMALE_NAMES), patronymic + 'на'
+        return surname, self.rng.choice(MALE_NAMES), patronymic + 'ич'
+
+    def _aware(self, day, moment):
+        return timezone.make_aware(datetime.combine(day, moment))
+
+    # ---------- справочники ----------
+
+    def _reference_data(self):
+        companies = [
+            InsuranceCompany(
+                id=self._uuid(), name=f'Страховая компания {i + 1}',
+                license_number=f'{self.prefix}ЛИЦ-СК-{self.seed}-{i + 1:03d}',
+                phone=f'+7-495-{100 + i:03d}-00-00', email=f'info{i + 1}@insurance.ru',
+                address=f'г. Москва, ул. Страховая, {i + 1}',
+            )
+            for i in range(5)
+        ]
+        self._insert(InsuranceCompany, companies)
+        self.company_ids = [c.id for c in companies]
+
+        Department.objects.bulk_create([
+            Department(id=self._uuid(), name=name, description=f'Отделение: {name}',
+                       phone=f'+7-495-{200 + i:03d}-00-00', cabinet_number=str(100 * (i + 1) + 1))
+            for i, name in enumerate(DEPARTMENTS)
+        ], ignore_conflicts=True)
+        self.department_ids = list(
+            Department.objects.filter(name__in=DEPARTMENTS).order_by('name').values_list('id', flat=True)
+        )
+
+        Diagnosis.objects.bulk_create([
+            Diagnosis(id=self._uuid(), code=code, name=name) for code, name in DIAGNOSES
+        ], ignore_conflicts=True)
+        self.diagnosis_ids = list(
+            Diagnosis.objects.filter(code__in=[code for code, _ in DIAGNOSES])
+            .order_by('code').values_list('id', flat=True)
+        )
+
+        procedures = []
+        for department_id in self.department_ids:
+            for name, cost, minutes in (('Осмотр', 1500, 20), ('Анализ крови', 800, 10), ('УЗИ', 2500, 30)):
+                procedures.append(Procedure(
+                    id=self._uuid(), name=name, description=name, cost=cost,
+                    duration_minutes=minutes, department_id=department_id,
+                ))
+        self._insert(Procedure, procedures)
+        self.procedure_ids = [p.id for p in procedures]
+
+    # ---------- пользователи, персонал, пациенты ----------
+
+    def _user_id_base(self):
+        return (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def _reset_user_sequence(self):
+        """После вставки с явными id последовательности (PostgreSQL) нужно сдвинуть"""
+        sql = connection.ops.sequence_reset_sql(no_style(), [User, CustomUser])
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+
+    def _users(self, start_id, count, kind, role):
+        """Пользователи и профили CustomUser с id start_id..start_id+count-1, порциями"""
+        for offset in range(0, count, self.chunk_size):
+            users, profiles = [], []
+            for i in range(offset, min(offset + self.chunk_size, count)):
+                user_id = start_id + i
+                users.append(User(
+                    id=user_id, username=f'{self.prefix}{kind}{i + 1}', password=self.password_hash,
+                    email=f'{self.prefix}{kind}{i + 1}@clinic.ru', date_joined=timezone.now(),
+                ))
+                profiles.append(CustomUser(user_id=user_id, role=role))
+            self._insert(User, users)
+            self._insert(CustomUser, profiles)
+
+    def _staff(self, user_base):
+        self.doctor_ids = []
+        total = self.doctors + self.nurses
+        self._users(user_base, self.doctors, 'doctor', 'doctor')
+        self._users(user_base + self.doctors, self.nurses, 'nurse', 'nurse')
+        for offset in range(0, total, self.chunk_size):
+            staff = []
+            for i in range(offset, min(offset + self.chunk_size, total)):
+                is_doctor = i < self.doctors
+                gender = self.rng.choice('MF')
+                surname, name, patronymic = self._person(gender)
+                department_id = self.department_ids[i % len(self.department_ids)]
+                member = Staff(
+                    id=self._uuid(), user_id=user_base + i, full_name=f'{surname} {name} {patronymic}',
+                    date_of_birth=date(1960 + self.rng.randrange(35), self.rng.randint(1, 12), self.rng.randint(1, 28)),
+                    gender=gender, position='doctor' if is_doctor else 'nurse',
+                    specialty=DEPARTMENTS[i % len(DEPARTMENTS)] if is_doctor else 'Медсестра',
+                    license_number=f'{self.prefix}ЛИЦ-{user_base + i}',
+                    experience_years=self.rng.randint(1, 35), department_id=department_id,
+                    phone=f'+7-926-{user_base + i:07d}', email=f'staff{user_base + i}@clinic.ru',
+                    work_schedule=WORK_SCHEDULE,
+                )
+                if is_doctor:
+                    self.doctor_ids.append(member.id)
+                staff.append(member)
+            self._insert(Staff, staff)
+
+    def _patients(self, user_base):
+        self.patient_ids = []
+        self._users(user_base, self.patients, 'patient', 'patient')
+        for offset in range(0, self.patients, self.chunk_size):
+            patients = []
+            for i in range(offset, min(offset + self.chunk_size, self.patients)):
+                user_id = user_base + i
+                gender = self.rng.choice('MF')
+                surname, name, patronymic = self._person(gender)
+                born = self.anchor_date - timedelta(days=self.rng.randint(365, 90 * 365))
+                patient = Patient(
+                    id=self._uuid(), user_id=user_id, full_name=f'{surname} {name} {patronymic}',
+                    date_of_birth=born, gender=gender,
+                    passport_number=f'{user_id // 1000000 % 10000:04d} {user_id % 1000000:06d}',
+                    address=f'г. Москва, ул. Ленина, д. {self.rng.randint(1, 200)}, кв. {self.rng.randint(1, 300)}',
+                    phone=f'+7-916-{user_id:07d}', email=f'patient{user_id}@mail.ru',
+                    insurance_company_id=self.rng.choice(self.company_ids),
+                    insurance_number=f'{user_id:016d}',
+                    emergency_contact=f'{self.rng.choice(MALE_SURNAMES)} {self.rng.choice(FEMALE_NAMES)}',
+                    emergency_phone=f'+7-915-{user_id:07d}',
+                    allergies=self.rng.choice(['Нет', 'Нет', 'Пенициллин', 'Пыльца']),
+                    chronic_diseases=self.rng.choice(['Нет', 'Нет', 'Гипертония', 'Астма']),
+                )
+                self.patient_ids.append(patient.id)
+                patients.append(patient)
+            self._insert(Patient, patients)
+
+    # ---------- приемы и медицинская история ----------
+
+    def _history(self):
+        start = self.anchor_date - timedelta(days=365 * self.years)
+        end = self.anchor_date + timedelta(days=30)
+        slots = [minute_to_time(m) for m in range(DEFAULT_DAY_START, DEFAULT_DAY_END, DEFAULT_SLOT_MINUTES)]
+        buffers = {model: [] for model in (Appointment, MedicalRecord, Prescription, ProcedureRecord, AuditLog)}
+
+        def flush(force=False):
+            if force or len(buffers[Appointment]) >= self.chunk_size:
+                # Порядок важен: записи ссылаются на приемы
+                for model in (Appointment, MedicalRecord, Prescription, ProcedureRecord, AuditLog):
+                    self._insert(model, buffers[model])
+                    buffers[model] = []
+
+        if not self.patient_ids or not self.doctor_ids:
+            return
+
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                for doctor_id in self.doctor_ids:
+                    load = min(len(slots), max(0, int(self.rng.gauss(self.visits_per_day, 2))))
+                    for moment in self.rng.sample(slots, load):
+                        self._appointment(buffers, doctor_id, day, moment)
+                    flush()
+            day += timedelta(days=1)
+        flush(force=True)
+
+    def _appointment(self, buffers, doctor_id, day, moment):
+        patient_id = self.rng.choice(self.patient_ids)
+        past = day < self.anchor_date
+        if past:
+            status = self.rng.choices(
+                [AppointmentStatus.COMPLETED, AppointmentStatus.NO_SHOW, AppointmentStatus.CANCELLED],
+                weights=[85, 7, 8],
+            )[0]
+        else:
+            status = self.rng.choice([AppointmentStatus.SCHEDULED, AppointmentStatus.CONFIRMED])
+
+        appointment_id = self._uuid()
+        moment_at = self._aware(day, moment)
+        buffers[Appointment].append(Appointment(
+            id=appointment_id, patient_id=patient_id, doctor_id=doctor_id,
+            appointment_date=day, appointment_time=moment, status=status,
+            reason=self.rng.choice(['Консультация', 'Повторный прием', 'Профосмотр', 'Жалобы']),
+            duration_minutes=DEFAULT_SLOT_MINUTES,
+        ))
+        buffers[AuditLog].append(AuditLog(
+            id=self._uuid(), action='create', model_name='Appointment',
+            object_id=str(appointment_id), timestamp=moment_at - timedelta(days=self.rng.randint(1, 30)),
+        ))
+
+        if status != AppointmentStatus.COMPLETED or self.rng.random() > 0.8:
+            return
+
+        record_id = self._uuid()
+        buffers[MedicalRecord].append(MedicalRecord(
+            id=record_id, patient_id=patient_id, appointment_id=appointment_id, doctor_id=doctor_id,
+            record_date=moment_at, symptoms=self.rng.choice(['Температура, слабость', 'Боль в горле', 'Головная боль', 'Кашель']),
+            diagnosis_id=self.rng.choice(self.diagnosis_ids), treatment_plan='Лечение по протоколу',
+            is_signed=True, digital_signature='Подписано врачом',
+        ))
+        if self.rng.random() < 0.4:
+            medication, dosage = self.rng.choice(MEDICATIONS)
+            buffers[Prescription].append(Prescription(
+                id=self._uuid(), medical_record_id=record_id, patient_id=patient_id, doctor_id=doctor_id,
+                medication_name=medication, dosage=dosage, frequency='2 раза в день',
+                duration_days=self.rng.randint(3, 14), instructions='Принимать после еды',
+                valid_until=day + timedelta(days=30),
+            ))
+        if self.rng.random() < 0.2:
+            buffers[ProcedureRecord].append(ProcedureRecord(
+                id=self._uuid(), patient_id=patient_id, procedure_id=self.rng.choice(self.procedure_ids),
+                performed_by_id=doctor_id, performed_date=moment_at + timedelta(minutes=DEFAULT_SLOT_MINUTES),
+                result='В пределах нормы',
+            ))
+
+    # ---------- запуск ----------
+
+    def _rebuild_derived(self):
+        """Производные структуры, которые bulk_create обходит (сигналы не вызываются)"""
+        from .icd10 import bump_version
+        from .rollups import rebuild_stats
+        from .search import fts_enabled, rebuild_patient_index
+        from .slots import slot_index
+
+        slot_index.invalidate()
+        bump_version()
+        if fts_enabled():
+            self._log('Полнотекстовый индекс пациентов...')
+            rebuild_patient_index(Patient.objects.all(), chunk_size=self.chunk_size)
+        self._log('Сводка приемов по дням...')
+        rebuild_stats(chunk_size=self.chunk_size)
+
+    def generate(self):
+        self._log('Справочники...')
+        self._reference_data()
+
+        user_base = self._user_id_base()
+        self._log(f'Персонал: {self.doctors + self.nurses}...')
+        self._staff(user_base)
+        self._log(f'Пациенты: {self.patients}...')
+        self._patients(user_base + self.doctors + self.nurses)
+        self._reset_user_sequence()
+
+        self._log(f'Приемы и медицинская история за {self.years} г. ...')
+        self._history()
+        self._rebuild_derived()
+        return self.stats
@@ -0,0 +1,127 @@
+"""
+Потоковая выгрузка целых таблиц в CSV и JSON Lines.
+
+Строки читаются порциями по первичному ключу (keyset), связанные имена
+подтягиваются в том же запросе через values(), а ответ отдается клиенту
+по мере формирования, поэтому потребление памяти не зависит от размера таблицы.
+"""
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .fields import decrypt_rows, is_encrypted_field
+from .models import Patient, Appointment, MedicalRecord
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ExportSpec:
+    """Описание выгрузки: queryset и колонки (ключ JSON, заголовок CSV, поле)"""
+
+    def __init__(self, name, model, columns):
+        self.name = name
+        self.model = model
+        self.columns = columns
+
+    @property
+    def lookups(self):
+        return [lookup for _, _, lookup in self.columns]
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+
+EXPORT_SPECS = {
+    'patients': ExportSpec('patients', Patient, [
+        ('id', 'ID', 'id'),
+        ('full_name', 'ФИО', 'full_name'),
+        ('date_of_birth', 'Дата рождения', 'date_of_birth'),
+        ('gender', 'Пол', 'gender'),
+        ('phone', 'Телефон', 'phone'),
+        ('email', 'Email', 'email'),
+        ('address', 'Адрес', 'address'),
+        ('insurance_company', 'Страховая компания', 'insurance_company__name'),
+        ('insurance_number', 'Номер полиса', 'insurance_number'),
+        ('created_at', 'Создан', 'created_at'),
+    ]),
+    'appointments': ExportSpec('appointments', Appointment, [
+        ('id', 'ID', 'id'),
+        ('appointment_date', 'Дата', 'appointment_date'),
+        ('appointment_time', 'Время', 'appointment_time'),
+        ('duration_minutes', 'Длительность', 'duration_minutes'),
+        ('status', 'Статус', 'status'),
+        ('patient', 'Пациент', 'patient__full_name'),
+        ('doctor', 'Врач', 'doctor__full_name'),
+        ('department', 'Отделение', 'doctor__department__name'),
+        ('reason', 'Причина', 'reason'),
+        ('created_at', 'Создан', 'created_at'),
+    ]),
+    'medical_records': ExportSpec('medical_records', MedicalRecord, [
+        ('id', 'ID', 'id'),
+        ('record_date', 'Дата', 'record_date'),
+        ('patient', 'Пациент', 'patient__full_name'),
+        ('doctor', 'Врач', 'doctor__full_name'),
+        ('diagnosis_code', 'Код МКБ-10', 'diagnosis__code'),
+        ('diagnosis', 'Диагноз', 'diagnosis__name'),
+        ('symptoms', 'Симптомы', 'symptoms'),
+        ('treatment_plan', 'Лечение', 'treatment_plan'),
+        ('is_signed', 'Подписано', 'is_signed'),
+    ]),
+}
+
+
+def iter_export_chunks(spec, chunk_size=EXPORT_CHUNK_SIZE):
+    """Списки кортежей значений колонок, порциями по первичному ключу"""
+    lookups = spec.lookups
+    pk_index = lookups.index('id')
+    encrypted = [i for i, lookup in enumerate(lookups) if is_encrypted_field(spec.model, lookup)]
+    queryset = spec.get_queryset().order_by('pk').values_list(*lookups)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][pk_index]
+        yield decrypt_rows(rows, encrypted)
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(spec):
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow([header for _, header, _ in spec.columns])
+    for rows in iter_export_chunks(spec):
+        yield ''.join(writer.writerow(row) for row in rows)
+
+
+def stream_jsonl(spec):
+    keys = [key for key, _, _ in spec.columns]
+    for rows in iter_export_chunks(spec):
+        yield ''.join(
+            json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=str) + '\n'
+            for row in rows
+        )
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (stream_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def streaming_export_response(name, export_format):
+    """StreamingHttpResponse с выгрузкой всей таблицы name в формате export_format"""
+    spec = EXPORT_SPECS[name]
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(spec), content_type=content_type)
+    stamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{name}_{stamp}.{export_format}"'
+    return response
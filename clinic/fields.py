@@ -0,0 +1,126 @@
+"""
+Поля моделей с прозрачным шифрованием.
+
+Значение хранится в БД в виде токена Fernet. При чтении из БД токен
+не расшифровывается: атрибут модели содержит Ciphertext, который
+расшифровывается при первом обращении к атрибуту и кешируется в
+экземпляре. Колонки, которые не отображаются, не тратят время на Fernet.
+"""
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from .utils import blind_index, get_encryptor
+
+
+class Ciphertext(str):
+    """
+    Значение, которое уже находится в форме для хранения в БД.
+
+    Возвращается из from_db_value и пропускается get_prep_value без
+    повторного шифрования, если атрибут не изменяли.
+    """
+
+
+class EncryptedFieldDescriptor(DeferredAttribute):
+    """Расшифровывает значение при первом чтении атрибута"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, Ciphertext):
+            value = get_encryptor().decrypt(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Дескриптор данных: иначе значение из __dict__ экземпляра перекрыло бы __get__
+        instance.__dict__[self.field.attname] = value
+
+
+class EncryptedTextField(models.TextField):
+    """
+    Текстовое поле, шифруемое общим для процесса DataEncryption.
+
+    max_length ограничивает длину открытого значения (валидация форм и
+    сериализаторов), в БД хранится текст произвольной длины.
+    Пустые значения не шифруются.
+    """
+
+    descriptor_class = EncryptedFieldDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        if not value:
+            return value
+        return Ciphertext(value)
+
+    def pre_save(self, model_instance, add):
+        # Неизмененное значение сохраняется как есть, без расшифровки и повторного шифрования
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, Ciphertext):
+            return value
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if not value or isinstance(value, Ciphertext):
+            return value
+        return get_encryptor().encrypt(value)
+
+
+class BlindIndexField(models.CharField):
+    """
+    HMAC исходного зашифрованного поля source для точного поиска и уникальности.
+    Пересчитывается при save() и bulk_create(), если исходное значение изменилось.
+    """
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs.setdefault('max_length', 64)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('null', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        for option, default in (('max_length', 64), ('editable', False), ('null', True)):
+            if kwargs.get(option, default) == default:
+                kwargs.pop(option, None)
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        source_value = model_instance.__dict__.get(self.source)
+        current = getattr(model_instance, self.attname)
+        if isinstance(source_value, Ciphertext) and current:
+            # Исходное поле не менялось с момента чтения из БД
+            return current
+        value = blind_index(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def is_encrypted_field(model, lookup):
+    """Указывает ли lookup (в т.ч. через связи, 'a__b') на EncryptedTextField"""
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return isinstance(model._meta.get_field(name), EncryptedTextField)
+
+
+def decrypt_rows(rows, positions):
+    """
+    Пакетная расшифровка колонок positions в строках values_list().
+    Возвращает новый список кортежей.
+    """
+    if not positions:
+        return rows
+    encryptor = get_encryptor()
+    result = []
+    for row in rows:
+        row = list(row)
+        for position in positions:
+            if row[position]:
+                row[position] = encryptor.decrypt(row[position])
+        result.append(tuple(row))
+    return result
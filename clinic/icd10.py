@@ -0,0 +1,142 @@
+"""
+Префиксный индекс справочника МКБ-10 в памяти процесса.
+
+Ключи — код без точки и каждое нормализованное слово названия
+диагноза — хранятся отсортированным массивом; поиск по префиксу — это
+bisect и чтение подряд идущих ключей, то есть обход поддерева сжатого
+префиксного дерева без хранения узлов. Индекс строится одним запросом при
+первом обращении и перестраивается, когда меняется версия справочника в
+shared-кеше, общем для всех процессов (ее меняют сигналы Diagnosis и
+команда import_icd10, в том числе запущенная отдельным процессом). Версия
+перечитывается не чаще раза в ICD10_VERSION_CHECK_INTERVAL секунд, поэтому
+поиск обычно не обращается ни к БД, ни к кешу; процесс, изменивший
+справочник, видит изменение сразу.
+"""
+import bisect
+import re
+import threading
+import uuid
+from time import monotonic
+
+from django.conf import settings
+
+from .search import normalize_search_text
+from .utils import shared_cache
+
+VERSION_CACHE_KEY = 'icd10:version'
+INITIAL_VERSION = 'initial'
+MAX_SCAN = 5000
+CODE_QUERY = re.compile(r'^[A-Za-z]\d[\d.]*$')
+
+# Тип ключа: совпадение по коду выше совпадения по слову названия
+KIND_CODE = 0
+KIND_WORD = 1
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def current_version():
+    """
+    Версия справочника из shared-кеша, общего для всех процессов. Пока
+    справочник не меняли, версии в кеше нет — INITIAL_VERSION, без записи
+    """
+    return shared_cache().get(VERSION_CACHE_KEY, INITIAL_VERSION)
+
+
+def bump_version():
+    """Отметить справочник измененным: индексы всех процессов перестроятся при следующем поиске"""
+    shared_cache().set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    diagnosis_index.invalidate()
+
+
+class DiagnosisPrefixIndex:
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+        # (ключи, ссылки, записи) заменяются одним присваиванием: поиск без блокировки
+        self._data = ([], [], [])
+
+    def _build(self, rows):
+        """rows — [(id, code, name)] активных диагнозов"""
+        entries = []
+        pairs = []
+        for id_, code, name in rows:
+            index = len(entries)
+            code = normalize_code(code)
+            words = normalize_search_text(name).split()
+            entries.append({'id': str(id_), 'code': code, 'name': name, 'words': words})
+            # Код хранится без точки: "J06.9" и "J069" дают один префикс
+            pairs.append((code.replace('.', '').casefold(), KIND_CODE, index))
+            for word in set(words):
+                pairs.append((word, KIND_WORD, index))
+        pairs.sort()
+        return [p[0] for p in pairs], [(p[1], p[2]) for p in pairs], entries
+
+    def _ensure_loaded(self):
+        now = monotonic()
+        checked_at = self._checked_at
+        if self._version is not None and checked_at is not None and now - checked_at < self.check_interval:
+            return
+        version = current_version()
+        self._checked_at = now
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            from .models import Diagnosis
+            rows = Diagnosis.objects.filter(is_active=True).order_by('code').values_list('id', 'code', 'name')
+            self._data = self._build(rows)
+            self._version = version
+
+    def invalidate(self):
+        self._version = None
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._data[2])
+
+    def lookup(self, query, limit=10):
+        """
+        Диагнозы, у которых код или слова названия начинаются со слов запроса
+        ("j06", "сахар диаб"). Совпадения по коду идут первыми.
+        """
+        query = (query or '').strip()
+        if CODE_QUERY.match(query):
+            # Код с точкой (J06.9) нормализация текста разбила бы на два слова
+            terms = [query.replace('.', '').casefold()]
+        else:
+            terms = normalize_search_text(query).split()
+        if not terms:
+            return []
+        self._ensure_loaded()
+        keys, refs, entries = self._data
+        first, rest = terms[0], terms[1:]
+
+        by_code, by_word, seen = [], [], set()
+        start = bisect.bisect_left(keys, first)
+        for position in range(start, min(start + MAX_SCAN, len(keys))):
+            if not keys[position].startswith(first):
+                break
+            kind, index = refs[position]
+            if index in seen:
+                continue
+            entry = entries[index]
+            if rest and not all(any(w.startswith(t) for w in entry['words']) for t in rest):
+                continue
+            seen.add(index)
+            (by_code if kind == KIND_CODE else by_word).append(entry)
+            if len(by_code) + len(by_word) >= limit:
+                break
+
+        return [
+            {'id': entry['id'], 'code': entry['code'], 'name': entry['name']}
+            for entry in (by_code + by_word)[:limit]
+        ]
+
+
+diagnosis_index = DiagnosisPrefixIndex(check_interval=getattr(settings, 'ICD10_VERSION_CHECK_INTERVAL', 5))
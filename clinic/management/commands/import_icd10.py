@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from pathlib import Path
+import csv
+import xml.etree.ElementTree as ET
+
+from clinic.icd10 import bump_version, normalize_code
+from clinic.models import Diagnosis
+
+CODE_KEYS = ('code', 'mkb_code', 'код')
+NAME_KEYS = ('name', 'mkb_name', 'title', 'наименование', 'название')
+DESCRIPTION_KEYS = ('description', 'описание')
+
+
+def _pick(mapping, keys):
+    for key in keys:
+        value = mapping.get(key)
+        if value:
+            return value.strip()
+    return ''
+
+
+def read_csv(path, delimiter, encoding):
+    """Строки (code, name, description). Заголовок необязателен: иначе колонки код;название;описание"""
+    with open(path, encoding=encoding, newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = [column.strip().lstrip('﻿').casefold() for column in header]
+        if any(column in CODE_KEYS for column in columns):
+            for row in reader:
+                mapping = dict(zip(columns, row))
+                yield _pick(mapping, CODE_KEYS), _pick(mapping, NAME_KEYS), _pick(mapping, DESCRIPTION_KEYS)
+        else:
+            for row in [header, *reader]:
+                if len(row) >= 2:
+                    yield row[0].strip().lstrip('﻿'), row[1].strip(), (row[2].strip() if len(row) > 2 else '')
+
+
+def read_xml(path):
+    """Элементы с кодом и названием в атрибутах или дочерних элементах (регистр не важен)"""
+    for _, element in ET.iterparse(path, events=('end',)):
+        mapping = {key.casefold(): value for key, value in element.attrib.items()}
+        for child in element:
+            if child.text and not len(child):
+                mapping.setdefault(child.tag.casefold(), child.text)
+        code, name = _pick(mapping, CODE_KEYS), _pick(mapping, NAME_KEYS)
+        if code and name:
+            yield code, name, _pick(mapping, DESCRIPTION_KEYS)
+            element.clear()
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочник МКБ-10 из CSV или XML: новые коды добавляются, '
+        'существующие обновляются (upsert пакетами).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл справочника (.csv или .xml)')
+        parser.add_argument('--format', choices=['csv', 'xml'], help='Формат (по умолчанию по расширению)')
+        parser.add_argument('--delimiter', default=';', help='Разделитель CSV')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Кодировка CSV')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Строк в одном INSERT')
+        parser.add_argument('--deactivate-missing', action='store_true',
+                            help='Отключить (is_active=False) коды, отсутствующие в файле')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format == 'csv':
+            rows = read_csv(path, options['delimiter'], options['encoding'])
+        elif file_format == 'xml':
+            rows = read_xml(path)
+        else:
+            raise CommandError('Неизвестный формат: укажите --format csv или xml')
+
+        code_length = Diagnosis._meta.get_field('code').max_length
+        name_length = Diagnosis._meta.get_field('name').max_length
+        batch, codes, skipped, total = [], set(), 0, 0
+        with transaction.atomic():
+            if options['deactivate_missing']:
+                # Коды из файла снова станут активными при upsert, остальные останутся отключенными
+                Diagnosis.objects.filter(is_active=True).update(is_active=False)
+
+            for code, name, description in rows:
+                code = normalize_code(code)
+                if not code or not name or len(code) > code_length or code in codes:
+                    skipped += 1
+                    continue
+                codes.add(code)
+                batch.append(Diagnosis(code=code, name=name[:name_length], description=description, is_active=True))
+                if len(batch) >= options['batch_size']:
+                    total += self._upsert(batch)
+                    batch = []
+            total += self._upsert(batch)
+
+            if options['deactivate_missing'] and not codes:
+                raise CommandError('Файл не содержит кодов: отключение всего справочника отменено')
+
+            # bulk_create и update() не вызывают сигналы — версию справочника меняем явно
+            transaction.on_commit(bump_version)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено кодов: {total}, пропущено строк: {skipped}, '
+            f'неактивных в справочнике: {Diagnosis.objects.filter(is_active=False).count()}'
+        ))
+
+    def _upsert(self, batch):
+        if batch:
+            Diagnosis.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=['code'],
+                update_fields=['name', 'description', 'is_active'],
+            )
+        return len(batch)
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.rollups import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводку приемов по дням (AppointmentDailyStat) по таблице приемов. '
+        'Нужна после массовой загрузки или изменения приемов в обход сигналов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help='Начало периода (YYYY-MM-DD), по умолчанию — вся история')
+        parser.add_argument('--date-to', help='Конец периода (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в одной порции')
+
+    def _date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Неверный формат даты: {value} (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        total = rebuild_stats(
+            date_from=self._date(options['date_from']),
+            date_to=self._date(options['date_to']),
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Строк сводки: {total}'))
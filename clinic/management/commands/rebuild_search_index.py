@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.models import Patient
+from clinic.search import fts_enabled, rebuild_patient_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает полнотекстовый индекс пациентов (FTS5, только SQLite). '
+        'Нужна после массовой загрузки в обход сигналов (bulk_create, raw SQL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в одной порции')
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('Таблица FTS отсутствует: нужна SQLite и примененная миграция 0015_patients_fts_rowid')
+        total = rebuild_patient_index(Patient.objects.all(), chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано пациентов: {total}'))
@@ -0,0 +1,152 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import json
+import time
+
+from clinic.fields import EncryptedTextField
+from clinic.utils import get_encryptor
+
+
+def encrypted_models():
+    """Модели с зашифрованными полями: [(label, model, [имена полей])]"""
+    result = []
+    for model in apps.get_models():
+        fields = [f.name for f in model._meta.concrete_fields if isinstance(f, EncryptedTextField)]
+        if fields:
+            result.append((model._meta.label_lower, model, fields))
+    return result
+
+
+def _init_worker():
+    """Процесс пула не должен использовать соединения с БД, унаследованные от родителя"""
+    import django
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def rotate_chunk(label, field_names, pks):
+    """Перешифровать основным ключом строки pks модели label. Возвращает число измененных строк"""
+    from collections import defaultdict
+
+    model = apps.get_model(label)
+    encryptor = get_encryptor()
+    # Набор полей на старом ключе -> строки: пишутся только эти поля, остальные не трогаем
+    groups = defaultdict(list)
+    with transaction.atomic():
+        # FOR UPDATE: сохранение строки между чтением и записью не будет перезаписано
+        rows = (
+            model.objects.select_for_update().filter(pk__in=pks).order_by('pk')
+            .values_list('pk', *field_names)
+        )
+        for pk, *values in rows:
+            updates = {}
+            for name, value in zip(field_names, values):
+                if value and not encryptor.is_current(value):
+                    # Открытое значение будет зашифровано основным ключом в get_prep_value
+                    updates[name] = encryptor.decrypt(value)
+            if updates:
+                groups[tuple(updates)].append(model(pk=pk, **updates))
+        # bulk_update не вызывает pre_save: updated_at и слепые индексы не меняются
+        for changed_fields, changed in groups.items():
+            model.objects.bulk_update(changed, changed_fields)
+    return sum(len(changed) for changed in groups.values())
+
+
+class Command(BaseCommand):
+    help = (
+        'Перешифровывает все зашифрованные колонки основным ключом ENCRYPTION_KEY. '
+        'Работает порциями по первичному ключу в пуле процессов, сохраняет '
+        'контрольную точку и может быть продолжена после сбоя.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Строк в одной порции')
+        parser.add_argument('--workers', type=int, default=2, help='Процессов в пуле (0 — без пула)')
+        parser.add_argument('--sleep', type=float, default=0.2,
+                            help='Пауза между пачками порций, сек (снижает нагрузку на БД)')
+        parser.add_argument('--checkpoint', default=str(Path(settings.BASE_DIR) / 'logs' / 'key_rotation.json'),
+                            help='Файл контрольной точки')
+        parser.add_argument('--reset', action='store_true', help='Начать заново, игнорируя контрольную точку')
+        parser.add_argument('--model', action='append', help='Ограничить моделью (app_label.model)')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        checkpoint_path = Path(options['checkpoint'])
+        if chunk_size < 1:
+            raise CommandError('--chunk-size должен быть положительным')
+
+        fingerprint = get_encryptor().key_fingerprint
+        checkpoint = {} if options['reset'] else self._load_checkpoint(checkpoint_path)
+        progress = checkpoint.setdefault(fingerprint, {})
+
+        targets = encrypted_models()
+        if options['model']:
+            targets = [t for t in targets if t[0] in {m.lower() for m in options['model']}]
+            if not targets:
+                raise CommandError('Указанные модели не содержат зашифрованных полей')
+
+        pool = None
+        if workers > 0:
+            # Соединения родителя не должны попасть в процессы пула
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+        try:
+            for label, model, field_names in targets:
+                total = self._rotate_model(
+                    pool, label, model, field_names, progress, chunk_size, max(workers, 1),
+                    options['sleep'], checkpoint, checkpoint_path
+                )
+                self.stdout.write(self.style.SUCCESS(f'{label}: перешифровано строк {total}'))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        progress['done'] = True
+        self._save_checkpoint(checkpoint_path, checkpoint)
+        self.stdout.write(self.style.SUCCESS('Ротация ключа завершена'))
+
+    def _rotate_model(self, pool, label, model, field_names, progress, chunk_size, parallel,
+                      pause, checkpoint, checkpoint_path):
+        total = 0
+        last_pk = progress.get(label)
+        queryset = model.objects.order_by('pk').values_list('pk', flat=True)
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            pks = list(batch[:chunk_size * parallel])
+            if not pks:
+                return total
+
+            chunks = [pks[i:i + chunk_size] for i in range(0, len(pks), chunk_size)]
+            if pool is None:
+                total += sum(rotate_chunk(label, field_names, chunk) for chunk in chunks)
+            else:
+                futures = [pool.submit(rotate_chunk, label, field_names, chunk) for chunk in chunks]
+                total += sum(future.result() for future in futures)
+
+            # Контрольная точка сохраняется только после завершения всей пачки
+            last_pk = pks[-1]
+            progress[label] = str(last_pk)
+            self._save_checkpoint(checkpoint_path, checkpoint)
+            self.stdout.write(f'{label}: обработано до {last_pk}, перешифровано {total}')
+            if pause:
+                time.sleep(pause)
+
+    def _load_checkpoint(self, path):
+        if not path.exists():
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, path, checkpoint):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(path)
@@ -0,0 +1,95 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.utils import timezone
+from pathlib import Path
+import json
+
+from clinic.benchmarks import BENCHMARK_USERNAME, benchmark_user, compare_results, run_benchmarks
+from clinic.management.commands.populate_db import add_scale_arguments
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа и число SQL-запросов основных эндпоинтов API и админки. '
+        'Результаты сохраняются в JSON; с --compare сравниваются с предыдущим прогоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на сценарий')
+        parser.add_argument('--repeat', type=int, default=10, help='Замеряемых запросов на сценарий')
+        parser.add_argument('--only', action='append', help='Только сценарии с таким префиксом имени')
+        parser.add_argument('--output', help='Файл результатов (по умолчанию benchmarks/<дата>.json)')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p95 при сравнении (0.2 = 20%%)')
+        parser.add_argument('--populate', action='store_true',
+                            help='Перед замером пересоздать данные через populate_db (очищает БД!)')
+        parser.add_argument('--create-user', action='store_true',
+                            help=f'Создать суперпользователя {BENCHMARK_USERNAME}, если его нет в БД')
+        add_scale_arguments(parser, patients=1000, doctors=20)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('--repeat должен быть положительным, --warmup неотрицательным')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        if options['populate']:
+            call_command(
+                'populate_db', patients=options['patients'], doctors=options['doctors'],
+                nurses=options['nurses'], years=options['years'], visits_per_day=options['visits_per_day'],
+                seed=options['seed'], chunk_size=options['chunk_size'], anchor_date=options['anchor_date'],
+                stdout=self.stdout,
+            )
+
+        # Суперпользователь создается только явно: замер может быть направлен на рабочую БД
+        user = benchmark_user(create=options['create_user'] or options['populate'])
+        if user is None:
+            raise CommandError(
+                f'В БД нет суперпользователя {BENCHMARK_USERNAME}: запустите с --create-user '
+                '(на выделенной для замеров БД) или с --populate'
+            )
+        report = run_benchmarks(
+            user, warmup=options['warmup'], repeat=options['repeat'], only=options['only'],
+            progress=self._progress,
+        )
+        if not report['results']:
+            raise CommandError('Нет данных для замеров: заполните БД (populate_db или --populate)')
+
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'benchmarks' /
+                      f'{timezone.now():%Y%m%d-%H%M%S}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены: {output}'))
+
+        if baseline is not None:
+            self._compare(baseline, report, options['threshold'])
+
+    def _progress(self, name, result):
+        line = (f'{name:<38} {result["status"]:>3}  p50 {result["p50_ms"]:>9.2f} мс  '
+                f'p95 {result["p95_ms"]:>9.2f} мс  p99 {result["p99_ms"]:>9.2f} мс  '
+                f'запросов {result["queries"]:>4}')
+        self.stdout.write(line if result['status'] < 400 else self.style.ERROR(line))
+
+    def _compare(self, baseline, report, threshold):
+        self.stdout.write('\nСравнение с базовым прогоном (p95, число запросов):')
+        regressions = []
+        for name, before, after, change, regression in compare_results(baseline, report, threshold):
+            if before is None:
+                self.stdout.write(f'{name:<38} новый сценарий')
+                continue
+            line = (f'{name:<38} {before["p95_ms"]:>9.2f} → {after["p95_ms"]:>9.2f} мс '
+                    f'({change:+.0%})  запросов {before["queries"]} → {after["queries"]}')
+            if regression:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'Регрессии производительности: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
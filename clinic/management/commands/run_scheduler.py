@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.scheduler import build_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает встроенный планировщик периодических задач (автоотмена приемов и др.). '
+        'Можно запускать в нескольких экземплярах: задача выполняется под блокировкой в БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, default=30, help='Интервал проверки расписания, сек')
+        parser.add_argument('--once', action='store_true', help='Выполнить наступившие задачи и выйти')
+        parser.add_argument('--run', metavar='JOB', help='Выполнить задачу немедленно, вне расписания')
+
+    def handle(self, *args, **options):
+        scheduler = build_scheduler(poll_interval=options['poll'])
+
+        if options['run']:
+            job = scheduler.jobs.get(options['run'])
+            if job is None:
+                raise CommandError(f'Неизвестная задача. Доступны: {", ".join(scheduler.jobs)}')
+            result = scheduler.run_job(job)
+            self.stdout.write(f'{job.name}: {"занята другим процессом" if result is None else result}')
+            return
+
+        if options['once']:
+            for name, result in scheduler.run_pending().items():
+                self.stdout.write(f'{name}: {result}')
+            return
+
+        self.stdout.write(f'Планировщик запущен, задачи: {", ".join(scheduler.jobs)}')
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            scheduler.stop()
+            self.stdout.write('Планировщик остановлен')
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:40
+
+import clinic.fields
+from cryptography.fernet import InvalidToken
+from django.db import migrations
+
+ENCRYPTED_FIELDS = ['passport_number', 'insurance_number', 'allergies', 'chronic_diseases']
+
+
+def _is_token(encryptor, value):
+    try:
+        encryptor.cipher.decrypt(value.encode())
+        return True
+    except InvalidToken:
+        return False
+
+
+def encrypt_existing(apps, schema_editor):
+    """Шифрование значений, сохраненных до появления EncryptedTextField"""
+    from clinic.fields import Ciphertext
+    from clinic.utils import get_encryptor
+
+    Patient = apps.get_model('clinic', 'Patient')
+    encryptor = get_encryptor()
+    for pk, *values in Patient.objects.values_list('pk', *ENCRYPTED_FIELDS).iterator():
+        updates = {
+            name: Ciphertext(encryptor.encrypt(str(value)))
+            for name, value in zip(ENCRYPTED_FIELDS, values)
+            if value and not _is_token(encryptor, value)
+        }
+        if updates:
+            Patient.objects.filter(pk=pk).update(**updates)
+
+
+def decrypt_existing(apps, schema_editor):
+    from clinic.fields import Ciphertext
+    from clinic.utils import get_encryptor
+
+    Patient = apps.get_model('clinic', 'Patient')
+    encryptor = get_encryptor()
+    for pk, *values in Patient.objects.values_list('pk', *ENCRYPTED_FIELDS).iterator():
+        updates = {
+            # Ciphertext записывается в БД как есть, без повторного шифрования
+            name: Ciphertext(encryptor.decrypt(value))
+            for name, value in zip(ENCRYPTED_FIELDS, values)
+            if value and _is_token(encryptor, value)
+        }
+        if updates:
+            Patient.objects.filter(pk=pk).update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0003_alter_auditlog_timestamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patient',
+            name='allergies',
+            field=clinic.fields.EncryptedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='chronic_diseases',
+            field=clinic.fields.EncryptedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='insurance_number',
+            field=clinic.fields.EncryptedTextField(max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='passport_number',
+            field=clinic.fields.EncryptedTextField(max_length=20, unique=True),
+        ),
+        migrations.RunPython(encrypt_existing, decrypt_existing),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:42
+
+import clinic.fields
+from django.db import migrations
+
+
+def fill_blind_indexes(apps, schema_editor):
+    from clinic.utils import blind_index, get_encryptor
+
+    Patient = apps.get_model('clinic', 'Patient')
+    encryptor = get_encryptor()
+    rows = Patient.objects.values_list('pk', 'passport_number', 'insurance_number')
+    for pk, passport_number, insurance_number in rows.iterator():
+        Patient.objects.filter(pk=pk).update(
+            passport_number_hash=blind_index(encryptor.decrypt(passport_number)) if passport_number else None,
+            insurance_number_hash=blind_index(encryptor.decrypt(insurance_number)) if insurance_number else None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0004_encrypt_patient_fields'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='patient',
+            name='patients_insuran_87ff0b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='patient',
+            name='patients_passpor_ac878f_idx',
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='insurance_number_hash',
+            field=clinic.fields.BlindIndexField(source='insurance_number', unique=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='passport_number_hash',
+            field=clinic.fields.BlindIndexField(source='passport_number', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='insurance_number',
+            field=clinic.fields.EncryptedTextField(max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='passport_number',
+            field=clinic.fields.EncryptedTextField(max_length=20),
+        ),
+        migrations.RunPython(fill_blind_indexes, migrations.RunPython.noop),
+    ]
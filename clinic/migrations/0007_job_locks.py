@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLock',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('owner', models.CharField(blank=True, max_length=255)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_result', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Блокировка задачи',
+                'verbose_name_plural': 'Блокировки задач',
+                'db_table': 'job_locks',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    """FTS5 доступен только на SQLite; на других СУБД поиск работает через icontains"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from clinic.search import FTS_TABLE
+
+    # Таблица пересоздается и заполняется миграцией 0015_patients_fts_rowid
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"patient_id UNINDEXED, document, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from clinic.search import FTS_TABLE, _fts_ready
+
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    _fts_ready.discard(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_job_locks'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_stats(apps, schema_editor):
+    """Начальная сводка по уже существующим приемам"""
+    alias = schema_editor.connection.alias
+    Appointment = apps.get_model('clinic', 'Appointment')
+    AppointmentDailyStat = apps.get_model('clinic', 'AppointmentDailyStat')
+    rows = (
+        Appointment.objects.using(alias)
+        .values('appointment_date', 'doctor_id', 'doctor__department_id', 'status')
+        .annotate(total=Count('id'), minutes=Sum('duration_minutes'))
+        .order_by()
+    )
+    AppointmentDailyStat.objects.using(alias).bulk_create(
+        (
+            AppointmentDailyStat(
+                date=row['appointment_date'], doctor_id=row['doctor_id'],
+                department_id=row['doctor__department_id'], status=row['status'],
+                count=row['total'], booked_minutes=row['minutes'] or 0,
+            )
+            for row in rows.iterator(chunk_size=5000)
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0008_patients_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('scheduled', 'Запланирован'), ('confirmed', 'Подтвержден'), ('completed', 'Завершен'), ('cancelled', 'Отменен'), ('no_show', 'Не явился')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('booked_minutes', models.IntegerField(default=0)),
+                ('department', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_stats', to='clinic.department')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='clinic.staff')),
+            ],
+            options={
+                'verbose_name': 'Сводка приемов за день',
+                'verbose_name_plural': 'Сводка приемов по дням',
+                'db_table': 'appointment_daily_stats',
+                'indexes': [models.Index(fields=['department', 'date'], name='appointment_departm_16a700_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'doctor', 'status'), name='uniq_daily_stat')],
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
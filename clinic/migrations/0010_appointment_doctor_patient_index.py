@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0009_appointment_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'patient', 'appointment_date'], name='appointment_doctor__f2a855_idx'),
+        ),
+    ]
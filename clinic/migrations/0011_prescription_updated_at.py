@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    """Существующие рецепты: updated_at = created_at, а не время миграции"""
+    Prescription = apps.get_model('clinic', 'Prescription')
+    Prescription.objects.using(schema_editor.connection.alias).update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0010_appointment_doctor_patient_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
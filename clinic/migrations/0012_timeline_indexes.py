@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0011_prescription_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date', 'appointment_time'], name='appointment_patient_fc04cf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['patient', 'created_at'], name='prescriptio_patient_50dfd5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='procedurerecord',
+            index=models.Index(fields=['patient', 'performed_date'], name='procedure_r_patient_7be537_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:12
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0012_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffScheduleException',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('kind', models.CharField(choices=[('vacation', 'Отпуск'), ('sick_leave', 'Больничный'), ('day_off', 'Выходной'), ('changed_hours', 'Измененные часы')], max_length=20)),
+                ('work_hours', models.CharField(blank=True, max_length=100)),
+                ('reason', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='clinic.staff')),
+            ],
+            options={
+                'verbose_name': 'Исключение из графика',
+                'verbose_name_plural': 'Исключения из графика',
+                'db_table': 'staff_schedule_exceptions',
+                'indexes': [models.Index(fields=['staff', 'date_to'], name='staff_sched_staff_i_570e13_idx')],
+            },
+        ),
+    ]
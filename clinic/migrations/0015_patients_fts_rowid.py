@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    """
+    Документы FTS адресуются целым rowid: удаление по неиндексируемой колонке
+    patient_id просматривало всю виртуальную таблицу при каждом сохранении пациента
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from clinic.search import FTS_IDS_TABLE, FTS_TABLE, _fts_ready, rebuild_patient_index
+
+    _fts_ready.discard(schema_editor.connection.alias)
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    schema_editor.execute(
+        f'CREATE TABLE IF NOT EXISTS {FTS_IDS_TABLE} ('
+        f'id INTEGER PRIMARY KEY, patient_id CHAR(32) NOT NULL UNIQUE)'
+    )
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"document, tokenize='unicode61 remove_diacritics 2')"
+    )
+    Patient = apps.get_model('clinic', 'Patient')
+    rebuild_patient_index(Patient.objects.all(), using=schema_editor.connection.alias)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from clinic.search import FTS_IDS_TABLE, FTS_TABLE, _fts_ready, _pk, patient_document
+
+    _fts_ready.discard(schema_editor.connection.alias)
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_IDS_TABLE}')
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"patient_id UNINDEXED, document, tokenize='unicode61 remove_diacritics 2')"
+    )
+    Patient = apps.get_model('clinic', 'Patient')
+    rows = Patient.objects.using(schema_editor.connection.alias).values_list('pk', 'full_name', 'phone')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (patient_id, document) VALUES (%s, %s)',
+            [(_pk(pk), patient_document(full_name, phone)) for pk, full_name, phone in rows.iterator()],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0014_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -2,10 +2,15 @@ from datetime import date
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from enum import Enum
 import uuid
 
+from .fields import BlindIndexField, EncryptedTextField
+from .search import fts_enabled, fts_subquery, search_terms
+from .utils import blind_index
+
 # ============ ВСПОМОГАТЕЛЬНЫЕ КЛАССЫ И ВЫБОРЫ ============
 
 class GenderChoice(models.TextChoices):
@@ -28,6 +33,13 @@ class AppointmentStatus(models.TextChoices):
     NO_SHOW = 'no_show', 'Не явился'
 
 
+class ScheduleExceptionKind(models.TextChoices):
+    VACATION = 'vacation', 'Отпуск'
+    SICK_LEAVE = 'sick_leave', 'Больничный'
+    DAY_OFF = 'day_off', 'Выходной'
+    CHANGED_HOURS = 'changed_hours', 'Измененные часы'
+
+
 class RoleChoice(models.TextChoices):
     ADMIN = 'admin', 'Администратор'
     DOCTOR = 'doctor', 'Врач'
@@ -88,6 +100,44 @@ class InsuranceCompany(models.Model):
 
 # ============ СУЩНОСТЬ 3: ПАЦИЕНТЫ ============
 
+class PatientQuerySet(models.QuerySet):
+    # Зашифрованное поле -> колонка слепого индекса
+    BLIND_INDEXES = {
+        'passport_number': 'passport_number_hash',
+        'insurance_number': 'insurance_number_hash',
+    }
+
+    def blind_filter(self, **lookups):
+        """Точный поиск по зашифрованным полям: blind_filter(insurance_number='...')"""
+        return self.filter(**{
+            self.BLIND_INDEXES[name]: blind_index(value) for name, value in lookups.items()
+        })
+
+    def blind_search_q(self, term):
+        """Q для поиска term по любому из слепых индексов"""
+        digest = blind_index(term)
+        q = models.Q(pk__in=[])
+        for column in self.BLIND_INDEXES.values():
+            q |= models.Q(**{column: digest})
+        return q
+
+    def search(self, query):
+        """
+        Поиск по префиксам слов ФИО и телефона (FTS5 на SQLite, иначе icontains)
+        и точным совпадением номера полиса или паспорта
+        """
+        terms = search_terms(query)
+        if not terms:
+            return self.none()
+        if fts_enabled(self.db):
+            q = models.Q(pk__in=fts_subquery(query))
+        else:
+            q = models.Q()
+            for term in terms:
+                q &= models.Q(full_name__icontains=term) | models.Q(phone__icontains=term)
+        return self.filter(q | self.blind_search_q(query))
+
+
 class Patient(models.Model):
     """
     Пациенты медицинского учреждения
@@ -100,7 +150,9 @@ class Patient(models.Model):
         validators=[MinValueValidator(date(1900, 1, 1))]  # ⬅️ ИСПРАВЛЕНО: объект date
     )
     gender = models.CharField(max_length=1, choices=GenderChoice.choices)
-    passport_number = models.CharField(max_length=20, unique=True)
+    # Чувствительные данные хранятся зашифрованными (см. fields.EncryptedTextField)
+    passport_number = EncryptedTextField(max_length=20)
+    passport_number_hash = BlindIndexField(source='passport_number', unique=True)
     address = models.TextField()
     phone = models.CharField(max_length=20)
     email = models.EmailField(blank=True)
@@ -110,22 +162,21 @@ class Patient(models.Model):
         null=True,
         related_name='patients'
     )
-    insurance_number = models.CharField(max_length=50, unique=True)
+    insurance_number = EncryptedTextField(max_length=50)
+    insurance_number_hash = BlindIndexField(source='insurance_number', unique=True)
     emergency_contact = models.CharField(max_length=255)
     emergency_phone = models.CharField(max_length=20)
-    allergies = models.TextField(blank=True)
-    chronic_diseases = models.TextField(blank=True)
+    allergies = EncryptedTextField(blank=True)
+    chronic_diseases = EncryptedTextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PatientQuerySet.as_manager()
+
     class Meta:
         db_table = 'patients'
         verbose_name = 'Пациент'
         verbose_name_plural = 'Пациенты'
-        indexes = [
-            models.Index(fields=['insurance_number']),
-            models.Index(fields=['passport_number']),
-        ]
 
     def __str__(self):
         return self.full_name
@@ -209,6 +260,60 @@ class Staff(models.Model):
     def __str__(self):
         return f"{self.full_name} ({self.get_position_display()})"
 
+    def clean(self):
+        from .schedules import compile_schedule
+
+        try:
+            compile_schedule(self.work_schedule, strict=True)
+        except ValueError as e:
+            raise ValidationError({'work_schedule': str(e)})
+
+
+class StaffScheduleException(models.Model):
+    """
+    Исключение из графика работы на период дат: отпуск, больничный,
+    выходной — сотрудник не работает; измененные часы — work_hours
+    ("10:00-14:00") заменяет часы из work_schedule. При пересечении
+    периодов действует исключение, созданное позже.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    staff = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='schedule_exceptions')
+    date_from = models.DateField()
+    date_to = models.DateField()
+    kind = models.CharField(max_length=20, choices=ScheduleExceptionKind.choices)
+    work_hours = models.CharField(max_length=100, blank=True)
+    reason = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'staff_schedule_exceptions'
+        verbose_name = 'Исключение из графика'
+        verbose_name_plural = 'Исключения из графика'
+        indexes = [
+            # Исключения врачей, пересекающиеся с периодом поиска слотов
+            models.Index(fields=['staff', 'date_to']),
+        ]
+
+    def __str__(self):
+        return f"{self.staff_id}: {self.get_kind_display()} {self.date_from} – {self.date_to}"
+
+    def clean(self):
+        from .schedules import parse_hours
+
+        if self.date_from and self.date_to and self.date_to < self.date_from:
+            raise ValidationError({'date_to': 'Дата окончания раньше даты начала'})
+        if self.kind != ScheduleExceptionKind.CHANGED_HOURS:
+            if self.work_hours.strip():
+                raise ValidationError({'work_hours': 'Часы указываются только для измененных часов'})
+            return
+        if not self.work_hours.strip():
+            raise ValidationError({'work_hours': 'Укажите часы работы'})
+        try:
+            parse_hours(self.work_hours)
+        except ValueError as e:
+            raise ValidationError({'work_hours': str(e)})
+
 
 # ============ СУЩНОСТЬ 6: ПРИЕМЫ ============
 
@@ -245,11 +350,32 @@ class Appointment(models.Model):
         indexes = [
             models.Index(fields=['appointment_date', 'doctor']),
             models.Index(fields=['patient']),
+            # Keyset-пагинация ленты приемов
+            models.Index(fields=['appointment_date', 'appointment_time', 'id']),
+            # Пациенты врача и дата последнего визита (StaffViewSet.patients)
+            models.Index(fields=['doctor', 'patient', 'appointment_date']),
+            # Хронология пациента (timeline.py)
+            models.Index(fields=['patient', 'appointment_date', 'appointment_time']),
         ]
 
     def __str__(self):
         return f"{self.patient.full_name} - {self.doctor.full_name} ({self.appointment_date})"
 
+    # Поля, от которых зависит сводка AppointmentDailyStat
+    ROLLUP_FIELDS = ('appointment_date', 'doctor_id', 'status', 'duration_minutes')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Состояние на момент загрузки: по нему сигналы вычисляют изменение сводки
+        if all(field in instance.__dict__ for field in cls.ROLLUP_FIELDS):
+            instance._rollup_state = instance.rollup_state()
+        return instance
+
+    def rollup_state(self):
+        date = self._meta.get_field('appointment_date').to_python(self.appointment_date)
+        return (date, self.doctor_id, self.status, self.duration_minutes)
+
 
 # ============ СУЩНОСТЬ 7: ДИАГНОЗЫ ============
 
@@ -316,6 +442,7 @@ class MedicalRecord(models.Model):
         verbose_name_plural = 'Медицинские записи'
         indexes = [
             models.Index(fields=['patient', 'record_date']),
+            models.Index(fields=['record_date', 'id']),
         ]
 
     def __str__(self):
@@ -347,12 +474,16 @@ class Prescription(models.Model):
     instructions = models.TextField()
     is_issued = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     valid_until = models.DateField()
 
     class Meta:
         db_table = 'prescriptions'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['patient', 'created_at']),
+        ]
 
     def __str__(self):
         return f"{self.medication_name} для {self.patient.full_name}"
@@ -400,6 +531,9 @@ class ProcedureRecord(models.Model):
         db_table = 'procedure_records'
         verbose_name = 'Выполненная процедура'
         verbose_name_plural = 'Выполненные процедуры'
+        indexes = [
+            models.Index(fields=['patient', 'performed_date']),
+        ]
 
     def __str__(self):
         return f"{self.patient.full_name} - {self.procedure.name}"
@@ -418,7 +552,8 @@ class AuditLog(models.Model):
     object_id = models.CharField(max_length=100)
     changes = models.JSONField(default=dict)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Время события, а не записи: журнал пишется пакетами (см. audit.AuditLogWriter)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'audit_logs'
@@ -428,7 +563,61 @@ class AuditLog(models.Model):
         indexes = [
             models.Index(fields=['user', 'timestamp']),
             models.Index(fields=['model_name']),
+            models.Index(fields=['timestamp', 'id']),
         ]
 
     def __str__(self):
         return f"{self.user} - {self.action} ({self.timestamp})"
+
+
+# ============ СВОДКА ПРИЕМОВ ПО ДНЯМ ============
+
+class AppointmentDailyStat(models.Model):
+    """
+    Число приемов и забронированные минуты за день по врачу и статусу.
+    Обновляется инкрементально сигналами Appointment (rollups.py),
+    пересчитывается командой rebuild_appointment_stats.
+    Отделение — отделение врача на момент создания строки.
+    """
+    date = models.DateField()
+    doctor = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='daily_stats')
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, related_name='daily_stats')
+    status = models.CharField(max_length=20, choices=AppointmentStatus.choices)
+    count = models.IntegerField(default=0)
+    booked_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'appointment_daily_stats'
+        verbose_name = 'Сводка приемов за день'
+        verbose_name_plural = 'Сводка приемов по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'doctor', 'status'], name='uniq_daily_stat'),
+        ]
+        indexes = [
+            models.Index(fields=['department', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.doctor_id} {self.status}: {self.count}"
+
+
+# ============ СЛУЖЕБНОЕ: БЛОКИРОВКИ ПЕРИОДИЧЕСКИХ ЗАДАЧ ============
+
+class JobLock(models.Model):
+    """
+    Аренда периодической задачи (см. scheduler.py): не дает запустить одну
+    задачу в нескольких процессах одновременно и хранит время последнего запуска
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    owner = models.CharField(max_length=255, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_result = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'job_locks'
+        verbose_name = 'Блокировка задачи'
+        verbose_name_plural = 'Блокировки задач'
+
+    def __str__(self):
+        return self.name
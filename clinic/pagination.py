@@ -0,0 +1,210 @@
+"""
+Keyset-пагинация для больших, постоянно растущих таблиц.
+
+В отличие от PageNumberPagination не выполняет COUNT(*) и OFFSET:
+следующая страница выбирается условием по значениям колонок сортировки
+последней строки, поэтому глубокие страницы читаются так же быстро,
+как первая. Сортировка должна заканчиваться уникальной колонкой (id)
+и опираться на индекс.
+"""
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime, time
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            position = self._coerce(queryset, position)
+
+        ordering = self._invert(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, ordering))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = position is not None if not reverse else has_more
+        self.first_position = self._position(rows[0]) if rows else None
+        self.last_position = self._position(rows[-1]) if rows else None
+        if not rows and position is not None:
+            # Пустая страница при переходе по курсору: оставляем возможность вернуться
+            self.first_position = self.last_position = position
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _invert(self, ordering):
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+    def _after(self, position, ordering):
+        """Условие «строго после position» для лексикографического порядка ordering"""
+        condition = Q(pk__in=[])
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _coerce(self, queryset, position):
+        """
+        Значения курсора приводятся к типам колонок сортировки: курсор приходит
+        от клиента, и подделанное значение должно давать 404, а не ошибку в запросе
+        """
+        values = []
+        try:
+            for field, value in zip(self.ordering, position):
+                if value is None or isinstance(value, (dict, list)):
+                    raise ValueError
+                values.append(self._ordering_field(queryset, field.lstrip('-')).to_python(value))
+        except (DjangoValidationError, TypeError, ValueError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _ordering_field(self, queryset, name):
+        # Сортировка может идти по аннотации (last_visit в DoctorPatientPagination)
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def _position(self, row):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field.lstrip('-'))
+            if isinstance(value, (date, datetime, time)):
+                value = value.isoformat()
+            elif value is not None and not isinstance(value, (int, float)):
+                value = str(value)
+            values.append(value)
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            position, reverse = data['p'], bool(data.get('r'))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse=False):
+        data = {'p': position}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Размер страницы (не более {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class AppointmentPagination(KeysetPagination):
+    ordering = ('appointment_date', 'appointment_time', 'id')
+
+
+class MedicalRecordPagination(KeysetPagination):
+    ordering = ('-record_date', '-id')
+
+
+class AuditLogPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class DoctorPatientPagination(KeysetPagination):
+    """Пациенты врача: сортировка выбирается параметром ?ordering="""
+    orderings = {
+        'full_name': ('full_name', 'id'),
+        '-full_name': ('-full_name', '-id'),
+        'last_visit': ('last_visit', 'id'),
+        '-last_visit': ('-last_visit', '-id'),
+    }
+    default_ordering = 'full_name'
+    ordering_query_param = 'ordering'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        name = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if name not in self.orderings:
+            raise ValidationError({
+                self.ordering_query_param: f'Допустимые значения: {", ".join(self.orderings)}'
+            })
+        self.ordering = self.orderings[name]
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,209 @@
+"""
+Формирование PDF медицинской карты пациента.
+
+Шрифт с кириллицей регистрируется в ReportLab один раз на процесс.
+Готовые документы кешируются по хешу содержимого карты (пациент, его
+updated_at, показанные записи, имена врачей и названия диагнозов), поэтому
+повторная печать неизменной карты не требует повторного рендеринга.
+Документ содержит персональные и медицинские данные, поэтому в кеше
+(файлы на диске) он хранится зашифрованным ключом ENCRYPTION_KEY.
+"""
+import hashlib
+import logging
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from cryptography.fernet import InvalidToken
+from django.core.cache import caches
+
+from .models import MedicalRecord
+from .utils import get_encryptor
+
+logger = logging.getLogger(__name__)
+
+FONT_NAME = 'DejaVuSans'
+
+# Шрифт из репозитория, затем системные копии DejaVu
+FONT_CANDIDATES = [
+    settings.BASE_DIR / 'fonts' / 'DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+]
+
+# Увеличивается при изменении макета, чтобы не отдавать старые документы из кеша
+RENDERER_VERSION = 1
+
+CARD_RECORDS_LIMIT = 5
+
+
+@lru_cache(maxsize=None)
+def register_fonts():
+    """Регистрация TTF-шрифта с кириллицей (выполняется один раз)"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont, TTFError
+
+    candidates = [getattr(settings, 'PDF_FONT_PATH', None)] + FONT_CANDIDATES
+    for path in filter(None, candidates):
+        try:
+            pdfmetrics.registerFont(TTFont(FONT_NAME, str(path)))
+            return FONT_NAME
+        except (OSError, TTFError) as e:
+            logger.warning(f"Не удалось загрузить шрифт {path}: {str(e)}")
+
+    logger.error("Шрифт с кириллицей не найден, PDF будет сформирован шрифтом Helvetica")
+    return 'Helvetica'
+
+
+@lru_cache(maxsize=None)
+def _styles():
+    from reportlab.lib.styles import ParagraphStyle
+
+    font = register_fonts()
+    return {
+        'title': ParagraphStyle('CardTitle', fontName=font, fontSize=16, leading=20, spaceAfter=12),
+        'heading': ParagraphStyle('CardHeading', fontName=font, fontSize=12, leading=16,
+                                  spaceBefore=10, spaceAfter=6),
+        'body': ParagraphStyle('CardBody', fontName=font, fontSize=10, leading=13),
+    }
+
+
+def _paragraph(text, style):
+    from reportlab.platypus import Paragraph
+    return Paragraph(escape(str(text)).replace('\n', '<br/>'), style)
+
+
+def render_medical_card(patient, records):
+    """PDF медицинской карты в виде bytes"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = _styles()
+    buffer = BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=A4,
+        leftMargin=20 * mm, rightMargin=20 * mm, topMargin=20 * mm, bottomMargin=20 * mm,
+        title=f'Медицинская карта: {patient.full_name}',
+    )
+
+    story = [_paragraph('МЕДИЦИНСКАЯ КАРТА ПАЦИЕНТА', styles['title'])]
+    info = [
+        ('ФИО', patient.full_name),
+        ('Дата рождения', patient.date_of_birth),
+        ('Возраст', f'{patient.age} лет'),
+        ('Пол', patient.get_gender_display()),
+        ('Номер полиса', patient.insurance_number),
+        ('Адрес', patient.address),
+        ('Телефон', patient.phone),
+    ]
+    table = Table(
+        [[_paragraph(label, styles['body']), _paragraph(value, styles['body'])] for label, value in info],
+        colWidths=[45 * mm, 125 * mm],
+    )
+    table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    story.append(table)
+
+    story.append(_paragraph('ПОСЛЕДНИЕ МЕДИЦИНСКИЕ ЗАПИСИ', styles['heading']))
+    if not records:
+        story.append(_paragraph('Записей нет', styles['body']))
+    for i, record in enumerate(records, 1):
+        story.append(_paragraph(f'Запись #{i} от {record.record_date.date()}', styles['heading']))
+        for label, value in (
+            ('Врач', record.doctor.full_name),
+            ('Симптомы', record.symptoms),
+            ('Диагноз', record.diagnosis.name if record.diagnosis else 'Не указан'),
+            ('Лечение', record.treatment_plan),
+        ):
+            story.append(_paragraph(f'{label}: {value}', styles['body']))
+        story.append(Spacer(1, 4 * mm))
+
+    document.build(story)
+    return buffer.getvalue()
+
+
+def _card_records(patient):
+    return (
+        MedicalRecord.objects.filter(patient=patient)
+        .select_related('doctor', 'diagnosis')
+        .order_by('-record_date')[:CARD_RECORDS_LIMIT]
+    )
+
+
+def medical_card_records(patient):
+    """Записи, попадающие в карту (вместе с врачами и диагнозами — один запрос)"""
+    return list(_card_records(patient))
+
+
+async def amedical_card_records(patient):
+    return [record async for record in _card_records(patient)]
+
+
+def _document_cache():
+    return caches[getattr(settings, 'DOCUMENT_CACHE_ALIAS', 'default')]
+
+
+def medical_card_cache_key(patient, records):
+    """
+    Хеш содержимого карты: пациент, его updated_at и показанные записи вместе
+    с именем врача и названием диагноза — переименование меняет ключ
+    """
+    parts = [RENDERER_VERSION, patient.pk, patient.updated_at.isoformat(), patient.age]
+    for record in records:
+        parts += [
+            record.pk, record.updated_at.isoformat(), record.doctor.full_name,
+            record.diagnosis.name if record.diagnosis else '',
+        ]
+    source = '|'.join(str(part) for part in parts)
+    return 'medical_card:' + hashlib.sha256(source.encode()).hexdigest()
+
+
+def _encrypt(pdf):
+    return get_encryptor().cipher.encrypt(pdf)
+
+
+def _decrypt(token):
+    """Документ из кеша; запись под выведенным из оборота ключом считается промахом"""
+    if token is None:
+        return None
+    try:
+        return get_encryptor().cipher.decrypt(token)
+    except InvalidToken:
+        return None
+
+
+def get_medical_card_pdf(patient, records=None):
+    """PDF медицинской карты из кеша или с рендерингом при промахе"""
+    if records is None:
+        records = medical_card_records(patient)
+    cache = _document_cache()
+    key = medical_card_cache_key(patient, records)
+    pdf = _decrypt(cache.get(key))
+    if pdf is None:
+        pdf = render_medical_card(patient, records)
+        cache.set(key, _encrypt(pdf), getattr(settings, 'DOCUMENT_CACHE_TIMEOUT', None))
+    return pdf
+
+
+async def aget_medical_card_pdf(patient, records=None):
+    """
+    Асинхронный вариант get_medical_card_pdf: данные читаются асинхронным ORM,
+    рендеринг ReportLab (синхронный, нагружает CPU) выполняется в пуле потоков
+    """
+    if records is None:
+        records = await amedical_card_records(patient)
+    cache = _document_cache()
+    key = medical_card_cache_key(patient, records)
+    pdf = _decrypt(await cache.aget(key))
+    if pdf is None:
+        pdf = await sync_to_async(render_medical_card, thread_sensitive=False)(patient, records)
+        await cache.aset(key, _encrypt(pdf), getattr(settings, 'DOCUMENT_CACHE_TIMEOUT', None))
+    return pdf
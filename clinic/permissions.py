@@ -1,67 +1,54 @@
 from rest_framework.permissions import BasePermission
 
 
-class IsPatient(BasePermission):
-    """Доступ только для пациентов"""
+def request_role(request):
+    """
+    Роль пользователя запроса: из claims JWT, если запрос аутентифицирован
+    токеном, иначе из CustomUser
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return None
+    token = request.auth
+    if token is not None and hasattr(token, 'get') and token.get('role'):
+        return token.get('role')
+    customuser = getattr(user, 'customuser', None)
+    return customuser.role if customuser is not None else None
+
+
+class RolePermission(BasePermission):
+    """Доступ для пользователей с одной из ролей roles"""
+    roles = ()
+
     def has_permission(self, request, view):
-        return (
-            request.user and
-            request.user.is_authenticated and
-            hasattr(request.user, 'customuser') and
-            request.user.customuser.role == 'patient'
-        )
+        return request_role(request) in self.roles
+
+
+class IsPatient(RolePermission):
+    """Доступ только для пациентов"""
+    roles = ('patient',)
 
 
-class IsDoctor(BasePermission):
+class IsDoctor(RolePermission):
     """Доступ только для врачей"""
-    def has_permission(self, request, view):
-        return (
-            request.user and
-            request.user.is_authenticated and
-            hasattr(request.user, 'customuser') and
-            request.user.customuser.role == 'doctor'
-        )
+    roles = ('doctor',)
 
 
-class IsNurse(BasePermission):
+class IsNurse(RolePermission):
     """Доступ только для медсестер"""
-    def has_permission(self, request, view):
-        return (
-            request.user and
-            request.user.is_authenticated and
-            hasattr(request.user, 'customuser') and
-            request.user.customuser.role == 'nurse'
-        )
+    roles = ('nurse',)
 
 
-class IsRegistrar(BasePermission):
+class IsRegistrar(RolePermission):
     """Доступ только для регистраторов"""
-    def has_permission(self, request, view):
-        return (
-            request.user and
-            request.user.is_authenticated and
-            hasattr(request.user, 'customuser') and
-            request.user.customuser.role == 'registrar'
-        )
+    roles = ('registrar',)
 
 
-class IsAdmin(BasePermission):
+class IsAdmin(RolePermission):
     """Доступ только для администраторов"""
-    def has_permission(self, request, view):
-        return (
-            request.user and
-            request.user.is_authenticated and
-            hasattr(request.user, 'customuser') and
-            request.user.customuser.role == 'admin'
-        )
+    roles = ('admin',)
 
 
-class IsStaff(BasePermission):
+class IsStaff(RolePermission):
     """Доступ для медицинского персонала (врач, медсестра)"""
-    def has_permission(self, request, view):
-        return (
-            request.user and
-            request.user.is_authenticated and
-            hasattr(request.user, 'customuser') and
-            request.user.customuser.role in ['doctor', 'nurse', 'registrar', 'admin']
-        )
+    roles = ('doctor', 'nurse', 'registrar', 'admin')
@@ -0,0 +1,157 @@
+"""
+Бюджет SQL-запросов на запрос.
+
+Обработчик объявляет, сколько запросов к БД ему позволено выполнить.
+Запросы считаются через connection.execute_wrapper на всех подключениях.
+При превышении в DEBUG и в тестах выбрасывается QueryBudgetExceeded,
+в production пишется предупреждение в лог. Так N+1, появившийся после
+очередного рефакторинга, обнаруживается сразу, а не на проде.
+"""
+import logging
+from contextlib import ContextDecorator, ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def _should_raise():
+    # Тестовый раннер Django создает mail.outbox в setup_test_environment()
+    return getattr(settings, 'QUERY_BUDGET_RAISE', settings.DEBUG) or hasattr(mail, 'outbox')
+
+
+class query_budget(ContextDecorator):
+    """
+    Контекстный менеджер и декоратор: with query_budget(5, 'name'): ... или @query_budget(5)
+    При использовании как декоратор каждый вызов получает свой счетчик.
+    В async-коде — async with query_budget(5, 'name'): ...
+    """
+
+    def __init__(self, limit, name=None):
+        self.limit = limit
+        self.name = name
+        self.count = 0
+        self.statements = []
+        self._stack = None
+
+    def _recreate_cm(self):
+        return query_budget(self.limit, self.name)
+
+    def __call__(self, func):
+        if self.name is None:
+            self.name = func.__qualname__
+        return super().__call__(func)
+
+    def _execute(self, execute, sql, params, many, context):
+        self.count += 1
+        if len(self.statements) < 20:
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def _wrap_connections(self, stack):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self._execute))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        self._wrap_connections(self._stack)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stack.close()
+        if exc_type is None:
+            self.check()
+        return False
+
+    async def __aenter__(self):
+        # Подключения Django привязаны к потоку: асинхронный ORM выполняет запросы
+        # в потоке sync_to_async, поэтому счетчик ставится на его подключения
+        await sync_to_async(self.__enter__)()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await sync_to_async(self.__exit__)(exc_type, exc, tb)
+
+    def iterate(self, iterable):
+        """Продолжить подсчет во время чтения потокового ответа и проверить бюджет в конце"""
+        with ExitStack() as stack:
+            self._wrap_connections(stack)
+            yield from iterable
+        self.check()
+
+    def check(self, strict=True):
+        """strict=False — только предупреждение в лог, даже в DEBUG и в тестах"""
+        if self.limit is None or self.count <= self.limit:
+            return
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return
+        message = f'{self.name or "Запрос"}: выполнено {self.count} SQL-запросов при бюджете {self.limit}'
+        if strict and _should_raise():
+            raise QueryBudgetExceeded(message + '\n' + '\n'.join(self.statements))
+        logger.warning(message)
+
+
+
+class QueryBudgetMixin:
+    """
+    Бюджет запросов для действий DRF viewset'а.
+
+    query_budget — бюджет по умолчанию, query_budgets — для отдельных действий
+    ({'list': 3, 'export_pdf': 4}). None отключает проверку.
+    Бюджет учитывает запас на сессионную аутентификацию (сессия, пользователь,
+    роль) и синхронную запись аудита; N+1 на странице выходит за него сразу.
+
+    Превышение бюджета выбрасывает исключение только для безопасных методов
+    (GET, HEAD, OPTIONS). Изменяющий запрос к моменту проверки уже
+    зафиксирован в БД: ответ 500 на сохраненные данные вводит клиента в
+    заблуждение, поэтому для него превышение только пишется в лог.
+    """
+    query_budget = None
+    query_budgets = {}
+
+    def get_query_budget(self):
+        return self.query_budgets.get(getattr(self, 'action', None), self.query_budget)
+
+    def dispatch(self, request, *args, **kwargs):
+        # self.action становится известен только внутри dispatch (initialize_request),
+        # поэтому запросы считаются всегда, а бюджет определяется после обработки
+        budget = query_budget(None)
+        with budget:
+            response = super().dispatch(request, *args, **kwargs)
+
+        budget.limit = self.get_query_budget()
+        budget.name = f'{type(self).__name__}.{getattr(self, "action", None)}'
+        if budget.limit is None:
+            return response
+        if getattr(response, 'streaming', False):
+            response.streaming_content = budget.iterate(response.streaming_content)
+        else:
+            budget.check(strict=request.method in SAFE_METHODS)
+        return response
+
+
+class QueryBudgetAdminMixin:
+    """
+    Бюджет запросов для списка объектов в админке (changelist_view).
+    Шаблон рендерится внутри бюджета: __str__ связанных объектов вызывается при рендеринге.
+    """
+    changelist_query_budget = None
+
+    def changelist_view(self, request, extra_context=None):
+        if self.changelist_query_budget is None:
+            return super().changelist_view(request, extra_context)
+
+        name = f'{type(self).__name__}.changelist_view'
+        with query_budget(self.changelist_query_budget, name):
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
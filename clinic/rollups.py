@@ -0,0 +1,131 @@
+"""
+Инкрементальная сводка приемов AppointmentDailyStat.
+
+Изменение приема превращается в дельты по ключу (дата, врач, статус):
+-1 для старого состояния и +1 для нового. Дельты применяются атомарным
+UPDATE count = count + delta в той же транзакции, что и изменение приема;
+недостающая строка сводки создается. Массовые операции (update(),
+bulk_create) сигналы не вызывают и применяют дельты сами через apply_deltas
+или пересчитывают сводку rebuild_stats.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+
+def state_deltas(old_state, new_state):
+    """
+    Дельты между состояниями (date, doctor_id, status, duration).
+    Возвращает {(date, doctor_id, status): [count, minutes]}
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    if old_state == new_state:
+        return deltas
+    if old_state is not None:
+        date, doctor_id, status, duration = old_state
+        deltas[(date, doctor_id, status)][0] -= 1
+        deltas[(date, doctor_id, status)][1] -= duration or 0
+    if new_state is not None:
+        date, doctor_id, status, duration = new_state
+        deltas[(date, doctor_id, status)][0] += 1
+        deltas[(date, doctor_id, status)][1] += duration or 0
+    return deltas
+
+
+def merge_deltas(target, deltas):
+    for key, (count, minutes) in deltas.items():
+        target[key][0] += count
+        target[key][1] += minutes
+    return target
+
+
+def apply_deltas(deltas, using='default'):
+    from .models import AppointmentDailyStat, Staff
+
+    changes = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not changes:
+        return
+    doctor_ids = {doctor_id for _, doctor_id, _ in changes}
+    departments = dict(
+        Staff.objects.using(using).filter(pk__in=doctor_ids).values_list('pk', 'department_id')
+    )
+    stats = AppointmentDailyStat.objects.using(using)
+
+    def increment(key):
+        date, doctor_id, status = key
+        count, minutes = changes[key]
+        return stats.filter(date=date, doctor_id=doctor_id, status=status).update(
+            count=F('count') + count, booked_minutes=F('booked_minutes') + minutes
+        )
+
+    def new_row(key):
+        date, doctor_id, status = key
+        count, minutes = changes[key]
+        return AppointmentDailyStat(
+            date=date, doctor_id=doctor_id, status=status,
+            department_id=departments.get(doctor_id), count=count, booked_minutes=minutes,
+        )
+
+    with transaction.atomic(using=using):
+        existing = set(
+            stats.filter(date__in={date for date, _, _ in changes}, doctor_id__in=doctor_ids)
+            .values_list('date', 'doctor_id', 'status')
+        )
+        missing = []
+        for key in changes:
+            if key in existing and increment(key):
+                continue
+            missing.append(key)
+        if not missing:
+            return
+        try:
+            # Новые строки (например, после пакетной записи на новые дни) — одним INSERT
+            with transaction.atomic(using=using):
+                stats.bulk_create([new_row(key) for key in missing])
+        except IntegrityError:
+            # Часть строк только что создал параллельный запрос — по одной
+            for key in missing:
+                if increment(key):
+                    continue
+                try:
+                    with transaction.atomic(using=using):
+                        new_row(key).save(using=using)
+                except IntegrityError:
+                    increment(key)
+
+
+def rebuild_stats(date_from=None, date_to=None, chunk_size=5000):
+    """Пересчитать сводку по таблице приемов (за период или целиком). Возвращает число строк"""
+    from .models import Appointment, AppointmentDailyStat
+
+    period = {}
+    if date_from:
+        period['date__gte'] = date_from
+    if date_to:
+        period['date__lte'] = date_to
+    appointment_period = {f'appointment_{key}': value for key, value in period.items()}
+
+    rows = (
+        Appointment.objects.filter(**appointment_period)
+        .values('appointment_date', 'doctor_id', 'doctor__department_id', 'status')
+        .annotate(total=Count('id'), minutes=Sum('duration_minutes'))
+        .order_by()
+    )
+    created = 0
+    with transaction.atomic():
+        AppointmentDailyStat.objects.filter(**period).delete()
+        batch = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            batch.append(AppointmentDailyStat(
+                date=row['appointment_date'], doctor_id=row['doctor_id'],
+                department_id=row['doctor__department_id'], status=row['status'],
+                count=row['total'], booked_minutes=row['minutes'] or 0,
+            ))
+            if len(batch) >= chunk_size:
+                AppointmentDailyStat.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        AppointmentDailyStat.objects.bulk_create(batch)
+        created += len(batch)
+    return created
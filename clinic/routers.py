@@ -0,0 +1,254 @@
+"""
+Маршрутизация чтения на реплики БД.
+
+Отчеты, выгрузки, расписания и списки админки читают с реплик
+(settings.REPLICA_DATABASES), чтобы тяжелые запросы не мешали записи
+на приемы в основной БД. Чтение идет на реплику только внутри
+read_from_replica(): остальной код, включая проверки перед записью,
+по-прежнему читает из default. Реплика выбирается один раз на блок
+(и на потоковую отдачу ответа): реплики отстают по-разному, и запросы
+одного ответа не должны видеть разные моменты данных.
+
+Read-your-writes: после успешного изменяющего запроса пользователь
+REPLICA_STICKY_SECONDS секунд читает только из default — реплика могла
+еще не получить его изменения. Признак хранится в cookie (браузер,
+админка) и в shared-кеше по id пользователя (клиенты API с JWT): запрос
+на чтение может попасть в другой процесс, чем запись, поэтому кеш
+процесса (LocMemCache) здесь не подходит.
+"""
+import random
+import time
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from functools import partial, wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .utils import shared_cache
+
+STICKY_COOKIE = 'db_sticky'
+
+# Реплика текущего блока read_from_replica() или None — чтение из default
+_replica_alias = ContextVar('replica_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+
+def _sticky_key(user_id):
+    return f'replica:sticky:{user_id}'
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return None
+    return user.pk
+
+
+def _set_cookie(response, until):
+    if response is not None:
+        response.set_cookie(
+            STICKY_COOKIE, str(int(until)), max_age=sticky_seconds(), httponly=True, samesite='Lax'
+        )
+
+
+def mark_write(request, response=None):
+    """Запомнить, что пользователь только что изменил данные"""
+    until = time.time() + sticky_seconds()
+    user_id = _user_id(request)
+    if user_id is not None:
+        shared_cache().set(_sticky_key(user_id), until, sticky_seconds())
+    _set_cookie(response, until)
+
+
+async def amark_write(request, response=None):
+    """mark_write для асинхронного стека (DatabaseCache нельзя вызывать из event loop)"""
+    until = time.time() + sticky_seconds()
+    user_id = _user_id(request)
+    if user_id is not None:
+        await shared_cache().aset(_sticky_key(user_id), until, sticky_seconds())
+    _set_cookie(response, until)
+
+
+def is_sticky(request):
+    """Должен ли запрос читать из default (недавняя запись этого пользователя)"""
+    if not replica_aliases():
+        # Без реплик все читается из default — кеш не запрашивается
+        return False
+    if request.COOKIES.get(STICKY_COOKIE):
+        return True
+    user_id = _user_id(request)
+    return user_id is not None and (shared_cache().get(_sticky_key(user_id)) or 0) > time.time()
+
+
+async def ais_sticky(request):
+    """is_sticky для асинхронных представлений"""
+    if not replica_aliases():
+        return False
+    if request.COOKIES.get(STICKY_COOKIE):
+        return True
+    user_id = _user_id(request)
+    return user_id is not None and (await shared_cache().aget(_sticky_key(user_id)) or 0) > time.time()
+
+
+class read_from_replica(ContextDecorator):
+    """
+    Контекстный менеджер и декоратор: чтение внутри блока идет на одну
+    реплику, выбранную при входе (во вложенном блоке — ту же, что у внешнего).
+    enabled=False оставляет чтение в default (например, при is_sticky()).
+    """
+
+    def __init__(self, enabled=True, alias=None):
+        self.enabled = enabled
+        self.alias = alias
+        self._tokens = []
+
+    def _recreate_cm(self):
+        return read_from_replica(self.enabled)
+
+    def __enter__(self):
+        alias = None
+        aliases = replica_aliases()
+        if self.enabled and aliases:
+            if self.alias not in aliases:
+                outer = _replica_alias.get()
+                self.alias = outer if outer in aliases else random.choice(aliases)
+            alias = self.alias
+        self._tokens.append(_replica_alias.set(alias))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _replica_alias.reset(self._tokens.pop())
+        return False
+
+    def iterate(self, iterable):
+        """Читать с той же реплики и во время потоковой отдачи ответа"""
+        with read_from_replica(self.enabled, self.alias):
+            yield from iterable
+
+
+def replica_method(method):
+    """Декоратор метода-представления (self, request, ...) с чтением с реплики"""
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return replica_response(request, partial(method, self), *args, **kwargs)
+    return wrapper
+
+
+def replica_response(request, view, *args, **kwargs):
+    """Выполнить представление с чтением с реплики (с учетом read-your-writes)"""
+    replica = read_from_replica(not is_sticky(request))
+    with replica:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+            response.render()
+    if getattr(response, 'streaming', False):
+        response.streaming_content = replica.iterate(response.streaming_content)
+    return response
+
+
+class ReplicaRouter:
+    """DATABASE_ROUTERS: чтение внутри read_from_replica() — на реплику блока, запись — в default"""
+
+    def db_for_read(self, model, **hints):
+        alias = _replica_alias.get()
+        if alias is None:
+            return None
+        # Таблица общего кеша (DatabaseCache) — только в default
+        if model._meta.app_label == 'django_cache':
+            return None
+        # Внутри транзакции default читаем ее же данные
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и default
+        pool = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит из default через репликацию
+        if db in replica_aliases():
+            return False
+        return None
+
+
+# ============ ИНТЕГРАЦИЯ С ПРЕДСТАВЛЕНИЯМИ ============
+
+class ReplicaStickinessMiddleware:
+    """Отмечает пользователя после успешных POST/PUT/PATCH/DELETE (read-your-writes)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.should_mark(request, response):
+            await amark_write(request, response)
+        return response
+
+    def process(self, request, response):
+        if self.should_mark(request, response):
+            mark_write(request, response)
+        return response
+
+    def should_mark(self, request, response):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400 and bool(replica_aliases())
+
+
+class ReplicaReadMixin:
+    """
+    Действия DRF viewset'а из replica_actions читают с реплики.
+    Флаг ставится после аутентификации (initial), когда известны действие
+    и пользователь, и действует до конца потоковой отдачи ответа.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if getattr(self, 'action', None) in self.replica_actions:
+            self._replica = read_from_replica(not is_sticky(request))
+            self._replica.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        replica = getattr(self, '_replica', None)
+        if replica is not None:
+            self._replica = None
+            if getattr(response, 'streaming', False):
+                response.streaming_content = replica.iterate(response.streaming_content)
+            replica.__exit__(None, None, None)
+        return response
+
+
+class ReplicaAdminMixin:
+    """Список объектов в админке (GET) читает с реплики"""
+
+    def changelist_view(self, request, extra_context=None):
+        view = super().changelist_view
+        if request.method != 'GET':
+            return view(request, extra_context)
+        return replica_response(request, view, extra_context)
@@ -0,0 +1,168 @@
+"""
+Встроенный планировщик периодических задач без брокера сообщений.
+
+Задачи регистрируются в Scheduler и запускаются командой run_scheduler
+(или фоновым потоком Scheduler.start_thread()). Перед запуском процесс
+берет аренду задачи в таблице job_locks условным UPDATE, поэтому при
+нескольких запущенных планировщиках задача выполняется один раз. Условие
+аренды включает last_run_at, по которому решено, что срок наступил: если
+другой процесс успел выполнить задачу и снять аренду, аренда не берется.
+Если процесс упал, аренда истекает через lock_ttl.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# last_run_at не проверяется при взятии аренды (запуск вне расписания)
+ANY_RUN = object()
+
+
+@dataclass
+class Job:
+    name: str
+    func: callable
+    interval: timedelta = None
+    at: time = None  # ежедневный запуск в указанное локальное время
+    lock_ttl: timedelta = field(default_factory=lambda: timedelta(hours=1))
+
+    def is_due(self, last_run_at, now):
+        if last_run_at is None:
+            return self.at is None or timezone.localtime(now).time() >= self.at
+        if self.at is not None:
+            local_now = timezone.localtime(now)
+            scheduled = timezone.make_aware(datetime.combine(local_now.date(), self.at))
+            return local_now >= scheduled and last_run_at < scheduled
+        return last_run_at + self.interval <= now
+
+
+def acquire_lock(name, owner, ttl, last_run_at=ANY_RUN):
+    """
+    Взять аренду задачи name. True, если аренда получена. last_run_at —
+    время последнего запуска, которое видел вызывающий: если с тех пор
+    задачу выполнили, аренда не берется
+    """
+    from .models import JobLock
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            JobLock.objects.create(name=name, owner=owner, locked_until=now + ttl)
+        return True
+    except IntegrityError:
+        pass
+    # Свободна, если аренда истекла или снята; условный UPDATE атомарен
+    free = Q(locked_until__isnull=True) | Q(locked_until__lt=now) | Q(owner=owner)
+    if last_run_at is None:
+        free &= Q(last_run_at__isnull=True)
+    elif last_run_at is not ANY_RUN:
+        free &= Q(last_run_at=last_run_at)
+    acquired = JobLock.objects.filter(free, name=name).update(owner=owner, locked_until=now + ttl)
+    return acquired == 1
+
+
+def release_lock(name, owner, result=None):
+    from .models import JobLock
+
+    updates = {'locked_until': None}
+    if result is not None:
+        updates.update(last_run_at=timezone.now(), last_result=str(result)[:1000])
+    JobLock.objects.filter(name=name, owner=owner).update(**updates)
+
+
+class Scheduler:
+    def __init__(self, poll_interval=30):
+        self.poll_interval = poll_interval
+        self.jobs = {}
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._stop = threading.Event()
+
+    def register(self, name, func, interval=None, at=None, lock_ttl=None):
+        if (interval is None) == (at is None):
+            raise ValueError('Нужно указать либо interval, либо at')
+        job = Job(name, func, interval, at)
+        if lock_ttl is not None:
+            job.lock_ttl = lock_ttl
+        self.jobs[name] = job
+        return job
+
+    def _last_runs(self):
+        from .models import JobLock
+        return dict(JobLock.objects.filter(name__in=self.jobs).values_list('name', 'last_run_at'))
+
+    def run_job(self, job, last_run_at=ANY_RUN):
+        """
+        Выполнить задачу под арендой. Возвращает результат или None, если задача
+        занята или уже выполнена после last_run_at
+        """
+        if not acquire_lock(job.name, self.owner, job.lock_ttl, last_run_at):
+            logger.info(f"Задача {job.name} выполняется или уже выполнена другим процессом")
+            return None
+        logger.info(f"Задача {job.name}: запуск")
+        try:
+            result = job.func()
+        except Exception:
+            logger.exception(f"Задача {job.name} завершилась с ошибкой")
+            # Время запуска фиксируется: упавшая задача повторится в следующий срок
+            release_lock(job.name, self.owner, result='error')
+            return None
+        release_lock(job.name, self.owner, result=result)
+        logger.info(f"Задача {job.name}: готово ({result})")
+        return result
+
+    def run_pending(self):
+        """Выполнить задачи, срок которых наступил. Возвращает {имя: результат}"""
+        close_old_connections()
+        now = timezone.now()
+        last_runs = self._last_runs()
+        results = {}
+        for name, job in self.jobs.items():
+            last_run_at = last_runs.get(name)
+            if job.is_due(last_run_at, now):
+                results[name] = self.run_job(job, last_run_at)
+        close_old_connections()
+        return results
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                # Недоступность БД не должна останавливать планировщик
+                logger.exception("Ошибка планировщика")
+            self._stop.wait(self.poll_interval)
+
+    def start_thread(self):
+        """Запустить планировщик фоновым потоком текущего процесса"""
+        thread = threading.Thread(target=self.run_forever, name='clinic-scheduler', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def _time_setting(name, default):
+    return time.fromisoformat(getattr(settings, name, default))
+
+
+def build_scheduler(poll_interval=30):
+    """Планировщик со всеми задачами клиники"""
+    from .utils import auto_cancel_unconfirmed_appointments
+
+    scheduler = Scheduler(poll_interval)
+    scheduler.register(
+        'auto_cancel_unconfirmed_appointments', auto_cancel_unconfirmed_appointments,
+        at=_time_setting('AUTO_CANCEL_RUN_AT', '02:00'),
+    )
+    return scheduler
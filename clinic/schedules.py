@@ -0,0 +1,209 @@
+"""
+Рабочие графики врачей для поиска свободных слотов.
+
+Staff.work_schedule — JSON в свободной форме, например {"Monday": "09:00-17:00"}.
+Он компилируется в недельный шаблон: для каждого дня недели — кортеж
+интервалов работы в минутах от начала дня. Шаблоны кешируются в памяти
+процесса по ключу (id, updated_at): сохранение сотрудника меняет updated_at,
+и шаблон компилируется заново, а при совпадении версии JSON графика из БД
+не читается и не разбирается. Исключения StaffScheduleException заменяют
+шаблон на период дат: отпуск, больничный и выходной — нерабочие дни,
+измененные часы — часы из work_hours.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from .slots import DEFAULT_DAY_END, DEFAULT_DAY_START, MINUTES_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+# Ключи дней недели в work_schedule (без учета регистра) -> date.weekday()
+WEEKDAYS = {
+    name: index
+    for index, names in enumerate((
+        ('monday', 'mon', 'понедельник', 'пн'),
+        ('tuesday', 'tue', 'вторник', 'вт'),
+        ('wednesday', 'wed', 'среда', 'ср'),
+        ('thursday', 'thu', 'четверг', 'чт'),
+        ('friday', 'fri', 'пятница', 'пт'),
+        ('saturday', 'sat', 'суббота', 'сб'),
+        ('sunday', 'sun', 'воскресенье', 'вс'),
+    ))
+    for name in names
+}
+
+# Значения дня без приема
+DAY_OFF_VALUES = {'', 'off', 'closed', '-', 'выходной'}
+
+INTERVAL_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})\s*[-–—]\s*(\d{1,2}):(\d{2})$')
+
+DEFAULT_HOURS = ((DEFAULT_DAY_START, DEFAULT_DAY_END),)
+# График не задан — прежнее поведение: каждый день 09:00–17:00
+DEFAULT_TEMPLATE = (DEFAULT_HOURS,) * 7
+
+
+def _minute(hours, minutes):
+    minute = int(hours) * 60 + int(minutes)
+    if int(minutes) > 59 or minute > MINUTES_PER_DAY:
+        raise ValueError
+    return minute
+
+
+@lru_cache(maxsize=1024)
+def parse_hours(value):
+    """
+    Часы работы за день: "09:00-17:00", "09:00-13:00, 14:00-18:00" или
+    выходной ("", "off", "выходной"). Возвращает отсортированный кортеж
+    непересекающихся интервалов (начало, конец) в минутах.
+    """
+    text = (value or '').strip()
+    if text.casefold() in DAY_OFF_VALUES:
+        return ()
+    intervals = []
+    for part in re.split(r'[,;]', text):
+        match = INTERVAL_PATTERN.match(part.strip())
+        try:
+            if match is None:
+                raise ValueError
+            start = _minute(match.group(1), match.group(2))
+            end = _minute(match.group(3), match.group(4))
+        except ValueError:
+            raise ValueError(f'Некорректный интервал времени: "{part.strip()}" (ожидается ЧЧ:ММ-ЧЧ:ММ)')
+        if end <= start:
+            raise ValueError(f'Конец интервала раньше начала: "{part.strip()}"')
+        intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+def compile_schedule(work_schedule, strict=False):
+    """
+    Недельный шаблон из work_schedule: кортеж из 7 кортежей интервалов
+    (индекс — date.weekday()). Дни, отсутствующие в непустом графике, —
+    выходные. strict=True выбрасывает ValueError на некорректных записях,
+    иначе они пропускаются с предупреждением в логе.
+    """
+    if not work_schedule:
+        return DEFAULT_TEMPLATE
+    if not isinstance(work_schedule, dict):
+        if strict:
+            raise ValueError('График должен быть объектом вида {"Monday": "09:00-17:00"}')
+        logger.warning(f"Некорректный график работы: {work_schedule!r}")
+        return DEFAULT_TEMPLATE
+
+    days = [()] * 7
+    for key, value in work_schedule.items():
+        try:
+            weekday = WEEKDAYS.get(str(key).strip().casefold())
+            if weekday is None:
+                raise ValueError(f'Неизвестный день недели: "{key}"')
+            if value is None:
+                value = ''
+            if isinstance(value, (list, tuple)):
+                value = ','.join(value) if value else ''
+            if not isinstance(value, str):
+                raise ValueError(f'Некорректные часы работы для "{key}": {value!r}')
+            days[weekday] = parse_hours(value)
+        except (TypeError, ValueError) as e:
+            if strict:
+                raise ValueError(str(e))
+            logger.warning(f"График работы: запись {key!r} пропущена: {str(e)}")
+    return tuple(days)
+
+
+class ScheduleTemplateCache:
+    """
+    Потокобезопасный LRU-кеш недельных шаблонов по ключу (staff_id, updated_at).
+    Отсутствующие и устаревшие шаблоны компилируются одним запросом.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._templates = OrderedDict()  # staff_id -> (updated_at, шаблон)
+        self._lock = threading.Lock()
+
+    def get_templates(self, versions):
+        """versions — {staff_id: updated_at}; возвращает {staff_id: шаблон}"""
+        result = {}
+        with self._lock:
+            for staff_id, updated_at in versions.items():
+                cached = self._templates.get(staff_id)
+                if cached is not None and cached[0] == updated_at:
+                    self._templates.move_to_end(staff_id)
+                    result[staff_id] = cached[1]
+        missing = [staff_id for staff_id in versions if staff_id not in result]
+        if missing:
+            result.update(self._load(missing))
+        return result
+
+    def _load(self, staff_ids):
+        from .models import Staff
+
+        rows = Staff.objects.filter(pk__in=staff_ids).values_list('pk', 'updated_at', 'work_schedule')
+        loaded = {}
+        with self._lock:
+            for staff_id, updated_at, work_schedule in rows:
+                template = compile_schedule(work_schedule)
+                self._templates[staff_id] = (updated_at, template)
+                self._templates.move_to_end(staff_id)
+                loaded[staff_id] = template
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        # Сотрудник удален между запросами — слотов нет
+        return {staff_id: loaded.get(staff_id, ((),) * 7) for staff_id in staff_ids}
+
+    def invalidate(self, staff_ids=None):
+        """Сбросить шаблоны (после изменения графиков в обход updated_at, например update())"""
+        with self._lock:
+            if staff_ids is None:
+                self._templates.clear()
+                return
+            for staff_id in staff_ids:
+                self._templates.pop(staff_id, None)
+
+
+schedule_cache = ScheduleTemplateCache()
+
+
+def working_hours(versions, dates):
+    """
+    Часы работы сотрудников по датам с учетом исключений:
+    {(staff_id, date): интервалы}. versions — {staff_id: updated_at}.
+    """
+    from .models import ScheduleExceptionKind, StaffScheduleException
+
+    templates = schedule_cache.get_templates(versions)
+    hours = {
+        (staff_id, day): template[day.weekday()]
+        for staff_id, template in templates.items()
+        for day in dates
+    }
+    if not hours:
+        return hours
+
+    exceptions = StaffScheduleException.objects.filter(
+        staff_id__in=list(versions),
+        date_from__lte=max(dates),
+        date_to__gte=min(dates),
+    ).order_by('created_at').values_list('staff_id', 'date_from', 'date_to', 'kind', 'work_hours')
+    for staff_id, date_from, date_to, kind, work_hours in exceptions:
+        override = ()
+        if kind == ScheduleExceptionKind.CHANGED_HOURS:
+            try:
+                override = parse_hours(work_hours)
+            except ValueError as e:
+                logger.warning(f"Исключение из графика {staff_id}: {str(e)}, день считается выходным")
+        # Более позднее исключение перекрывает более раннее
+        for day in dates:
+            if date_from <= day <= date_to:
+                hours[(staff_id, day)] = override
+    return hours
@@ -0,0 +1,135 @@
+"""
+Полнотекстовый поиск пациентов.
+
+На SQLite используется виртуальная таблица FTS5 patients_fts: документ —
+нормализованные ФИО и цифры телефона, запрос — префиксы слов, поэтому
+«иван пет» находит «Иванов Петр». Документы адресуются целым rowid
+(таблица patients_fts_ids сопоставляет его UUID пациента), поэтому
+обновление и удаление документа — поиск по rowid, а не просмотр таблицы.
+Индекс обновляется сигналами Patient и командой rebuild_search_index
+(после bulk_create и миграции данных).
+Зашифрованные номера полиса и паспорта в индекс не попадают: они ищутся
+точным совпадением по слепому индексу.
+На других СУБД поиск выполняется через icontains по тем же полям.
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'patients_fts'
+FTS_IDS_TABLE = 'patients_fts_ids'
+MAX_QUERY_TERMS = 8
+
+_non_word = re.compile(r'[^\w]+')
+_non_digit = re.compile(r'\D+')
+
+
+def normalize_search_text(text):
+    """Регистр, «ё» → «е», знаки препинания → пробел"""
+    return _non_word.sub(' ', (text or '').casefold().replace('ё', 'е')).strip()
+
+
+def patient_document(full_name, phone):
+    """
+    Текст документа FTS: ФИО, группы цифр телефона в записанном виде
+    и все цифры подряд (полностью и без кода страны)
+    """
+    parts = [normalize_search_text(full_name), normalize_search_text(phone)]
+    digits = _non_digit.sub('', phone or '')
+    if digits:
+        parts.append(digits)
+        if len(digits) > 10:
+            parts.append(digits[-10:])
+    return ' '.join(part for part in parts if part)
+
+
+def search_terms(query):
+    return normalize_search_text(query).split()[:MAX_QUERY_TERMS]
+
+
+def fts_match_expression(query):
+    """Выражение MATCH: каждое слово запроса — префикс ("иван"*), все слова обязательны"""
+    return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+
+_fts_ready = set()
+
+
+def fts_enabled(using='default'):
+    """Есть ли таблицы FTS в БД using (положительный результат кешируется)"""
+    if using in _fts_ready:
+        return True
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and {FTS_TABLE, FTS_IDS_TABLE} <= set(connection.introspection.table_names()):
+        _fts_ready.add(using)
+        return True
+    return False
+
+
+def fts_subquery(query):
+    """Подзапрос id пациентов, подходящих под query (для pk__in=...)"""
+    return RawSQL(
+        f'SELECT ids.patient_id FROM {FTS_TABLE} JOIN {FTS_IDS_TABLE} ids ON ids.id = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s',
+        [fts_match_expression(query)],
+    )
+
+
+# ============ СИНХРОНИЗАЦИЯ ИНДЕКСА ============
+
+def _pk(value):
+    # UUIDField на SQLite хранится как 32 шестнадцатеричных символа
+    return value.hex if hasattr(value, 'hex') else str(value).replace('-', '')
+
+
+def index_patients(rows, using='default'):
+    """Добавить или обновить документы: rows — [(pk, full_name, phone)]"""
+    rows = [(_pk(pk), patient_document(full_name, phone)) for pk, full_name, phone in rows]
+    if not rows:
+        return
+    with connections[using].cursor() as cursor:
+        for pk, document in rows:
+            cursor.execute(
+                f'INSERT INTO {FTS_IDS_TABLE} (patient_id) VALUES (%s) '
+                f'ON CONFLICT (patient_id) DO UPDATE SET patient_id = excluded.patient_id RETURNING id',
+                [pk],
+            )
+            rowid = cursor.fetchone()[0]
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [rowid])
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)', [rowid, document])
+
+
+def unindex_patient(pk, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_IDS_TABLE} WHERE patient_id = %s RETURNING id', [_pk(pk)])
+        row = cursor.fetchone()
+        if row is not None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [row[0]])
+
+
+def rebuild_patient_index(queryset, chunk_size=5000, using='default'):
+    """Пересобрать индекс по queryset пациентов. Возвращает число документов"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'DELETE FROM {FTS_IDS_TABLE}')
+    total = 0
+    last_pk = None
+    rows_queryset = queryset.using(using).order_by('pk').values_list('pk', 'full_name', 'phone')
+    while True:
+        batch = rows_queryset if last_pk is None else rows_queryset.filter(pk__gt=last_pk)
+        rows = list(batch[:chunk_size])
+        if not rows:
+            return total
+        numbered = list(enumerate(rows, total + 1))
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_IDS_TABLE} (id, patient_id) VALUES (%s, %s)',
+                [(rowid, _pk(pk)) for rowid, (pk, _, _) in numbered],
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)',
+                [(rowid, patient_document(full_name, phone)) for rowid, (_, full_name, phone) in numbered],
+            )
+        total += len(rows)
+        last_pk = rows[-1][0]
@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from .models import Patient, Staff, Department, Appointment, MedicalRecord, Prescription
+from .schedules import compile_schedule
+from .models import (
+    Patient, Staff, Department, Appointment, MedicalRecord, Prescription, ProcedureRecord, AuditLog, Diagnosis
+)
 
 
 class PatientSerializer(serializers.ModelSerializer):
@@ -7,7 +10,27 @@ class PatientSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Patient
-        fields = '__all__'
+        exclude = ['passport_number_hash', 'insurance_number_hash']
+
+    def _validate_unique_identifier(self, field, value):
+        """Уникальность зашифрованного номера проверяется по слепому индексу"""
+        duplicates = Patient.objects.blind_filter(**{field: value})
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError('Пациент с таким номером уже существует.')
+        return value
+
+    def validate_passport_number(self, value):
+        return self._validate_unique_identifier('passport_number', value)
+
+    def validate_insurance_number(self, value):
+        return self._validate_unique_identifier('insurance_number', value)
+
+
+class DoctorPatientSerializer(PatientSerializer):
+    """Пациент в списке пациентов врача: last_visit — аннотация запроса"""
+    last_visit = serializers.DateField(read_only=True)
 
 
 class StaffSerializer(serializers.ModelSerializer):
@@ -15,6 +38,14 @@ class StaffSerializer(serializers.ModelSerializer):
         model = Staff
         fields = '__all__'
 
+    def validate_work_schedule(self, value):
+        """График должен компилироваться в недельный шаблон (schedules.py)"""
+        try:
+            compile_schedule(value, strict=True)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
 
 class DepartmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,6 +59,35 @@ class AppointmentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class AppointmentBatchItemSerializer(serializers.ModelSerializer):
+    """
+    Элемент пакетной записи на прием (AppointmentViewSet.batch).
+    Пациент, врач и занятость времени проверяются для всего пакета
+    несколькими запросами в представлении, а не запросом на каждый элемент.
+    """
+    patient = serializers.UUIDField()
+    doctor = serializers.UUIDField()
+
+    class Meta:
+        model = Appointment
+        fields = [
+            'patient', 'doctor', 'appointment_date', 'appointment_time',
+            'status', 'reason', 'notes', 'duration_minutes'
+        ]
+        validators = []
+
+    def validate_duration_minutes(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Длительность должна быть положительной.')
+        return value
+
+
+class DiagnosisSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Diagnosis
+        fields = '__all__'
+
+
 class MedicalRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalRecord
@@ -38,3 +98,17 @@ class PrescriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Prescription
         fields = '__all__'
+
+
+class ProcedureRecordSerializer(serializers.ModelSerializer):
+    procedure_name = serializers.CharField(source='procedure.name', read_only=True)
+
+    class Meta:
+        model = ProcedureRecord
+        fields = '__all__'
+
+
+class AuditLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditLog
+        fields = '__all__'
@@ -0,0 +1,108 @@
+"""
+Обработчики сигналов моделей клиники
+"""
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .icd10 import bump_version
+from .models import Appointment, Diagnosis, Patient
+from .rollups import apply_deltas, state_deltas
+from .search import fts_enabled, index_patients, unindex_patient
+from .slots import slot_index
+from .utils import get_encryptor
+
+
+# ============ ПОДКЛЮЧЕНИЕ К БД ============
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """PRAGMA из SQLITE_PRAGMAS для каждого нового подключения к SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    # Напрямую через sqlite3: PRAGMA не попадают в execute_wrapper (бюджет запросов, логи)
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+# ============ ИНДЕКС ЗАНЯТОСТИ ВРАЧЕЙ ============
+
+@receiver(post_save, sender=Appointment)
+def touch_appointment_slot(sender, instance, **kwargs):
+    """Пометить дни приема (прежний и новый) измененными после фиксации транзакции"""
+    # Прежнее состояние: из from_db или remember_appointment_state; сводка перезапишет его позже
+    old = getattr(instance, '_rollup_state', None)
+    new = instance.rollup_state()
+    keys = {(new[1], new[0])}
+    if old is not None:
+        keys.add((old[1], old[0]))
+    transaction.on_commit(partial(slot_index.touch, keys))
+
+
+@receiver(post_delete, sender=Appointment)
+def forget_appointment_slot(sender, instance, **kwargs):
+    state = getattr(instance, '_rollup_state', None) or instance.rollup_state()
+    transaction.on_commit(partial(slot_index.touch, {(state[1], state[0])}))
+
+
+# ============ СВОДКА ПРИЕМОВ ПО ДНЯМ ============
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_state(sender, instance, using, **kwargs):
+    """Прежнее состояние приема, если объект создан не из запроса к БД (например, Appointment(pk=...))"""
+    if instance._state.adding or hasattr(instance, '_rollup_state'):
+        return
+    old = sender.objects.using(using).filter(pk=instance.pk).values_list(*Appointment.ROLLUP_FIELDS).first()
+    instance._rollup_state = old
+
+
+@receiver(post_save, sender=Appointment)
+def update_daily_stats(sender, instance, created, using, **kwargs):
+    old = None if created else getattr(instance, '_rollup_state', None)
+    new = instance.rollup_state()
+    apply_deltas(state_deltas(old, new), using=using)
+    instance._rollup_state = new
+
+
+@receiver(post_delete, sender=Appointment)
+def remove_from_daily_stats(sender, instance, using, **kwargs):
+    old = getattr(instance, '_rollup_state', None) or instance.rollup_state()
+    apply_deltas(state_deltas(old, None), using=using)
+
+
+# ============ ПОЛНОТЕКСТОВЫЙ ПОИСК ПАЦИЕНТОВ ============
+
+@receiver(post_save, sender=Patient)
+def index_patient(sender, instance, using, **kwargs):
+    """Обновить документ FTS в той же транзакции, что и запись пациента"""
+    if fts_enabled(using):
+        index_patients([(instance.pk, instance.full_name, instance.phone)], using=using)
+
+
+@receiver(post_delete, sender=Patient)
+def unindex_deleted_patient(sender, instance, using, **kwargs):
+    if fts_enabled(using):
+        unindex_patient(instance.pk, using=using)
+
+
+# ============ СПРАВОЧНИК МКБ-10 ============
+
+@receiver(post_save, sender=Diagnosis)
+@receiver(post_delete, sender=Diagnosis)
+def invalidate_diagnosis_index(sender, **kwargs):
+    """Новая версия справочника: префиксные индексы процессов перестроятся при следующем поиске"""
+    transaction.on_commit(bump_version)
+
+
+# ============ ШИФРОВАНИЕ ============
+
+@receiver(setting_changed)
+def reset_encryptor(setting, **kwargs):
+    """Пересоздать общий шифратор при смене ключа (override_settings в тестах)"""
+    if setting in ('ENCRYPTION_KEY', 'ENCRYPTION_OLD_KEYS'):
+        get_encryptor.cache_clear()
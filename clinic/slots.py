@@ -0,0 +1,215 @@
+"""
+Индекс занятости врачей для поиска свободных слотов.
+
+Для каждой пары (врач, дата) хранится набор интервалов приемов и битовая
+карта занятости с точностью до минуты. Индекс строится из строк Appointment
+одним запросом на все недостающие дни; сигналы при сохранении, отмене и
+удалении приема помечают день измененным во всех процессах. Часы работы врача по дням
+(недельный шаблон графика и исключения) задает schedules.py.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import time
+from time import monotonic
+
+from django.conf import settings
+
+from .models import Appointment, AppointmentStatus
+from .utils import shared_cache
+
+MINUTES_PER_DAY = 24 * 60
+
+# Статусы, при которых прием занимает время врача
+ACTIVE_STATUSES = (AppointmentStatus.SCHEDULED, AppointmentStatus.CONFIRMED)
+
+# Рабочий день и шаг слотов по умолчанию
+DEFAULT_DAY_START = 9 * 60
+DEFAULT_DAY_END = 17 * 60
+DEFAULT_SLOT_MINUTES = 30
+
+
+def time_to_minute(value):
+    """Время суток -> минута от начала дня"""
+    return value.hour * 60 + value.minute
+
+
+def minute_to_time(minute):
+    """Минута от начала дня -> время суток"""
+    return time(minute // 60, minute % 60)
+
+
+def interval_mask(start, end):
+    """Битовая маска минут [start, end) в пределах суток"""
+    start = max(start, 0)
+    end = min(end, MINUTES_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+class DayOccupancy:
+    """Занятость одного врача за один день"""
+
+    __slots__ = ('intervals', 'bitmap')
+
+    def __init__(self):
+        self.intervals = {}  # appointment_id -> (start, end)
+        self.bitmap = 0
+
+    def add(self, appointment_id, start, end):
+        self.intervals[appointment_id] = (start, end)
+        self.bitmap |= interval_mask(start, end)
+
+    def remove(self, appointment_id):
+        if self.intervals.pop(appointment_id, None) is None:
+            return
+        # Интервалы могут перекрываться, поэтому карту пересобираем целиком
+        bitmap = 0
+        for start, end in self.intervals.values():
+            bitmap |= interval_mask(start, end)
+        self.bitmap = bitmap
+
+    def is_free(self, start, end):
+        return not self.bitmap & interval_mask(start, end)
+
+    def free_slots(self, day_start=DEFAULT_DAY_START, day_end=DEFAULT_DAY_END,
+                   step=DEFAULT_SLOT_MINUTES, duration=DEFAULT_SLOT_MINUTES, hours=None):
+        """
+        Начала свободных слотов длительностью duration с шагом step.
+        hours — интервалы работы (начало, конец) в минутах; по умолчанию [day_start, day_end)
+        """
+        if hours is None:
+            hours = ((day_start, day_end),)
+        return [
+            start
+            for hours_start, hours_end in hours
+            for start in range(hours_start, hours_end - duration + 1, step)
+            if self.is_free(start, start + duration)
+        ]
+
+
+class SlotOccupancyIndex:
+    """
+    Потокобезопасный LRU-индекс занятости по ключу (doctor_id, date).
+
+    Дни подгружаются лениво: запрос сразу по всем отсутствующим в индексе
+    парам врач/дата. Индекс живет в памяти процесса, а актуальность дней
+    сверяется с общими для всех процессов метками в shared-кеше
+    (utils.shared_cache): изменение приема меняет метку его врача (touch),
+    и каждый процесс перечитывает дни этого врача при следующем поиске. Изменения в
+    обход сигналов (update(), SQL) подхватываются не позже чем через ttl
+    секунд. Индекс — только ускорение поиска: при записи на прием
+    пересечения проверяются по БД (check_appointment_conflict).
+    """
+
+    STAMP_PREFIX = 'slots:stamp:'
+    GENERATION_KEY = 'slots:generation'
+
+    def __init__(self, max_days=20000, ttl=300):
+        self.max_days = max_days
+        self.ttl = ttl
+        self._days = OrderedDict()   # (doctor_id, date) -> (метка, время загрузки, DayOccupancy)
+        self._lock = threading.RLock()
+
+    def _stamp_key(self, doctor_id):
+        return f'{self.STAMP_PREFIX}{doctor_id}'
+
+    def _stamps(self, keys):
+        """
+        Текущие метки дней одним обращением к shared-кешу. Метка общая для всех
+        дней врача: пакетная запись на много дней меняет одну метку. Метки нет,
+        пока приемы врача не меняли; если ее вытеснили из кеша, устаревший день
+        живет не дольше ttl
+        """
+        names = {self._stamp_key(doctor_id): doctor_id for doctor_id in {key[0] for key in keys}}
+        found = shared_cache().get_many([self.GENERATION_KEY, *names])
+        generation = found.get(self.GENERATION_KEY)
+        by_doctor = {doctor_id: found.get(name) for name, doctor_id in names.items()}
+        return {key: (generation, by_doctor[key[0]]) for key in keys}
+
+    def get_days(self, doctor_ids, dates):
+        """Занятость для всех сочетаний врачей и дат; недостающие и устаревшие дни грузятся одним запросом"""
+        keys = [(doctor_id, day) for doctor_id in doctor_ids for day in dates]
+        # Метки читаются до строк приемов: запись между ними сменит метку, и день перечитается
+        stamps = self._stamps(keys)
+        now = monotonic()
+        result = {}
+        with self._lock:
+            for key in keys:
+                cached = self._days.get(key)
+                if cached is not None and cached[0] == stamps[key] and now - cached[1] < self.ttl:
+                    self._days.move_to_end(key)
+                    result[key] = cached[2]
+        missing = [key for key in keys if key not in result]
+        if missing:
+            result.update(self._load(missing, stamps, now))
+        return result
+
+    def _load(self, keys, stamps, loaded_at):
+        doctor_ids = {doctor_id for doctor_id, _ in keys}
+        dates = {day for _, day in keys}
+        rows = Appointment.objects.filter(
+            doctor_id__in=doctor_ids,
+            appointment_date__in=dates,
+            status__in=ACTIVE_STATUSES,
+        ).values_list('id', 'doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes')
+
+        loaded = {key: DayOccupancy() for key in keys}
+        for appointment_id, doctor_id, day, start_time, duration in rows:
+            key = (doctor_id, day)
+            if key not in loaded:
+                continue
+            start = time_to_minute(start_time)
+            loaded[key].add(appointment_id, start, start + duration)
+
+        with self._lock:
+            for key, occupancy in loaded.items():
+                self._days[key] = (stamps[key], loaded_at, occupancy)
+                self._days.move_to_end(key)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+        return loaded
+
+    def touch(self, keys):
+        """
+        Отметить дни (doctor_id, date) измененными во всех процессах.
+        Вызывается после фиксации транзакции, изменившей приемы этих дней
+        """
+        keys = {key for key in keys if key[0] is not None}
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._days.pop(key, None)
+        doctor_ids = {doctor_id for doctor_id, _ in keys}
+        shared_cache().set_many({self._stamp_key(doctor_id): uuid.uuid4().hex for doctor_id in doctor_ids}, None)
+
+    def invalidate(self, keys=None):
+        """Сбросить дни (или весь индекс во всех процессах) после массовых изменений в обход сигналов"""
+        if keys is not None:
+            self.touch(keys)
+            return
+        with self._lock:
+            self._days.clear()
+        shared_cache().set(self.GENERATION_KEY, uuid.uuid4().hex, None)
+
+    def available_slots(self, doctor_ids, dates, working_hours=None, **slot_options):
+        """
+        Свободные слоты для нескольких врачей и дат за один проход:
+        {doctor_id: {date: [time, ...]}}.
+        working_hours — {(doctor_id, date): интервалы работы} (schedules.working_hours);
+        без него используется рабочий день по умолчанию.
+        """
+        days = self.get_days(doctor_ids, dates)
+        result = {}
+        for key, occupancy in days.items():
+            doctor_id, day = key
+            hours = working_hours.get(key, ()) if working_hours is not None else None
+            result.setdefault(doctor_id, {})[day] = [
+                minute_to_time(start) for start in occupancy.free_slots(hours=hours, **slot_options)
+            ]
+        return result
+
+
+slot_index = SlotOccupancyIndex(ttl=getattr(settings, 'SLOT_INDEX_TTL', 300))
@@ -1 +1,938 @@
-from django.test import TestCase
\ No newline at end of file
+import base64
+import io
+import itertools
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import async_views
+from .audit import audit_writer
+from .authentication import RoleTokenObtainPairSerializer
+from .benchmarks import BENCHMARK_USERNAME, benchmark_user
+from .fields import Ciphertext
+from .icd10 import bump_version, diagnosis_index
+from .management.commands.rotate_encryption_keys import encrypted_models, rotate_chunk
+from .models import (
+    Appointment, AppointmentDailyStat, AppointmentStatus, AuditLog, CustomUser, Department, Diagnosis, JobLock,
+    MedicalRecord, Patient, Prescription, ScheduleExceptionKind, Staff, StaffScheduleException
+)
+from .pdf import medical_card_cache_key, medical_card_records
+from .querybudget import QueryBudgetExceeded, query_budget
+from .rollups import rebuild_stats
+from .routers import ReplicaRouter, read_from_replica
+from .search import FTS_TABLE, fts_enabled
+from .scheduler import Scheduler
+from .schedules import schedule_cache, working_hours
+from .serializers import PatientSerializer
+from .slots import slot_index
+from .utils import (
+    auto_cancel_unconfirmed_appointments, blind_index, check_appointment_conflict, find_appointment_conflicts,
+    get_encryptor, shared_cache,
+)
+from .views import DepartmentViewSet
+
+_numbers = itertools.count()
+
+# Тесты не пишут PDF в файловый кеш документов
+TEST_CACHES = {**settings.CACHES, 'documents': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_user(role):
+    number = next(_numbers)
+    user = User.objects.create_user(username=f'{role}{number}', password='password')
+    CustomUser.objects.create(user=user, role=role)
+    return user
+
+
+def make_doctor(department=None):
+    user = make_user('doctor')
+    return Staff.objects.create(
+        user=user, full_name=f'Врач {user.pk}', date_of_birth=date(1980, 1, 1), gender='M',
+        position='doctor', license_number=f'LIC-{user.pk}', experience_years=5,
+        department=department, phone='+7 900 000-00-00', email='doctor@example.com',
+    )
+
+
+def make_patient():
+    user = make_user('patient')
+    return Patient.objects.create(
+        user=user, full_name=f'Пациент {user.pk}', date_of_birth=date(1990, 5, 1), gender='F',
+        passport_number=f'45 00 {user.pk:06d}', insurance_number=f'INS-{user.pk}',
+        address='ул. Ленина, 1', phone='+7 999 000-00-00',
+        emergency_contact='Родственник', emergency_phone='+7 999 111-11-11',
+    )
+
+
+def make_appointment(patient, doctor, day, hour, **kwargs):
+    return Appointment.objects.create(
+        patient=patient, doctor=doctor, appointment_date=day, appointment_time=time(hour),
+        reason='Осмотр', **kwargs
+    )
+
+
+def make_record(patient, doctor, diagnosis):
+    record = MedicalRecord.objects.create(
+        patient=patient, doctor=doctor, symptoms='Кашель', diagnosis=diagnosis, treatment_plan='Покой'
+    )
+    Prescription.objects.create(
+        medical_record=record, patient=patient, doctor=doctor, medication_name='Парацетамол',
+        dosage='500 мг', frequency='3 раза в день', duration_days=5, instructions='После еды',
+        valid_until=timezone.now().date() + timedelta(days=30),
+    )
+    return record
+
+
+# ============ БЮДЖЕТ ЗАПРОСОВ ============
+
+class QueryBudgetTests(TestCase):
+
+    def test_context_manager_raises_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(1, 'test'):
+                list(User.objects.all())
+                list(User.objects.all())
+
+    def test_context_manager_within_budget(self):
+        with query_budget(1, 'test') as budget:
+            list(User.objects.all())
+        self.assertEqual(budget.count, 1)
+
+    @override_settings(AUDIT_LOG_ASYNC=False)
+    def test_safe_method_over_budget_raises(self):
+        view = type('TightDepartmentViewSet', (DepartmentViewSet,), {'query_budgets': {'list': 0}})
+        request = APIRequestFactory().get('/api/v1/departments/')
+        force_authenticate(request, make_user('admin'))
+        with self.assertRaises(QueryBudgetExceeded):
+            view.as_view({'get': 'list'})(request)
+
+    @override_settings(AUDIT_LOG_ASYNC=False)
+    def test_write_over_budget_is_logged_not_raised(self):
+        """Изменение уже зафиксировано к моменту проверки — ответ не должен стать 500"""
+        view = type('TightDepartmentViewSet', (DepartmentViewSet,), {'query_budget': 0})
+        request = APIRequestFactory().post('/api/v1/departments/', {
+            'name': 'Терапия', 'description': 'Терапевтическое отделение',
+            'phone': '+7 900 000-00-01', 'cabinet_number': '101',
+        }, format='json')
+        force_authenticate(request, make_user('admin'))
+        with self.assertLogs('clinic.querybudget', logging.WARNING):
+            response = view.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Department.objects.filter(name='Терапия').exists())
+
+
+# ============ ЧИСЛО ЗАПРОСОВ ОПТИМИЗИРОВАННЫХ ЭНДПОИНТОВ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False, CACHES=TEST_CACHES)
+class EndpointQueryCountTests(TestCase):
+    """
+    Эндпоинты проверяются в пределах своих бюджетов (QueryBudgetMixin выбрасывает
+    QueryBudgetExceeded в тестах), а число запросов не должно расти с объемом данных
+    """
+
+    def setUp(self):
+        # Индексы в памяти процесса переживают откат транзакции теста
+        slot_index.invalidate()
+        schedule_cache.invalidate()
+        diagnosis_index.invalidate()
+        bump_version()
+
+        self.department = Department.objects.create(
+            name='Терапия', description='Терапевтическое отделение', phone='+7 900 000-00-01', cabinet_number='101'
+        )
+        self.doctor = make_doctor(self.department)
+        self.patient = make_patient()
+        self.diagnosis = Diagnosis.objects.create(code='J06.9', name='Острая инфекция верхних дыхательных путей')
+        self.day = timezone.now().date() + timedelta(days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    def add_history(self, count):
+        """Приемы, записи и рецепты пациента у новых врачей"""
+        for number in range(count):
+            doctor = make_doctor(self.department)
+            make_appointment(self.patient, doctor, self.day, 9 + number % 8)
+            make_appointment(make_patient(), self.doctor, self.day - timedelta(days=next(_numbers)), 10)
+            make_record(self.patient, doctor, self.diagnosis)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        """Число запросов не зависит от числа строк в ответе (нет N+1)"""
+        self.add_history(2)
+        small = self.count_queries(url)
+        self.add_history(5)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_patient_list(self):
+        self.assertConstantQueries('/api/v1/patients/')
+
+    def test_patient_timeline(self):
+        self.assertConstantQueries(f'/api/v1/patients/{self.patient.pk}/timeline/')
+
+    def test_patient_export_json(self):
+        self.assertConstantQueries(f'/api/v1/patients/{self.patient.pk}/export_json/')
+
+    def test_patient_export_pdf(self):
+        self.assertConstantQueries(f'/api/v1/patients/{self.patient.pk}/export_pdf/')
+
+    def test_patient_medical_records(self):
+        self.assertConstantQueries(f'/api/v1/patients/{self.patient.pk}/medical_records/')
+
+    def test_patient_search(self):
+        self.assertConstantQueries('/api/v1/patients/search/?q=пациент')
+
+    def test_doctor_patients(self):
+        self.assertConstantQueries(f'/api/v1/staff/{self.doctor.pk}/patients/')
+
+    def test_staff_schedule(self):
+        self.assertConstantQueries(f'/api/v1/staff/{self.doctor.pk}/schedule/')
+
+    def test_department_staff_list(self):
+        self.assertConstantQueries(f'/api/v1/departments/{self.department.pk}/staff_list/')
+
+    def test_appointment_list(self):
+        self.assertConstantQueries('/api/v1/appointments/')
+
+    def test_medical_record_list(self):
+        self.assertConstantQueries('/api/v1/medical-records/')
+
+    def test_appointment_stats(self):
+        self.assertConstantQueries('/api/v1/appointments/stats/?group_by=doctor,status')
+
+    def test_available_slots(self):
+        doctors = [self.doctor] + [make_doctor(self.department) for _ in range(4)]
+        for doctor in doctors:
+            make_appointment(self.patient, doctor, self.day, 10)
+        doctor_ids = ','.join(str(doctor.pk) for doctor in doctors)
+        url = f'/api/v1/appointments/available_slots/?doctor_id={doctor_ids}&date={self.day}'
+        self.assertLessEqual(self.count_queries(url), 6)
+        # Повторный поиск обслуживается индексом слотов и кешем графиков
+        self.assertLess(self.count_queries(url), 6)
+
+    def test_diagnosis_autocomplete(self):
+        self.count_queries('/api/v1/diagnoses/autocomplete/?q=J06')
+        with self.assertNumQueries(0):
+            # Версия справочника сверялась только что — ни БД, ни shared-кеша
+            response = self.client.get('/api/v1/diagnoses/autocomplete/?q=остр инф')
+        self.assertEqual([item['code'] for item in response.data], ['J06.9'])
+
+    def test_diagnosis_index_rechecks_version_after_interval(self):
+        self.assertEqual(len(diagnosis_index), 1)
+        # Другой процесс изменил справочник: сигналы этого процесса не сработали
+        Diagnosis.objects.create(code='E11', name='Сахарный диабет 2 типа')
+        shared_cache().set('icd10:version', 'other-process', None)
+        self.assertEqual(diagnosis_index.lookup('E11'), [])
+
+        interval = diagnosis_index.check_interval
+        diagnosis_index.check_interval = 0
+        try:
+            self.assertEqual([item['code'] for item in diagnosis_index.lookup('E11')], ['E11'])
+        finally:
+            diagnosis_index.check_interval = interval
+
+    def test_batch_queries_do_not_grow_with_items(self):
+        def batch(count, start_hour):
+            items = [
+                {
+                    'patient': str(self.patient.pk), 'doctor': str(self.doctor.pk),
+                    'appointment_date': str(self.day), 'appointment_time': f'{start_hour + number // 4:02d}:{number % 4 * 15:02d}',
+                    'reason': 'Курс процедур', 'duration_minutes': 15,
+                }
+                for number in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/v1/appointments/batch/', {'appointments': items}, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+            return len(queries)
+
+        batch(1, 7)  # прогрев кешей
+        self.assertEqual(batch(4, 8), batch(16, 12))
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor, status=AppointmentStatus.SCHEDULED).count(), 21)
+
+
+# ============ ИНДЕКС ЗАНЯТОСТИ И СВОБОДНЫЕ СЛОТЫ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class AvailableSlotsTests(TestCase):
+
+    def setUp(self):
+        slot_index.invalidate()
+        schedule_cache.invalidate()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.now().date() + timedelta(days=1)
+        self.url = f'/api/v1/appointments/available_slots/?doctor_id={self.doctor.pk}&date={self.day}'
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    def slots(self):
+        return self.client.get(self.url).data['available_slots']
+
+    def test_index_follows_bookings_and_cancellations(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_appointment(self.patient, self.doctor, self.day, 10)
+        slots = self.slots()
+        self.assertEqual((slots[0], slots[-1], len(slots)), ('09:00', '16:30', 15))
+        self.assertNotIn('10:00', slots)
+
+        # Индекс уже построен: новые приемы видны через метки дня
+        with self.captureOnCommitCallbacks(execute=True):
+            make_appointment(self.patient, self.doctor, self.day, 11, duration_minutes=60)
+        slots = self.slots()
+        self.assertNotIn('11:00', slots)
+        self.assertNotIn('11:30', slots)
+        self.assertIn('12:00', slots)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = AppointmentStatus.CANCELLED
+            first.save()
+        self.assertIn('10:00', self.slots())
+
+    def test_off_grid_appointment_blocks_overlapping_slots(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment_date=self.day,
+                appointment_time=time(13, 45), reason='Осмотр', duration_minutes=30,
+            )
+        slots = self.slots()
+        self.assertNotIn('13:30', slots)
+        self.assertNotIn('14:00', slots)
+        self.assertIn('13:00', slots)
+        self.assertIn('14:30', slots)
+
+
+# ============ ПРОВЕРКА ПЕРЕСЕЧЕНИЙ ПРИЕМОВ ============
+
+class AppointmentConflictTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = date(2030, 1, 7)
+        self.booked = make_appointment(self.patient, self.doctor, self.day, 10, duration_minutes=60)
+
+    def test_single_check_uses_half_open_intervals(self):
+        def available(hour, minute, duration=30, **kwargs):
+            return check_appointment_conflict(self.doctor, self.day, time(hour, minute), duration, **kwargs)[0]
+
+        self.assertTrue(available(9, 30))
+        self.assertFalse(available(9, 45))
+        self.assertFalse(available(10, 30))
+        self.assertTrue(available(11, 0))
+        self.assertFalse(available(9, 0, duration=180))
+        self.assertTrue(available(10, 0, exclude_id=self.booked.pk))
+
+        self.booked.status = AppointmentStatus.CANCELLED
+        self.booked.save()
+        self.assertTrue(available(10, 0))
+
+    def test_batch_reports_database_and_proposal_conflicts(self):
+        other = make_doctor()
+
+        def proposal(doctor, hour, minute, duration=30):
+            return {
+                'doctor_id': doctor.pk, 'appointment_date': self.day,
+                'appointment_time': time(hour, minute), 'duration_minutes': duration,
+            }
+
+        conflicts = find_appointment_conflicts([
+            proposal(self.doctor, 9, 0),
+            proposal(self.doctor, 10, 30),
+            proposal(self.doctor, 11, 0, 60),
+            proposal(self.doctor, 11, 30),
+            proposal(other, 10, 0),
+        ])
+        self.assertEqual(conflicts, [
+            {'index': 1, 'appointment_id': self.booked.pk},
+            {'index': 3, 'proposal_index': 2},
+        ])
+        self.assertEqual(find_appointment_conflicts([]), [])
+
+
+# ============ ПАКЕТНАЯ ЗАПИСЬ НА ПРИЕМ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class BatchBookingTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.now().date() + timedelta(days=2)
+        make_appointment(self.patient, self.doctor, self.day, 10, duration_minutes=60)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    def item(self, at, **kwargs):
+        return {
+            'patient': str(self.patient.pk), 'doctor': str(self.doctor.pk), 'appointment_date': str(self.day),
+            'appointment_time': at, 'reason': 'Курс процедур', **kwargs,
+        }
+
+    def post(self, payload):
+        return self.client.post('/api/v1/appointments/batch/', payload, format='json')
+
+    def statuses(self, response):
+        return [result['status'] for result in response.data['results']]
+
+    def test_atomic_batch_is_all_or_nothing(self):
+        response = self.post([self.item('08:00'), self.item('10:30'), self.item('12:00')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses(response), ['skipped', 'conflict', 'skipped'])
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_non_atomic_batch_creates_valid_items(self):
+        response = self.post({'atomic': False, 'appointments': [
+            self.item('08:00'),
+            self.item('08:15'),
+            self.item('12:00', duration_minutes=45),
+            self.item('12:00'),
+            self.item('13:00', doctor=str(self.patient.pk)),
+            self.item('not-a-time'),
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.statuses(response), ['created', 'conflict', 'created', 'conflict', 'invalid', 'invalid'])
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 4))
+        self.assertEqual(
+            sorted(Appointment.objects.filter(doctor=self.doctor).values_list('appointment_time', flat=True)),
+            [time(8), time(10), time(12)],
+        )
+
+    def test_rejects_bad_payload(self):
+        self.assertEqual(self.post({'appointments': []}).status_code, 400)
+        self.assertEqual(self.post({'appointments': [self.item('08:00')], 'atomic': 'yes'}).status_code, 400)
+
+
+# ============ PDF МЕДИЦИНСКОЙ КАРТЫ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False, CACHES=TEST_CACHES)
+class MedicalCardPdfTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.diagnosis = Diagnosis.objects.create(code='J06.9', name='Острая инфекция верхних дыхательных путей')
+        make_record(self.patient, self.doctor, self.diagnosis)
+        self.url = f'/api/v1/patients/{self.patient.pk}/export_pdf/'
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    def test_cached_document_is_encrypted(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        key = medical_card_cache_key(self.patient, medical_card_records(self.patient))
+        cached = caches['documents'].get(key)
+        self.assertIsNotNone(cached)
+        self.assertNotIn(b'%PDF', cached)
+        self.assertEqual(self.client.get(self.url).content, response.content)
+
+    def test_related_rename_changes_document(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # update() не меняет updated_at записи — ключ должен учитывать имя врача и диагноз
+        Staff.objects.filter(pk=self.doctor.pk).update(full_name='Новое Имя')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        Diagnosis.objects.filter(pk=self.diagnosis.pk).update(name='Назофарингит')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+# ============ УСЛОВНЫЕ GET-ЗАПРОСЫ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class ConditionalRequestTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        diagnosis = Diagnosis.objects.create(code='J06.9', name='Острая инфекция верхних дыхательных путей')
+        self.old = make_record(self.patient, self.doctor, diagnosis)
+        self.new = make_record(self.patient, self.doctor, diagnosis)
+        self.url = f'/api/v1/patients/{self.patient.pk}/medical_records/'
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    def test_list_revalidates_after_delete(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Удаление старой записи не сдвигает MAX(updated_at)
+        self.old.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        since = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_single_object_keeps_last_modified(self):
+        url = f'/api/v1/patients/{self.patient.pk}/export_csv/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+
+# ============ ASYNC-ПРЕДСТАВЛЕНИЯ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False, CACHES=TEST_CACHES)
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_record(self.patient, self.doctor, None)
+        self.token = str(RoleTokenObtainPairSerializer.get_token(make_user('admin')).access_token)
+
+    async def call(self, view, authorization=None, **kwargs):
+        headers = {'Authorization': authorization} if authorization else {}
+        request = AsyncRequestFactory().get('/', headers=headers)
+        request.session = SessionStore()
+        return await view(request, **kwargs)
+
+    async def test_malformed_authorization_header_is_401(self):
+        for authorization in ('Bearer', 'Bearer a b', 'Bearer not-a-token'):
+            response = await self.call(async_views.patient_medical_records, authorization, pk=self.patient.pk)
+            self.assertEqual(response.status_code, 401, authorization)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+    async def test_views_within_query_budget(self):
+        bearer = f'Bearer {self.token}'
+        for view, pk in (
+            (async_views.patient_medical_records, self.patient.pk),
+            (async_views.patient_prescriptions, self.patient.pk),
+            (async_views.patient_export_json, self.patient.pk),
+            (async_views.patient_export_pdf, self.patient.pk),
+            (async_views.staff_schedule, self.doctor.pk),
+        ):
+            response = await self.call(view, bearer, pk=pk)
+            self.assertEqual(response.status_code, 200, view.__name__)
+
+    async def test_query_budget_counts_async_orm_queries(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            async with query_budget(0, 'test'):
+                await Patient.objects.acount()
+
+
+# ============ ПОИСК ПАЦИЕНТОВ ============
+
+class PatientSearchTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.patient.full_name = 'Иванов Пётр Сергеевич'
+        self.patient.phone = '+7 (912) 345-67-89'
+        self.patient.save()
+
+    def found(self, query):
+        return list(Patient.objects.search(query).values_list('pk', flat=True))
+
+    def test_prefixes_of_name_and_phone(self):
+        self.assertTrue(fts_enabled())
+        self.assertEqual(self.found('иван пет'), [self.patient.pk])
+        self.assertEqual(self.found('9123456789'), [self.patient.pk])
+        self.assertEqual(self.found('петров'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.patient.full_name = 'Сидоров Пётр'
+        self.patient.save()
+        self.assertEqual(self.found('иванов'), [])
+        self.assertEqual(self.found('сидор'), [self.patient.pk])
+
+        other = make_patient()
+        self.patient.delete()
+        self.assertEqual(self.found('сидор'), [])
+        self.assertEqual(self.found(other.full_name), [other.pk])
+
+    def test_document_is_replaced_by_rowid(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            before = cursor.fetchone()[0]
+            self.patient.save()
+            self.patient.save()
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], before)
+            cursor.execute(f'EXPLAIN QUERY PLAN DELETE FROM {FTS_TABLE} WHERE rowid = 1')
+            # Поиск по rowid, а не просмотр всей виртуальной таблицы
+            self.assertTrue(any(row[-1].endswith(':=') for row in cursor.fetchall()))
+
+
+# ============ ХРОНОЛОГИЯ ПАЦИЕНТА ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class PatientTimelineTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.moment = timezone.make_aware(datetime(2030, 1, 7, 10, 0))
+        diagnosis = Diagnosis.objects.create(code='J06.9', name='Острая инфекция верхних дыхательных путей')
+        # События разных типов и несколько событий одного типа в один момент
+        doctors = [make_doctor() for _ in range(3)]
+        appointments = [make_appointment(self.patient, doctor, self.moment.date(), 10) for doctor in doctors]
+        earlier = make_appointment(self.patient, doctors[0], self.moment.date(), 9)
+        records = [make_record(self.patient, doctor, diagnosis) for doctor in doctors]
+        MedicalRecord.objects.filter(patient=self.patient).update(record_date=self.moment)
+        Prescription.objects.filter(patient=self.patient).update(created_at=self.moment)
+        prescriptions = list(Prescription.objects.filter(patient=self.patient))
+
+        def by_id(objects):
+            return [str(obj.pk) for obj in sorted(objects, key=lambda obj: obj.pk, reverse=True)]
+
+        self.expected = by_id(appointments) + by_id(records) + by_id(prescriptions) + [str(earlier.pk)]
+        self.url = f'/api/v1/patients/{self.patient.pk}/timeline/'
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    def test_pages_split_ties_without_gaps_or_repeats(self):
+        for page_size in (1, 2, 4):
+            url, seen = f'{self.url}?page_size={page_size}', []
+            while url:
+                data = self.client.get(url).data
+                self.assertLessEqual(len(data['results']), page_size)
+                seen += [item['id'] for item in data['results']]
+                url = data['next']
+            self.assertEqual(seen, self.expected, page_size)
+
+    def test_types_filter_and_bad_cursor(self):
+        data = self.client.get(f'{self.url}?types=appointment').data
+        self.assertEqual([item['type'] for item in data['results']], ['appointment'] * 4)
+        self.assertEqual(self.client.get(f'{self.url}?types=unknown').status_code, 400)
+
+        for position in ([self.moment.isoformat(), 3, 5], ['2030-01-07T10:00:00', 3, str(self.patient.pk)], [1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            self.assertEqual(self.client.get(f'{self.url}?cursor={cursor}').status_code, 404, position)
+
+
+# ============ KEYSET-ПАГИНАЦИЯ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.now().date()
+        self.appointments = [make_appointment(self.patient, self.doctor, self.day, hour) for hour in range(8, 15)]
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('admin'))
+
+    @staticmethod
+    def cursor(position, reverse=False):
+        data = {'p': position, **({'r': 1} if reverse else {})}
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    def test_pages_cover_rows_once_in_both_directions(self):
+        url, seen, pages = '/api/v1/appointments/?page_size=3', [], []
+        while url:
+            response = self.client.get(url)
+            pages.append(response.data)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [str(appointment.pk) for appointment in self.appointments])
+
+        previous = self.client.get(pages[-1]['previous']).data
+        self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_tampered_cursor_is_404(self):
+        valid_id = str(self.appointments[0].pk)
+        for position in (
+            ['notadate', '08:00:00', valid_id],
+            [{'a': 1}, '08:00:00', valid_id],
+            [str(self.day), '25:99', valid_id],
+            [str(self.day), '08:00:00', 'not-a-uuid'],
+            [str(self.day), None, valid_id],
+            [str(self.day), '08:00:00'],
+            'not-a-list',
+        ):
+            response = self.client.get(f'/api/v1/appointments/?cursor={self.cursor(position)}')
+            self.assertEqual(response.status_code, 404, position)
+        for cursor in ('!!!', base64.urlsafe_b64encode(b'[1]').decode()):
+            self.assertEqual(self.client.get(f'/api/v1/appointments/?cursor={cursor}').status_code, 404)
+
+        response = self.client.get(f'/api/v1/medical-records/?cursor={self.cursor(["yesterday", valid_id])}')
+        self.assertEqual(response.status_code, 404)
+        patients_url = f'/api/v1/staff/{self.doctor.pk}/patients/?ordering=last_visit'
+        self.assertEqual(self.client.get(patients_url).status_code, 200)
+        response = self.client.get(f'{patients_url}&cursor={self.cursor(["x", valid_id])}')
+        self.assertEqual(response.status_code, 404)
+
+
+# ============ ПЛАНИРОВЩИК ============
+
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.schedulers = [Scheduler() for _ in range(2)]
+        for scheduler in self.schedulers:
+            scheduler.register('nightly', lambda: self.calls.append(1) or 'ok', interval=timedelta(hours=1))
+
+    def test_stale_scheduler_does_not_rerun_finished_job(self):
+        first, second = self.schedulers
+        job = second.jobs['nightly']
+        # Второй процесс увидел срок, но первый успел выполнить задачу и снять аренду
+        seen = second._last_runs().get('nightly')
+        self.assertEqual(first.run_pending(), {'nightly': 'ok'})
+        self.assertIsNone(second.run_job(job, seen))
+        self.assertEqual(len(self.calls), 1)
+
+        # Следующий срок: время последнего запуска видно обоим
+        JobLock.objects.filter(name='nightly').update(last_run_at=timezone.now() - timedelta(hours=2))
+        seen = second._last_runs()['nightly']
+        self.assertEqual(second.run_job(job, seen), 'ok')
+        self.assertIsNone(first.run_job(job, seen))
+        self.assertEqual(len(self.calls), 2)
+
+
+# ============ ЖУРНАЛ АУДИТА ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class AuditLogWriterTests(TestCase):
+
+    def test_integrity_error_dumps_only_bad_event(self):
+        events = [
+            AuditLog(action='view', model_name='Patient', object_id=str(number), timestamp=timezone.now())
+            for number in range(7)
+        ]
+        events[4].model_name = None
+        with self.assertLogs('clinic.audit', level='ERROR') as logs:
+            audit_writer.log_events(events)
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list('object_id', flat=True)), ['0', '1', '2', '3', '5', '6']
+        )
+        dumped = [line for line in logs.output if 'не записано' in line]
+        self.assertEqual(len(dumped), 1)
+        self.assertIn('"object_id": "4"', dumped[0])
+
+
+# ============ ШИФРОВАНИЕ И СЛЕПЫЕ ИНДЕКСЫ ============
+
+class EncryptedFieldTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.fields = dict((label, names) for label, _, names in encrypted_models())['clinic.patient']
+
+    def stored(self, field='passport_number'):
+        return Patient.objects.filter(pk=self.patient.pk).values_list(field, flat=True).get()
+
+    def test_round_trip_is_lazy(self):
+        self.assertIn('passport_number', self.fields)
+        stored = self.stored()
+        self.assertNotIn(self.patient.passport_number, stored)
+
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertIsInstance(patient.__dict__['passport_number'], Ciphertext)
+        self.assertEqual(patient.passport_number, self.patient.passport_number)
+
+        # Неизмененное поле не перешифровывается при сохранении
+        Patient.objects.get(pk=self.patient.pk).save()
+        self.assertEqual(self.stored(), stored)
+
+    def test_rotation_keeps_old_rows_readable(self):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(ENCRYPTION_KEY=old_key, ENCRYPTION_OLD_KEYS=[]):
+            self.patient.passport_number = '45 00 999999'
+            self.patient.save()
+            old_token = self.stored()
+
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_OLD_KEYS=[old_key]):
+            self.assertEqual(Patient.objects.get(pk=self.patient.pk).passport_number, '45 00 999999')
+            self.assertFalse(get_encryptor().is_current(old_token))
+            self.assertEqual(rotate_chunk('clinic.patient', self.fields, [self.patient.pk]), 1)
+            self.assertTrue(get_encryptor().is_current(self.stored()))
+
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_OLD_KEYS=[]):
+            self.assertEqual(Patient.objects.get(pk=self.patient.pk).passport_number, '45 00 999999')
+            self.assertEqual(list(Patient.objects.blind_filter(passport_number='4500999999')), [self.patient])
+
+
+class BlindIndexTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+
+    def test_lookup_ignores_formatting(self):
+        number = self.patient.insurance_number.lower().replace('-', ' - ')
+        self.assertEqual(list(Patient.objects.blind_filter(insurance_number=number)), [self.patient])
+        self.assertEqual(list(Patient.objects.search(self.patient.passport_number.replace(' ', ''))), [self.patient])
+
+    def test_duplicate_number_is_rejected(self):
+        serializer = PatientSerializer(instance=make_patient())
+        with self.assertRaises(serializers.ValidationError):
+            serializer.validate_insurance_number(self.patient.insurance_number.lower())
+        self.assertEqual(serializer.validate_insurance_number('INS-NEW'), 'INS-NEW')
+
+        duplicate = make_patient()
+        duplicate.passport_number = self.patient.passport_number.replace(' ', '-')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            duplicate.save()
+
+    def test_digest_depends_on_dedicated_key(self):
+        with override_settings(BLIND_INDEX_KEY='first'):
+            first = blind_index('INS-1')
+        with override_settings(BLIND_INDEX_KEY='second'):
+            self.assertNotEqual(blind_index('INS-1'), first)
+        with override_settings(BLIND_INDEX_KEY='first', SECRET_KEY='rotated'):
+            self.assertEqual(blind_index('INS-1'), first)
+
+
+# ============ ИСКЛЮЧЕНИЯ ИЗ ГРАФИКА ============
+
+class ScheduleExceptionTests(TestCase):
+
+    def setUp(self):
+        schedule_cache.invalidate()
+        self.doctor = make_doctor()
+        self.day = date(2030, 1, 7)
+
+    def add_exception(self, kind, work_hours=''):
+        return StaffScheduleException.objects.create(
+            staff=self.doctor, date_from=self.day, date_to=self.day, kind=kind, work_hours=work_hours
+        )
+
+    def hours(self):
+        return working_hours({self.doctor.pk: self.doctor.updated_at}, [self.day])[(self.doctor.pk, self.day)]
+
+    def test_only_changed_hours_keep_work_hours(self):
+        self.add_exception(ScheduleExceptionKind.CHANGED_HOURS, '10:00-14:00')
+        self.assertEqual(self.hours(), ((600, 840),))
+        # Часы, оставшиеся у отпуска (например, после смены вида), не делают день рабочим
+        self.add_exception(ScheduleExceptionKind.VACATION, '10:00-14:00')
+        self.assertEqual(self.hours(), ())
+
+    def test_non_working_kinds(self):
+        for kind in (ScheduleExceptionKind.VACATION, ScheduleExceptionKind.SICK_LEAVE, ScheduleExceptionKind.DAY_OFF):
+            exception = self.add_exception(kind)
+            self.assertEqual(self.hours(), (), kind)
+            exception.delete()
+
+    def test_clean_checks_work_hours_by_kind(self):
+        def clean(kind, work_hours):
+            StaffScheduleException(
+                staff=self.doctor, date_from=self.day, date_to=self.day, kind=kind, work_hours=work_hours
+            ).clean()
+
+        clean(ScheduleExceptionKind.SICK_LEAVE, '')
+        clean(ScheduleExceptionKind.CHANGED_HOURS, '09:00-13:00, 14:00-16:00')
+        for kind, work_hours in (
+            (ScheduleExceptionKind.VACATION, '10:00-14:00'),
+            (ScheduleExceptionKind.CHANGED_HOURS, ''),
+            (ScheduleExceptionKind.CHANGED_HOURS, '14:00-10:00'),
+        ):
+            with self.assertRaises(ValidationError):
+                clean(kind, work_hours)
+
+
+# ============ СВОДКА ПРИЕМОВ ПО ДНЯМ ============
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class AppointmentRollupTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.now().date()
+
+    def stats(self):
+        return {
+            (row.date, row.status): (row.count, row.booked_minutes)
+            for row in AppointmentDailyStat.objects.filter(doctor=self.doctor) if row.count
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.stats()
+        rebuild_stats()
+        self.assertEqual(incremental, self.stats())
+        return incremental
+
+    def test_signal_deltas(self):
+        first = make_appointment(self.patient, self.doctor, self.day, 9)
+        second = make_appointment(self.patient, self.doctor, self.day, 10, duration_minutes=45)
+        self.assertEqual(self.stats(), {(self.day, AppointmentStatus.SCHEDULED): (2, 75)})
+
+        first.status = AppointmentStatus.CONFIRMED
+        first.save()
+        second.appointment_date = self.day + timedelta(days=1)
+        second.duration_minutes = 60
+        second.save()
+        self.assertEqual(self.assertMatchesRebuild(), {
+            (self.day, AppointmentStatus.CONFIRMED): (1, 30),
+            (self.day + timedelta(days=1), AppointmentStatus.SCHEDULED): (1, 60),
+        })
+
+        Appointment.objects.get(pk=second.pk).delete()
+        self.assertEqual(self.assertMatchesRebuild(), {(self.day, AppointmentStatus.CONFIRMED): (1, 30)})
+
+    def test_bulk_auto_cancel_applies_deltas(self):
+        for hour in (9, 10, 11):
+            make_appointment(self.patient, self.doctor, self.day - timedelta(days=1), hour)
+        make_appointment(self.patient, self.doctor, self.day + timedelta(days=3), 9)
+
+        self.assertEqual(auto_cancel_unconfirmed_appointments(chunk_size=2), 3)
+        self.assertEqual(self.assertMatchesRebuild(), {
+            (self.day - timedelta(days=1), AppointmentStatus.CANCELLED): (3, 90),
+            (self.day + timedelta(days=3), AppointmentStatus.SCHEDULED): (1, 30),
+        })
+
+
+# ============ ЗАМЕРЫ ПРОИЗВОДИТЕЛЬНОСТИ ============
+
+class BenchmarkCommandTests(TestCase):
+
+    def test_benchmark_user_is_created_only_on_request(self):
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', repeat=1, warmup=0, stdout=io.StringIO())
+        self.assertIsNone(benchmark_user())
+        self.assertFalse(User.objects.filter(username=BENCHMARK_USERNAME).exists())
+
+        user = benchmark_user(create=True)
+        self.assertTrue(user.is_superuser)
+        self.assertEqual(benchmark_user(), user)
+
+
+# ============ ЧТЕНИЕ С РЕПЛИК ============
+
+@override_settings(REPLICA_DATABASES=[f'replica{number}' for number in range(8)])
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def read_alias(self):
+        return self.router.db_for_read(Patient)
+
+    def test_one_replica_per_block(self):
+        self.assertIsNone(self.read_alias())
+        chosen = set()
+        for _ in range(20):
+            replica = read_from_replica()
+            with replica:
+                alias = self.read_alias()
+                self.assertEqual({self.read_alias() for _ in range(20)}, {alias})
+                with read_from_replica():
+                    self.assertEqual(self.read_alias(), alias)
+                with read_from_replica(False):
+                    self.assertIsNone(self.read_alias())
+            chosen.add(alias)
+            # Потоковая отдача после выхода из блока — с той же реплики
+            self.assertEqual(list(replica.iterate(self.read_alias() for _ in range(3))), [alias] * 3)
+            self.assertIsNone(self.read_alias())
+        self.assertGreater(len(chosen), 1)
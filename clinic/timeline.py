@@ -0,0 +1,191 @@
+"""
+Хронология пациента: приемы, медицинские записи, рецепты и выполненные
+процедуры одной лентой, от новых к старым.
+
+Каждая таблица читается своим потоком по индексу (patient, дата) порциями
+keyset; потоки объединяются k-путевым слиянием heapq.merge, поэтому для
+страницы читается не больше page_size + 1 строк из каждой таблицы,
+независимо от длины истории. Порядок ленты — (момент, тип, id) по убыванию;
+курсор хранит эту тройку для последнего элемента страницы и однозначно
+задает продолжение в каждом потоке.
+"""
+import base64
+import heapq
+import json
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+
+from .models import Appointment, MedicalRecord, Prescription, ProcedureRecord
+from .serializers import (
+    AppointmentSerializer, MedicalRecordSerializer, PrescriptionSerializer, ProcedureRecordSerializer
+)
+
+
+class TimelineSource:
+    """Поток одной таблицы: rank упорядочивает типы при совпадении момента"""
+    kind = None
+    rank = None
+    model = None
+    serializer_class = None
+
+    def queryset(self, patient):
+        return self.model.objects.filter(patient=patient)
+
+    def ordering(self):
+        raise NotImplementedError
+
+    def moment(self, obj):
+        raise NotImplementedError
+
+    def before(self, moment, inclusive):
+        """Условие «момент раньше moment» (или не позже — при inclusive)"""
+        raise NotImplementedError
+
+    def after_position(self, position):
+        """Строки потока, идущие в ленте после position = (момент, rank, id)"""
+        moment, rank, last_id = position
+        if self.rank < rank:
+            return self.before(moment, inclusive=True)
+        if self.rank > rank:
+            return self.before(moment, inclusive=False)
+        return self.before(moment, inclusive=False) | (self.at(moment) & Q(id__lt=last_id))
+
+    def rows(self, patient, position, chunk_size):
+        """Строки потока по убыванию момента, порциями по chunk_size"""
+        queryset = self.queryset(patient).order_by(*self.ordering())
+        while True:
+            batch = queryset if position is None else queryset.filter(self.after_position(position))
+            rows = list(batch[:chunk_size])
+            for obj in rows:
+                yield (self.moment(obj), self.rank, obj.id), self, obj
+            if len(rows) < chunk_size:
+                return
+            position = (self.moment(rows[-1]), self.rank, rows[-1].id)
+
+
+class DateTimeSource(TimelineSource):
+    field = None
+
+    def ordering(self):
+        return (f'-{self.field}', '-id')
+
+    def moment(self, obj):
+        return getattr(obj, self.field)
+
+    def at(self, moment):
+        return Q(**{self.field: moment})
+
+    def before(self, moment, inclusive):
+        return Q(**{f'{self.field}__{"lte" if inclusive else "lt"}': moment})
+
+
+class AppointmentSource(TimelineSource):
+    """Момент приема — дата и время в часовом поясе клиники"""
+    kind = 'appointment'
+    rank = 3
+    model = Appointment
+    serializer_class = AppointmentSerializer
+
+    def ordering(self):
+        return ('-appointment_date', '-appointment_time', '-id')
+
+    def moment(self, obj):
+        return timezone.make_aware(datetime.combine(obj.appointment_date, obj.appointment_time))
+
+    def _local(self, moment):
+        local = timezone.localtime(moment)
+        return local.date(), local.time()
+
+    def at(self, moment):
+        day, at_time = self._local(moment)
+        return Q(appointment_date=day, appointment_time=at_time)
+
+    def before(self, moment, inclusive):
+        day, at_time = self._local(moment)
+        lookup = 'lte' if inclusive else 'lt'
+        return Q(appointment_date__lt=day) | Q(appointment_date=day, **{f'appointment_time__{lookup}': at_time})
+
+
+class MedicalRecordSource(DateTimeSource):
+    kind = 'medical_record'
+    rank = 2
+    model = MedicalRecord
+    serializer_class = MedicalRecordSerializer
+    field = 'record_date'
+
+
+class PrescriptionSource(DateTimeSource):
+    kind = 'prescription'
+    rank = 1
+    model = Prescription
+    serializer_class = PrescriptionSerializer
+    field = 'created_at'
+
+
+class ProcedureRecordSource(DateTimeSource):
+    kind = 'procedure'
+    rank = 0
+    model = ProcedureRecord
+    serializer_class = ProcedureRecordSerializer
+    field = 'performed_date'
+
+    def queryset(self, patient):
+        return super().queryset(patient).select_related('procedure')
+
+
+TIMELINE_SOURCES = {
+    source.kind: source
+    for source in (AppointmentSource(), MedicalRecordSource(), PrescriptionSource(), ProcedureRecordSource())
+}
+
+
+# ============ КУРСОР ============
+
+def encode_cursor(position):
+    moment, rank, last_id = position
+    data = [moment.isoformat(), rank, str(last_id)]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(encoded):
+    try:
+        moment, rank, last_id = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        moment = datetime.fromisoformat(moment)
+        if timezone.is_naive(moment) or not isinstance(rank, int):
+            raise ValueError
+        return moment, rank, uuid.UUID(last_id)
+    except (AttributeError, TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound('Некорректный курсор')
+
+
+def patient_timeline(patient, position=None, page_size=50, kinds=None):
+    """
+    Страница хронологии: ([(источник, объект)], позиция следующей страницы или None).
+    kinds ограничивает типы событий.
+    """
+    sources = [source for kind, source in TIMELINE_SOURCES.items() if not kinds or kind in kinds]
+    # Каждый поток читает по page_size + 1: обычно один запрос на таблицу
+    streams = [source.rows(patient, position, page_size + 1) for source in sources]
+    items = []
+    for key, source, obj in heapq.merge(*streams, key=lambda item: item[0], reverse=True):
+        if len(items) == page_size:
+            return items, position
+        items.append((source, obj))
+        position = key
+    return items, None
+
+
+def serialize_timeline(items):
+    return [
+        {
+            'type': source.kind,
+            'moment': source.moment(obj).isoformat(),
+            'id': str(obj.id),
+            'data': source.serializer_class(obj).data,
+        }
+        for source, obj in items
+    ]
@@ -1,31 +1,25 @@
+import base64
 import logging
 import hashlib
+import hmac
 import json
 from datetime import datetime
-from .models import AuditLog
+from functools import lru_cache
+from .audit import log_audit  # noqa: F401 — единая точка записи аудита
 from django.utils import timezone
 from django.conf import settings
-from cryptography.fernet import Fernet
+from django.core.cache import caches
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 
 logger = logging.getLogger(__name__)
 
 
-def log_audit(user, action, model_name, object_id, changes=None, ip_address=None):
+def shared_cache():
     """
-    Логирование действий в системе для аудита
+    Кеш, общий для всех процессов (SHARED_CACHE_ALIAS): метки актуальности
+    индексов в памяти процессов и признаки read-your-writes
     """
-    try:
-        AuditLog.objects.create(
-            user=user,
-            action=action,
-            model_name=model_name,
-            object_id=str(object_id),
-            changes=changes or {},
-            ip_address=ip_address,
-            timestamp=timezone.now()
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при логировании действия: {str(e)}")
+    return caches[getattr(settings, 'SHARED_CACHE_ALIAS', 'default')]
 
 
 def get_client_ip(request):
@@ -38,13 +32,57 @@ def get_client_ip(request):
     return ip
 
 
+def _fernet_key(key):
+    """
+    Ключ Fernet из настройки: корректный ключ используется как есть,
+    произвольная строка-секрет (например, заглушка при DEBUG) приводится
+    к ключу через SHA-256 с предупреждением в лог
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    try:
+        Fernet(key)
+        return key
+    except ValueError:
+        logger.warning(
+            "Ключ шифрования не является ключом Fernet и выведен из строки через SHA-256; "
+            "задайте ключ Fernet.generate_key()"
+        )
+        return base64.urlsafe_b64encode(hashlib.sha256(key).digest())
+
+
 class DataEncryption:
-    """Класс для шифрования чувствительных данных пациентов"""
+    """
+    Класс для шифрования чувствительных данных пациентов.
 
-    def __init__(self, key=None):
+    Шифрование всегда выполняется основным ключом (ENCRYPTION_KEY),
+    расшифровка — любым из ключей, включая выведенные из оборота
+    (ENCRYPTION_OLD_KEYS), что позволяет менять ключ без простоя.
+    """
+
+    def __init__(self, key=None, old_keys=None):
         if key is None:
-            key = settings.ENCRYPTION_KEY.encode() if hasattr(settings, 'ENCRYPTION_KEY') else Fernet.generate_key()
-        self.cipher = Fernet(key)
+            key = settings.ENCRYPTION_KEY if hasattr(settings, 'ENCRYPTION_KEY') else Fernet.generate_key()
+        if old_keys is None:
+            old_keys = getattr(settings, 'ENCRYPTION_OLD_KEYS', [])
+        self._primary_key = _fernet_key(key)
+        self.primary = Fernet(self._primary_key)
+        self.cipher = MultiFernet([self.primary] + [Fernet(_fernet_key(k)) for k in old_keys])
+
+    @property
+    def key_fingerprint(self):
+        """Отпечаток основного ключа (для контрольных точек ротации)"""
+        return hashlib.sha256(self._primary_key).hexdigest()[:16]
+
+    def is_current(self, encrypted_data):
+        """Зашифровано ли значение основным ключом"""
+        if isinstance(encrypted_data, str):
+            encrypted_data = encrypted_data.encode()
+        try:
+            self.primary.decrypt(encrypted_data)
+            return True
+        except InvalidToken:
+            return False
 
     def encrypt(self, data):
         """Шифрование данных"""
@@ -68,17 +106,46 @@ class DataEncryption:
             logger.error(f"Ошибка при расшифровке данных: {str(e)}")
             raise
 
+    def encrypt_many(self, values):
+        """Шифрование списка значений (пустые значения не шифруются)"""
+        return [self.encrypt(value) if value else value for value in values]
+
+    def decrypt_many(self, values):
+        """Расшифровка списка значений (пустые значения возвращаются как есть)"""
+        return [self.decrypt(value) if value else value for value in values]
+
+
+@lru_cache(maxsize=None)
+def get_encryptor():
+    """Общий для процесса экземпляр DataEncryption"""
+    return DataEncryption()
+
 
 def encrypt_data(data):
     """Функция для шифрования данных"""
-    encryptor = DataEncryption()
-    return encryptor.encrypt(data)
+    return get_encryptor().encrypt(data)
 
 
 def decrypt_data(encrypted_data):
     """Функция для расшифровки данных"""
-    encryptor = DataEncryption()
-    return encryptor.decrypt(encrypted_data)
+    return get_encryptor().decrypt(encrypted_data)
+
+
+def normalize_identifier(value):
+    """Нормализация номера документа для поиска: без пробелов и дефисов, в верхнем регистре"""
+    return ''.join(str(value).split()).replace('-', '').upper()
+
+
+def blind_index(value):
+    """
+    Слепой индекс (HMAC-SHA256) для точного поиска по зашифрованному значению.
+    Ключ — BLIND_INDEX_KEY; производный от SECRET_KEY допускается только при
+    DEBUG (без DEBUG настройки не загрузятся без BLIND_INDEX_KEY)
+    """
+    if not value:
+        return None
+    key = getattr(settings, 'BLIND_INDEX_KEY', None) or 'blind-index:' + settings.SECRET_KEY
+    return hmac.new(key.encode(), normalize_identifier(value).encode(), hashlib.sha256).hexdigest()
 
 
 def validate_patient_age(date_of_birth):
@@ -125,60 +192,181 @@ def generate_digital_signature(data, key):
     return signature
 
 
-def check_appointment_conflict(doctor, appointment_date, appointment_time, duration):
+def _active_appointments_with_minutes(**filters):
+    """
+    Активные приемы с началом и концом в минутах от начала дня,
+    вычисленными на стороне БД
+    """
+    from django.db.models import F, IntegerField, ExpressionWrapper
+    from django.db.models.functions import ExtractHour, ExtractMinute
+    from .models import Appointment
+    from .slots import ACTIVE_STATUSES
+
+    start_minute = ExpressionWrapper(
+        ExtractHour('appointment_time') * 60 + ExtractMinute('appointment_time'),
+        output_field=IntegerField()
+    )
+    return Appointment.objects.filter(
+        status__in=ACTIVE_STATUSES, **filters
+    ).annotate(
+        start_minute=start_minute
+    ).annotate(
+        end_minute=ExpressionWrapper(F('start_minute') + F('duration_minutes'), output_field=IntegerField())
+    )
+
+
+def check_appointment_conflict(doctor, appointment_date, appointment_time, duration, exclude_id=None):
     """
     Проверка конфликтов приемов у врача
     Предотвращение пересечения приемов
     """
-    from .models import Appointment
-    from datetime import datetime, timedelta
+    from .slots import time_to_minute
 
-    # Комбинируем дату и время
-    appointment_datetime = datetime.combine(appointment_date, appointment_time)
-    appointment_end = appointment_datetime + timedelta(minutes=duration)
+    start = time_to_minute(appointment_time)
+    end = start + duration
 
-    # Ищем пересекающиеся приемы
-    conflicts = Appointment.objects.filter(
+    # Пересечение [start, end) с существующими приемами проверяется одним запросом
+    conflicts = _active_appointments_with_minutes(
         doctor=doctor,
         appointment_date=appointment_date,
-        status__in=['scheduled', 'confirmed']
-    )
+    ).filter(start_minute__lt=end, end_minute__gt=start)
+    if exclude_id is not None:
+        conflicts = conflicts.exclude(id=exclude_id)
 
-    for conflict in conflicts:
-        conflict_datetime = datetime.combine(
-            conflict.appointment_date,
-            conflict.appointment_time
-        )
-        conflict_end = conflict_datetime + timedelta(minutes=conflict.duration_minutes)
-
-        # Проверяем пересечение
-        if not (appointment_end <= conflict_datetime or appointment_datetime >= conflict_end):
-            return False, f"Конфликт с приемом в {conflict.appointment_time}"
+    conflict_time = conflicts.order_by('appointment_time').values_list('appointment_time', flat=True).first()
+    if conflict_time is not None:
+        return False, f"Конфликт с приемом в {conflict_time}"
 
     return True, "Прием возможен"
 
 
-def auto_cancel_unconfirmed_appointments():
+def find_appointment_conflicts(proposals):
+    """
+    Массовая проверка конфликтов для списка предлагаемых приемов.
+
+    proposals — последовательность словарей с ключами doctor_id,
+    appointment_date, appointment_time и duration_minutes (по умолчанию 30).
+    Существующие приемы загружаются одним запросом, затем для каждого дня
+    врача выполняется проход по интервалам, отсортированным по началу.
+
+    Возвращает список конфликтов вида
+    {'index': i, 'appointment_id': id} — пересечение с приемом в БД, или
+    {'index': i, 'proposal_index': j} — пересечение с другим предложением.
     """
-    Периодическая задача (Celery) для автоматической отмены
-    неподтвержденных приемов за 24 часа до начала
+    from collections import defaultdict
+    from .slots import time_to_minute
+
+    if not proposals:
+        return []
+
+    # (doctor_id, date) -> [(start, end, kind, ref)]; kind 0 — существующий прием, 1 — предложение
+    intervals = defaultdict(list)
+    for index, proposal in enumerate(proposals):
+        start = time_to_minute(proposal['appointment_time'])
+        end = start + proposal.get('duration_minutes', 30)
+        key = (proposal['doctor_id'], proposal['appointment_date'])
+        intervals[key].append((start, end, 1, index))
+
+    doctor_ids = {doctor_id for doctor_id, _ in intervals}
+    dates = {day for _, day in intervals}
+    existing = _active_appointments_with_minutes(
+        doctor_id__in=doctor_ids,
+        appointment_date__in=dates,
+    ).values_list('id', 'doctor_id', 'appointment_date', 'start_minute', 'end_minute')
+    for appointment_id, doctor_id, day, start, end in existing:
+        key = (doctor_id, day)
+        if key in intervals:
+            intervals[key].append((start, end, 0, appointment_id))
+
+    conflicts = []
+    for day_intervals in intervals.values():
+        day_intervals.sort(key=lambda item: (item[0], item[1]))
+        active = []  # интервалы, которые еще не закончились к текущему началу
+        for start, end, kind, ref in day_intervals:
+            active = [item for item in active if item[1] > start]
+            for _, _, other_kind, other_ref in active:
+                if kind == 0 and other_kind == 0:
+                    continue
+                if kind == 1 and other_kind == 1:
+                    first, second = sorted((ref, other_ref))
+                    conflicts.append({'index': second, 'proposal_index': first})
+                elif kind == 1:
+                    conflicts.append({'index': ref, 'appointment_id': other_ref})
+                else:
+                    conflicts.append({'index': other_ref, 'appointment_id': ref})
+            active.append((start, end, kind, ref))
+
+    conflicts.sort(key=lambda item: item['index'])
+    return conflicts
+
+
+AUTO_CANCEL_CHUNK_SIZE = 1000
+
+
+def auto_cancel_unconfirmed_appointments(chunk_size=AUTO_CANCEL_CHUNK_SIZE):
     """
-    from .models import Appointment
+    Периодическая задача (см. scheduler.py): отмена неподтвержденных
+    приемов за 24 часа до начала.
+
+    Приемы отменяются порциями: в одной транзакции выбираются и блокируются
+    chunk_size идентификаторов, затем один UPDATE и пакетная запись аудита.
+    Возвращает число отмененных приемов.
+    """
+    from .audit import audit_writer
+    from .models import Appointment, AppointmentStatus, AuditLog
+    from .rollups import apply_deltas, merge_deltas, state_deltas
+    from .slots import slot_index
+    from collections import defaultdict
     from datetime import timedelta
+    from django.db import transaction
 
     threshold = timezone.now() + timedelta(hours=24)
-
     unconfirmed = Appointment.objects.filter(
-        status='scheduled',
+        status=AppointmentStatus.SCHEDULED,
         appointment_date__lt=threshold.date()
-    )
+    ).order_by('pk')
+
+    total = 0
+    last_pk = None
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            batch = unconfirmed if last_pk is None else unconfirmed.filter(pk__gt=last_pk)
+            # FOR UPDATE: прием, подтвержденный параллельно, не попадет в аудит как отмененный
+            rows = list(
+                batch.select_for_update()
+                .values_list('pk', 'appointment_date', 'doctor_id', 'duration_minutes')[:chunk_size]
+            )
+            if not rows:
+                break
+            pks = [row[0] for row in rows]
+            # update() не вызывает сигналы и auto_now — updated_at и сводка обновляются явно
+            Appointment.objects.filter(pk__in=pks).update(
+                status=AppointmentStatus.CANCELLED, updated_at=now
+            )
+            deltas = defaultdict(lambda: [0, 0])
+            for _, day, doctor_id, duration in rows:
+                merge_deltas(deltas, state_deltas(
+                    (day, doctor_id, AppointmentStatus.SCHEDULED, duration),
+                    (day, doctor_id, AppointmentStatus.CANCELLED, duration),
+                ))
+            apply_deltas(deltas)
+
+        audit_writer.log_events(
+            AuditLog(
+                action='auto_cancel', model_name='Appointment', object_id=str(pk),
+                changes={'status': [AppointmentStatus.SCHEDULED, AppointmentStatus.CANCELLED]},
+                timestamp=now,
+            )
+            for pk in pks
+        )
+        slot_index.touch({(doctor_id, day) for _, day, doctor_id, _ in rows})
 
-    for appointment in unconfirmed:
-        appointment.status = 'cancelled'
-        appointment.save()
-        log_audit(None, 'auto_cancel', 'Appointment', str(appointment.id))
+        total += len(pks)
+        last_pk = pks[-1]
 
-    return f"Отменено приемов: {unconfirmed.count()}"
+    logger.info(f"Автоотмена: отменено приемов {total}")
+    return total
 
 
 def validate_contact_data(email, phone):
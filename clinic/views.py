@@ -1,84 +1,232 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.utils.urls import replace_query_param
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
 from django.contrib.auth.models import User
 from django.http import HttpResponse, FileResponse
 from django.utils import timezone
+from collections import defaultdict
 from datetime import datetime, timedelta, time
 import csv
+import uuid
 from io import StringIO
 
 from .models import (
     Patient, Staff, Appointment, MedicalRecord, Prescription,
-    Department, Diagnosis
+    Department, Diagnosis, AuditLog, AppointmentDailyStat, AppointmentStatus, PositionChoice
 )
 from .serializers import (
     PatientSerializer, StaffSerializer, AppointmentSerializer,
-    MedicalRecordSerializer, PrescriptionSerializer, DepartmentSerializer
+    MedicalRecordSerializer, PrescriptionSerializer, DepartmentSerializer,
+    AuditLogSerializer, DiagnosisSerializer, DoctorPatientSerializer, AppointmentBatchItemSerializer
+)
+from .pagination import (
+    AppointmentPagination, MedicalRecordPagination, AuditLogPagination, DoctorPatientPagination
+)
+from .permissions import IsAdmin, IsStaff
+from .querybudget import QueryBudgetMixin
+from .routers import ReplicaReadMixin
+from .audit import audit_writer, log_audit
+from .rollups import apply_deltas, merge_deltas, state_deltas
+from .slots import ACTIVE_STATUSES, slot_index
+from .schedules import working_hours
+from .utils import check_appointment_conflict, find_appointment_conflicts
+from .icd10 import diagnosis_index
+from .exports import streaming_export_response
+from .pdf import get_medical_card_pdf, medical_card_cache_key, medical_card_records
+from .conditional import Validators
+from .timeline import (
+    TIMELINE_SOURCES, patient_timeline, serialize_timeline,
+    decode_cursor as decode_timeline_cursor, encode_cursor as encode_timeline_cursor
 )
 
 import logging
 logger = logging.getLogger(__name__)
 
-
-def log_audit(user, action, model, object_id):
-    """Простая функция логирования"""
-    try:
-        logger.info(f"User {user} performed {action} on {model} {object_id}")
-    except:
-        pass
+# Максимальная длина периода поиска свободных слотов
+MAX_SLOT_SEARCH_DAYS = 31
+# Период статистики приемов: по умолчанию и максимальный
+STATS_DEFAULT_DAYS = 30
+MAX_STATS_DAYS = 366
+# Пакетная запись на прием: максимум элементов и размер пакета INSERT
+MAX_BATCH_APPOINTMENTS = 2000
+BATCH_INSERT_SIZE = 500
+# Измерения группировки статистики → поле AppointmentDailyStat
+STATS_GROUP_FIELDS = {
+    'date': 'date',
+    'doctor': 'doctor_id',
+    'department': 'department_id',
+    'status': 'status',
+}
+
+
+class StreamingExportMixin:
+    """
+    Потоковая выгрузка всей таблицы viewset'а (export_name — ключ в exports.EXPORT_SPECS).
+    Выгрузка содержит персональные и медицинские данные всех пациентов — только для администраторов.
+    """
+    export_name = None
+    export_model_name = None
+
+    def get_query_budget(self):
+        # Число запросов потоковой выгрузки растет с размером таблицы
+        if getattr(self, 'action', None) in ('export_all_csv', 'export_all_jsonl'):
+            return None
+        return super().get_query_budget()
+
+    def _export_all(self, request, export_format):
+        log_audit(request.user, f'export_all_{export_format}', self.export_model_name, 'all')
+        return streaming_export_response(self.export_name, export_format)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def export_all_csv(self, request):
+        """Выгрузка всей таблицы в CSV"""
+        return self._export_all(request, 'csv')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def export_all_jsonl(self, request):
+        """Выгрузка всей таблицы в JSON Lines"""
+        return self._export_all(request, 'jsonl')
 
 
 # ============ ПАЦИЕНТЫ ============
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(ReplicaReadMixin, StreamingExportMixin, QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
     queryset = Patient.objects.all()
+    replica_actions = ('export_json', 'export_csv', 'export_pdf', 'export_all_csv', 'export_all_jsonl')
+    query_budget = 10
+    query_budgets = {
+        'list': 6, 'retrieve': 5, 'medical_records': 6, 'prescriptions': 6,
+        'export_json': 8, 'export_csv': 5, 'export_pdf': 7, 'search': 5, 'timeline': 9,
+    }
+    search_max_results = 50
+    timeline_page_size = 50
+    timeline_max_page_size = 200
+    export_name = 'patients'
+    export_model_name = 'Patient'
+
+    def get_queryset(self):
+        """Точный поиск по ?passport_number= и ?insurance_number= через слепые индексы"""
+        queryset = super().get_queryset()
+        lookups = {
+            name: self.request.query_params[name]
+            for name in ('passport_number', 'insurance_number')
+            if self.request.query_params.get(name)
+        }
+        if lookups:
+            queryset = queryset.blind_filter(**lookups)
+        return queryset
 
     def perform_create(self, serializer):
         patient = serializer.save()
         log_audit(self.request.user, 'create', 'Patient', str(patient.id))
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Поиск пациентов по началу слов ФИО и телефона (?q=иван пет),
+        а также по точному номеру полиса или паспорта
+        """
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response(
+                {'error': 'Параметр q должен содержать не менее 2 символов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.search_max_results)
+        except ValueError:
+            limit = 20
+        patients = Patient.objects.search(query).order_by('full_name', 'pk')[:max(limit, 1)]
+        return Response(PatientSerializer(patients, many=True).data)
+
     @action(detail=True, methods=['get'])
     def medical_records(self, request, pk=None):
         """Получить все медицинские записи пациента"""
         patient = self.get_object()
         records = MedicalRecord.objects.filter(patient=patient)
+        validators = Validators.for_sources(records, key=('medical_records', patient.pk))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
         serializer = MedicalRecordSerializer(records, many=True)
-        return Response(serializer.data)
+        return validators.apply(Response(serializer.data))
 
     @action(detail=True, methods=['get'])
     def prescriptions(self, request, pk=None):
         """Получить все рецепты пациента"""
         patient = self.get_object()
         prescriptions = Prescription.objects.filter(patient=patient)
-        return Response(PrescriptionSerializer(prescriptions, many=True).data)
+        validators = Validators.for_sources(prescriptions, key=('prescriptions', patient.pk))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return validators.apply(Response(PrescriptionSerializer(prescriptions, many=True).data))
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Хронология пациента от новых событий к старым: приемы, медицинские записи,
+        рецепты и процедуры. ?types=appointment,medical_record,prescription,procedure
+        ограничивает типы, ?cursor= — продолжение с предыдущей страницы.
+        """
+        patient = self.get_object()
+        kinds = [value.strip() for value in request.query_params.get('types', '').split(',') if value.strip()]
+        unknown = [kind for kind in kinds if kind not in TIMELINE_SOURCES]
+        if unknown:
+            return Response(
+                {'error': f'Неизвестный тип события: {", ".join(unknown)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            page_size = int(request.query_params.get('page_size', self.timeline_page_size))
+        except ValueError:
+            page_size = self.timeline_page_size
+        page_size = max(1, min(page_size, self.timeline_max_page_size))
+
+        cursor = request.query_params.get('cursor')
+        position = decode_timeline_cursor(cursor) if cursor else None
+        items, next_position = patient_timeline(patient, position, page_size, kinds)
+        next_link = None
+        if next_position is not None:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_timeline_cursor(next_position)
+            )
+        return Response({'next': next_link, 'results': serialize_timeline(items)})
 
     @action(detail=True, methods=['get'])
     def export_json(self, request, pk=None):
         """Экспорт данных пациента в JSON"""
         patient = self.get_object()
+        records = MedicalRecord.objects.filter(patient=patient)
+        appointments = Appointment.objects.filter(patient=patient)
+        validators = Validators.for_sources(patient, records, appointments, key=('export_json', patient.pk))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
         data = {
             'patient': PatientSerializer(patient).data,
-            'medical_records': MedicalRecordSerializer(
-                MedicalRecord.objects.filter(patient=patient),
-                many=True
-            ).data,
-            'appointments': AppointmentSerializer(
-                Appointment.objects.filter(patient=patient),
-                many=True
-            ).data,
+            'medical_records': MedicalRecordSerializer(records, many=True).data,
+            'appointments': AppointmentSerializer(appointments, many=True).data,
             'exported_at': datetime.now().isoformat()
         }
         log_audit(request.user, 'export_json', 'Patient', str(patient.id))
-        return Response(data)
+        return validators.apply(Response(data))
 
     @action(detail=True, methods=['get'])
     def export_csv(self, request, pk=None):
         """Экспорт данных пациента в CSV"""
         patient = self.get_object()
+        validators = Validators.for_sources(patient, key=('export_csv', patient.pk))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
 
         response = HttpResponse(content_type='text/csv; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="patient_{patient.full_name}.csv"'
@@ -95,57 +243,38 @@ class PatientViewSet(viewsets.ModelViewSet):
         ])
 
         log_audit(request.user, 'export_csv', 'Patient', str(patient.id))
-        return response
+        return validators.apply(response)
 
     @action(detail=True, methods=['get'])
     def export_pdf(self, request, pk=None):
-        """Экспорт медицинской карты пациента"""
+        """Экспорт медицинской карты пациента в PDF"""
         patient = self.get_object()
-        
-        response = HttpResponse(content_type='text/plain; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="patient_{patient.full_name}.txt"'
-        
-        content = f"""
-╔════════════════════════════════════════════════════════════╗
-║       МЕДИЦИНСКАЯ КАРТА ПАЦИЕНТА                           ║
-╚════════════════════════════════════════════════════════════╝
-
-ФИО: {patient.full_name}
-Дата рождения: {patient.date_of_birth}
-Возраст: {patient.age} лет
-Пол: {patient.get_gender_display()}
-Номер полиса: {patient.insurance_number}
-Адрес: {patient.address}
-Телефон: {patient.phone}
-
-╔════════════════════════════════════════════════════════════╗
-║       ПОСЛЕДНИЕ МЕДИЦИНСКИЕ ЗАПИСИ                         ║
-╚════════════════════════════════════════════════════════════╝
-"""
-        
-        records = MedicalRecord.objects.filter(patient=patient)[:5]
-        for i, record in enumerate(records, 1):
-            content += f"""
-Запись #{i}:
-  📅 Дата: {record.record_date.date()}
-  👨‍⚕️ Врач: {record.doctor.full_name}
-  🩺 Симптомы: {record.symptoms}
-  💊 Диагноз: {record.diagnosis.name if record.diagnosis else 'Не указан'}
-  📝 Лечение: {record.treatment_plan}
-{'─' * 60}
-"""
-        
-        response.write(content)
+        records = medical_card_records(patient)
+        # Хеш содержимого карты: ETag меняется и в день рождения, и при переименовании врача или диагноза
+        validators = Validators.for_sources(
+            patient, MedicalRecord.objects.filter(patient=patient),
+            key=('export_pdf', medical_card_cache_key(patient, records)),
+        )
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        response = HttpResponse(get_medical_card_pdf(patient, records), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="patient_{patient.full_name}.pdf"'
+
         log_audit(request.user, 'export_pdf', 'Patient', str(patient.id))
-        return response
+        return validators.apply(response)
 
 
 # ============ ПЕРСОНАЛ ============
 
-class StaffViewSet(viewsets.ModelViewSet):
+class StaffViewSet(ReplicaReadMixin, QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = StaffSerializer
     permission_classes = [IsAuthenticated]
     queryset = Staff.objects.all()
+    replica_actions = ('schedule',)
+    query_budget = 10
+    query_budgets = {'list': 6, 'retrieve': 5, 'schedule': 6, 'patients': 6}
 
     def perform_create(self, serializer):
         staff = serializer.save()
@@ -155,28 +284,46 @@ class StaffViewSet(viewsets.ModelViewSet):
     def schedule(self, request, pk=None):
         """Расписание врача на неделю"""
         doctor = self.get_object()
+        today = timezone.now().date()
         appointments = Appointment.objects.filter(
             doctor=doctor,
-            appointment_date__gte=timezone.now().date(),
-            appointment_date__lte=timezone.now().date() + timedelta(days=7)
+            appointment_date__gte=today,
+            appointment_date__lte=today + timedelta(days=7)
         ).order_by('appointment_date', 'appointment_time')
-        return Response(AppointmentSerializer(appointments, many=True).data)
+        # Окно расписания сдвигается каждый день — дата входит в ETag
+        validators = Validators.for_sources(appointments, key=('schedule', doctor.pk, today))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return validators.apply(Response(AppointmentSerializer(appointments, many=True).data))
 
     @action(detail=True, methods=['get'])
     def patients(self, request, pk=None):
-        """Список пациентов врача"""
+        """
+        Пациенты врача постранично, ?ordering=full_name|-full_name|last_visit|-last_visit.
+
+        Один запрос: полусоединение EXISTS по приемам врача и коррелированный
+        подзапрос даты последнего визита (индекс doctor, patient, appointment_date).
+        """
         doctor = self.get_object()
-        appointments = Appointment.objects.filter(doctor=doctor).values_list('patient', flat=True).distinct()
-        patients = Patient.objects.filter(id__in=appointments)
-        return Response(PatientSerializer(patients, many=True).data)
+        visits = Appointment.objects.filter(doctor=doctor, patient=OuterRef('pk'))
+        patients = Patient.objects.filter(Exists(visits)).annotate(
+            last_visit=Subquery(visits.order_by('-appointment_date').values('appointment_date')[:1])
+        )
+        paginator = DoctorPatientPagination()
+        page = paginator.paginate_queryset(patients, request, view=self)
+        return paginator.get_paginated_response(DoctorPatientSerializer(page, many=True).data)
 
 
 # ============ ОТДЕЛЕНИЯ ============
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(ReplicaReadMixin, QueryBudgetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    replica_actions = ('staff_list',)
+    query_budget = 10
+    query_budgets = {'list': 6, 'retrieve': 5, 'staff_list': 6}
 
     def perform_create(self, serializer):
         department = serializer.save()
@@ -192,15 +339,110 @@ class DepartmentViewSet(viewsets.ModelViewSet):
 
 # ============ ПРИЁМЫ ============
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+def available_slots_data(query_params):
+    """
+    Свободные слоты врачей: (данные ответа, код статуса).
+    Общая часть AppointmentViewSet.available_slots и асинхронного варианта.
+    """
+    doctor_param = ','.join(query_params.getlist('doctor_id'))
+    date_str = query_params.get('date')
+    date_from_str = query_params.get('date_from', date_str)
+    date_to_str = query_params.get('date_to', date_from_str)
+
+    if not doctor_param or not date_from_str:
+        return {'error': 'Требуются параметры doctor_id и date'}, status.HTTP_400_BAD_REQUEST
+
+    try:
+        date_from = datetime.strptime(date_from_str, '%Y-%m-%d').date()
+        date_to = datetime.strptime(date_to_str, '%Y-%m-%d').date()
+    except ValueError:
+        return {'error': 'Неверный формат даты (YYYY-MM-DD)'}, status.HTTP_400_BAD_REQUEST
+
+    days_count = (date_to - date_from).days + 1
+    if days_count < 1 or days_count > MAX_SLOT_SEARCH_DAYS:
+        return (
+            {'error': f'Период должен содержать от 1 до {MAX_SLOT_SEARCH_DAYS} дней'},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        doctor_ids = [uuid.UUID(value.strip()) for value in doctor_param.split(',') if value.strip()]
+    except ValueError:
+        return {'error': 'Неверный формат doctor_id'}, status.HTTP_400_BAD_REQUEST
+
+    # updated_at — версия скомпилированного графика: сам JSON читается только при его изменении
+    versions = dict(Staff.objects.filter(id__in=doctor_ids).values_list('id', 'updated_at'))
+    missing = [str(doctor_id) for doctor_id in doctor_ids if doctor_id not in versions]
+    if missing:
+        return {'error': f'Врач не найден: {", ".join(missing)}'}, status.HTTP_404_NOT_FOUND
+
+    dates = [date_from + timedelta(days=offset) for offset in range(days_count)]
+    slots = slot_index.available_slots(doctor_ids, dates, working_hours=working_hours(versions, dates))
+
+    if len(doctor_ids) == 1 and days_count == 1:
+        day_slots = slots[doctor_ids[0]][date_from]
+        return {'available_slots': [slot.strftime('%H:%M') for slot in day_slots]}, status.HTTP_200_OK
+
+    return {
+        'available_slots': {
+            str(doctor_id): {
+                day.isoformat(): [slot.strftime('%H:%M') for slot in day_slots]
+                for day, day_slots in by_date.items()
+            }
+            for doctor_id, by_date in slots.items()
+        }
+    }, status.HTTP_200_OK
+
+
+class AppointmentViewSet(ReplicaReadMixin, StreamingExportMixin, QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
     queryset = Appointment.objects.all()
+    pagination_class = AppointmentPagination
+    replica_actions = ('stats', 'export_all_csv', 'export_all_jsonl')
+    # Запись: блокировка врача и проверка пересечений по БД, сводка по дням и метка
+    # дня в shared-кеше (с DatabaseCache — несколько запросов к таблице кеша)
+    query_budget = 16
+    # batch: число запросов растет с числом пар (врач, дата) в пакете — обновления сводки
+    query_budgets = {
+        'list': 5, 'retrieve': 5, 'available_slots': 6, 'stats': 4, 'create': 20, 'batch': None
+    }
+    export_name = 'appointments'
+    export_model_name = 'Appointment'
+
+    def _save_checked(self, serializer):
+        """
+        Сохранить прием после проверки пересечений по БД. Индекс слотов — только
+        подсказка для поиска: в другом процессе он мог еще не увидеть новую запись
+        """
+        data = serializer.validated_data
+        instance = serializer.instance
+
+        def current(field):
+            # Значение после сохранения: из запроса (PATCH может его не содержать) или текущее
+            return data.get(field, getattr(instance, field, None))
+
+        with transaction.atomic():
+            doctor = current('doctor')
+            # Блокировка врача: параллельные записи к нему проверяются по очереди
+            Staff.objects.select_for_update().filter(pk=doctor.pk).exists()
+            if (current('status') or AppointmentStatus.SCHEDULED) in ACTIVE_STATUSES:
+                is_free, message = check_appointment_conflict(
+                    doctor, current('appointment_date'), current('appointment_time'),
+                    current('duration_minutes') or 30,
+                    exclude_id=instance.pk if instance is not None else None,
+                )
+                if not is_free:
+                    raise ValidationError({'appointment_time': [message]})
+            return serializer.save()
 
     def perform_create(self, serializer):
-        appointment = serializer.save()
+        appointment = self._save_checked(serializer)
         log_audit(self.request.user, 'create', 'Appointment', str(appointment.id))
 
+    def perform_update(self, serializer):
+        self._save_checked(serializer)
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Отмена приема"""
@@ -232,50 +474,301 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         log_audit(request.user, 'confirm', 'Appointment', str(appointment.id))
         return Response({'message': 'Прием подтвержден'})
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Пакетная запись на прием (курс лечения, перенос из другой системы).
+
+        Тело: {"appointments": [...], "atomic": true} или просто список приемов.
+        Пациенты, врачи и пересечения — с приемами в БД и внутри пакета —
+        проверяются для всего пакета сразу, приемы вставляются bulk_create
+        в одной транзакции. При atomic (по умолчанию) ошибка в любом элементе
+        отменяет весь пакет, иначе создаются только корректные элементы.
+        Ответ содержит результат по каждому элементу.
+        """
+        payload = request.data
+        if isinstance(payload, list):
+            items, atomic = payload, True
+        else:
+            items, atomic = payload.get('appointments'), payload.get('atomic', True)
+
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Требуется непустой список appointments'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BATCH_APPOINTMENTS:
+            return Response(
+                {'error': f'Не более {MAX_BATCH_APPOINTMENTS} приемов в одном пакете'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(atomic, bool):
+            return Response(
+                {'error': 'Параметр atomic должен быть true или false'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = [None] * len(items)
+        valid = {}
+        for index, item in enumerate(items):
+            serializer = AppointmentBatchItemSerializer(data=item)
+            if serializer.is_valid():
+                valid[index] = serializer.validated_data
+            else:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+
+        try:
+            with transaction.atomic():
+                created = self._book_batch(valid, results, atomic)
+        except IntegrityError:
+            # Время заняли параллельным запросом между проверкой и вставкой
+            return Response(
+                {'error': 'Время приема занято параллельной записью, повторите запрос'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        slot_index.touch((appointment.doctor_id, appointment.appointment_date) for appointment in created)
+        now = timezone.now()
+        audit_writer.log_events(
+            AuditLog(
+                user_id=request.user.pk, action='create', model_name='Appointment',
+                object_id=str(appointment.pk), changes={'batch': True}, timestamp=now,
+            )
+            for appointment in created
+        )
+
+        for index, appointment in zip(sorted(valid), created):
+            results[index] = {
+                'index': index, 'status': 'created', 'id': str(appointment.pk),
+                'appointment': AppointmentSerializer(appointment).data,
+            }
+        for index, result in enumerate(results):
+            if result is None:
+                # Элемент корректен, но пакет отменен из-за ошибок в других элементах
+                results[index] = {'index': index, 'status': 'skipped'}
+
+        return Response(
+            {
+                'created': len(created),
+                'failed': sum(result['status'] in ('invalid', 'conflict') for result in results),
+                'results': results,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+
+    def _book_batch(self, valid, results, atomic):
+        """
+        Проверить и создать приемы пакета внутри транзакции.
+        valid — {индекс: validated_data}; отклоненные элементы удаляются из valid
+        с записью причины в results. Возвращает созданные приемы в порядке индексов.
+        """
+        def reject(index, kind, errors):
+            results[index] = {'index': index, 'status': kind, 'errors': errors}
+            del valid[index]
+
+        doctor_ids = {data['doctor'] for data in valid.values()}
+        # Блокировка врачей: параллельные пакеты к тем же врачам проверяются по очереди
+        doctors = set(
+            Staff.objects.select_for_update()
+            .filter(id__in=doctor_ids, position=PositionChoice.DOCTOR)
+            .order_by('pk').values_list('id', flat=True)
+        )
+        patients = set(
+            Patient.objects.filter(id__in={data['patient'] for data in valid.values()})
+            .values_list('id', flat=True)
+        )
+        for index, data in list(valid.items()):
+            errors = {}
+            if data['patient'] not in patients:
+                errors['patient'] = ['Пациент не найден.']
+            if data['doctor'] not in doctors:
+                errors['doctor'] = ['Врач не найден.']
+            if errors:
+                reject(index, 'invalid', errors)
+
+        # unique_together (врач, дата, время) действует для приемов в любом статусе
+        taken = set(
+            Appointment.objects.filter(
+                doctor_id__in={data['doctor'] for data in valid.values()},
+                appointment_date__in={data['appointment_date'] for data in valid.values()},
+            ).values_list('doctor_id', 'appointment_date', 'appointment_time')
+        )
+        seen = {}
+        for index, data in list(valid.items()):
+            key = (data['doctor'], data['appointment_date'], data['appointment_time'])
+            if key in taken:
+                reject(index, 'conflict', {'appointment_time': ['Время уже занято приемом врача.']})
+            elif key in seen:
+                reject(index, 'conflict', {'appointment_time': [f'Совпадает с элементом {seen[key]} пакета.']})
+            else:
+                seen[key] = index
+
+        # Время врача занимают только запланированные и подтвержденные приемы
+        active = [
+            index for index, data in valid.items()
+            if data.get('status', AppointmentStatus.SCHEDULED) in ACTIVE_STATUSES
+        ]
+        conflicts = find_appointment_conflicts([
+            {
+                'doctor_id': valid[index]['doctor'],
+                'appointment_date': valid[index]['appointment_date'],
+                'appointment_time': valid[index]['appointment_time'],
+                'duration_minutes': valid[index].get('duration_minutes', 30),
+            }
+            for index in active
+        ])
+        for conflict in conflicts:
+            index = active[conflict['index']]
+            if index not in valid:
+                continue
+            if 'appointment_id' in conflict:
+                reject(index, 'conflict', {
+                    'appointment_time': [f'Пересекается с приемом {conflict["appointment_id"]}.']
+                })
+            else:
+                other = active[conflict['proposal_index']]
+                # Более ранний элемент, отклоненный сам, время не занимает
+                if other in valid:
+                    reject(index, 'conflict', {'appointment_time': [f'Пересекается с элементом {other} пакета.']})
+
+        if not valid or (atomic and len(valid) < len(results)):
+            return []
+
+        appointments = [
+            Appointment(patient_id=data['patient'], doctor_id=data['doctor'], **{
+                field: value for field, value in data.items() if field not in ('patient', 'doctor')
+            })
+            for _, data in sorted(valid.items())
+        ]
+        Appointment.objects.bulk_create(appointments, batch_size=BATCH_INSERT_SIZE)
+
+        # bulk_create не вызывает сигналы — сводка обновляется явно
+        deltas = defaultdict(lambda: [0, 0])
+        for appointment in appointments:
+            merge_deltas(deltas, state_deltas(None, appointment.rollup_state()))
+        apply_deltas(deltas)
+        return appointments
+
     @action(detail=False, methods=['get'])
     def available_slots(self, request):
-        """Получить свободные слоты врача"""
-        doctor_id = request.query_params.get('doctor_id')
-        date_str = request.query_params.get('date')
+        """
+        Получить свободные слоты врача.
+
+        doctor_id может содержать несколько идентификаторов через запятую,
+        вместо date можно передать период date_from/date_to. Слоты строятся
+        в часы работы врача (work_schedule и исключения из графика).
+        """
+        data, code = available_slots_data(request.query_params)
+        return Response(data, status=code)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsStaff])
+    def stats(self, request):
+        """
+        Число приемов и забронированные минуты из сводки AppointmentDailyStat.
+
+        group_by — измерения через запятую (date, doctor, department, status),
+        фильтры — date_from/date_to (по умолчанию последние 30 дней), doctor_id, department_id.
+        """
+        params = request.query_params
+        today = timezone.now().date()
+        try:
+            date_to = datetime.strptime(params['date_to'], '%Y-%m-%d').date() if params.get('date_to') else today
+            date_from = (
+                datetime.strptime(params['date_from'], '%Y-%m-%d').date() if params.get('date_from')
+                else date_to - timedelta(days=STATS_DEFAULT_DAYS - 1)
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Неверный формат даты (YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        days_count = (date_to - date_from).days + 1
+        if days_count < 1 or days_count > MAX_STATS_DAYS:
+            return Response(
+                {'error': f'Период должен содержать от 1 до {MAX_STATS_DAYS} дней'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        if not doctor_id or not date_str:
+        group_by = [value.strip() for value in params.get('group_by', 'date').split(',') if value.strip()]
+        unknown = [value for value in group_by if value not in STATS_GROUP_FIELDS]
+        if unknown:
             return Response(
-                {'error': 'Требуются параметры doctor_id и date'},
+                {'error': f'Неизвестное измерение group_by: {", ".join(unknown)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        stats = AppointmentDailyStat.objects.filter(date__gte=date_from, date__lte=date_to)
         try:
-            appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            if params.get('doctor_id'):
+                stats = stats.filter(doctor_id=uuid.UUID(params['doctor_id']))
+            if params.get('department_id'):
+                stats = stats.filter(department_id=uuid.UUID(params['department_id']))
         except ValueError:
             return Response(
-                {'error': 'Неверный формат даты (YYYY-MM-DD)'},
+                {'error': 'Неверный формат doctor_id или department_id'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        doctor = Staff.objects.get(id=doctor_id)
-        
-        booked = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date,
-            status__in=['scheduled', 'confirmed']
-        ).values_list('appointment_time', flat=True)
-
-        available_slots = []
-        for hour in range(9, 17):
-            for minute in [0, 30]:
-                slot = f"{hour:02d}:{minute:02d}"
-                if slot not in [str(t) for t in booked]:
-                    available_slots.append(slot)
+        fields = [STATS_GROUP_FIELDS[value] for value in dict.fromkeys(group_by)]
+        rows = (
+            stats.values(*fields)
+            .annotate(appointments=Sum('count'), booked_minutes=Sum('booked_minutes'))
+            .filter(appointments__gt=0)
+            .order_by(*fields)
+        )
+        names = {field: name for name, field in STATS_GROUP_FIELDS.items()}
+        return Response({
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'group_by': [names[field] for field in fields],
+            'results': [
+                {
+                    **{names[field]: (str(row[field]) if row[field] is not None else None) for field in fields},
+                    'appointments': row['appointments'],
+                    'booked_minutes': row['booked_minutes'],
+                }
+                for row in rows
+            ],
+        })
+
+
+# ============ ДИАГНОЗЫ (МКБ-10) ============
+
+class DiagnosisViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = DiagnosisSerializer
+    permission_classes = [IsAuthenticated]
+    queryset = Diagnosis.objects.filter(is_active=True)
+    query_budget = 5
+    # Автодополнение обслуживается индексом в памяти. Запас — на аутентификацию,
+    # сверку версии справочника с shared-кешем (раз в ICD10_VERSION_CHECK_INTERVAL)
+    # и перестроение индекса одним запросом после изменения справочника
+    query_budgets = {'autocomplete': 4}
+    autocomplete_max_results = 50
 
-        return Response({'available_slots': available_slots})
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Подбор диагноза по началу кода или слов названия (?q=J06, ?q=сахар диаб)"""
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.autocomplete_max_results)
+        except ValueError:
+            limit = 10
+        return Response(diagnosis_index.lookup(query, max(limit, 1)))
 
 
 # ============ МЕДИЦИНСКИЕ ЗАПИСИ ============
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+class MedicalRecordViewSet(ReplicaReadMixin, StreamingExportMixin, QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = MedicalRecordSerializer
     permission_classes = [IsAuthenticated]
     queryset = MedicalRecord.objects.all()
+    pagination_class = MedicalRecordPagination
+    replica_actions = ('export_all_csv', 'export_all_jsonl')
+    query_budget = 12
+    query_budgets = {'list': 5, 'retrieve': 5}
+    export_name = 'medical_records'
+    export_model_name = 'MedicalRecord'
 
     def perform_create(self, serializer):
         record = serializer.save()
@@ -297,3 +790,13 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         record.save()
         log_audit(request.user, 'sign', 'MedicalRecord', str(record.id))
         return Response({'message': 'Запись подписана'})
+
+
+# ============ АУДИТ ============
+
+class AuditLogViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = AuditLogSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+    queryset = AuditLog.objects.all()
+    pagination_class = AuditLogPagination
+    query_budget = 5
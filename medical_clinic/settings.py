@@ -1,7 +1,11 @@
 import os
+import warnings
 from pathlib import Path
 from datetime import timedelta
 
+import django
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,6 +38,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'clinic.routers.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,14 +62,131 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'medical_clinic.wsgi.application'
+ASGI_APPLICATION = 'medical_clinic.asgi.application'
+
+# Асинхронные версии читающих действий API (clinic.async_views).
+# Включается при запуске под ASGI-сервером (uvicorn/daphne medical_clinic.asgi:application)
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', 'False') == 'True'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_PROFILE=sqlite (по умолчанию) — файл db.sqlite3 в режиме WAL;
+# DB_PROFILE=postgresql — PostgreSQL с постоянными подключениями
+# (DB_POOL=True — пул psycopg 3, нужен Django 5.1+). На Django 4.2 из
+# requirements.txt встроенного пула нет: DB_POOL игнорируется, а пул
+# подключений дает PgBouncer в режиме pool_mode=transaction между
+# приложением и PostgreSQL (DB_HOST/DB_PORT — адрес PgBouncer,
+# DB_CONN_MAX_AGE=0, DB_DISABLE_SERVER_SIDE_CURSORS=True)
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'medical_clinic'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Подключение переиспользуется между запросами и проверяется перед использованием
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+            # За PgBouncer в режиме transaction серверные курсоры (iterator()) не работают
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
+            # Тесты — на локальном PostgreSQL (test_medical_clinic)
+            'TEST': {'NAME': os.environ.get('DB_TEST_NAME', 'test_medical_clinic')},
+        }
+    }
+    if os.environ.get('DB_POOL', 'False') == 'True':
+        if django.VERSION < (5, 1):
+            warnings.warn('DB_POOL=True требует Django 5.1+: пул не включен, используйте PgBouncer')
+        else:
+            # С пулом подключения возвращаются в пул после запроса: CONN_MAX_AGE должен быть 0
+            DATABASES['default']['CONN_MAX_AGE'] = 0
+            DATABASES['default']['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+                'timeout': 10,
+            }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Ожидание блокировки драйвером sqlite3, секунды
+            'OPTIONS': {'timeout': 20},
+        }
     }
+    if django.VERSION >= (5, 1):
+        # BEGIN IMMEDIATE: блокировка записи берется в начале транзакции, поэтому
+        # параллельные записи ждут busy_timeout, а не падают с "database is locked"
+        # при попытке повысить блокировку чтения до записи
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# Реплики для чтения (clinic.routers): DB_REPLICAS — хосты PostgreSQL
+# или пути к файлам SQLite через запятую. Реплики наполняются репликацией
+# из default; миграции на них не выполняются, в тестах они зеркалят default
+REPLICA_DATABASES = []
+for _number, _target in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    _replica = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {}))}
+    _replica['HOST' if DB_PROFILE == 'postgresql' else 'NAME'] = _target.strip()
+    _replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{_number}'] = _replica
+    REPLICA_DATABASES.append(f'replica{_number}')
+
+DATABASE_ROUTERS = ['clinic.routers.ReplicaRouter']
+# Сколько секунд после записи пользователь читает только из default (read-your-writes)
+REPLICA_STICKY_SECONDS = 15
+
+# PRAGMA для каждого нового подключения к SQLite (clinic.signals.configure_sqlite_connection).
+# WAL: читатели не блокируют писателя; synchronous=NORMAL в WAL безопасен при сбое процесса
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+# Cache
+# 'documents' хранит готовые PDF-документы (ключ — хеш содержимого),
+# зашифрованные ENCRYPTION_KEY: в них персональные и медицинские данные
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'documents': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'documents',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
+# 'shared' — общий для всех процессов кеш (несколько воркеров, ASGI, команды):
+# метки актуальности индексов в памяти процессов (слоты, МКБ-10) и признаки
+# read-your-writes. LocMemCache здесь не подходит: каждый процесс видел бы
+# только свои изменения. REDIS_URL — Redis (пакет redis), иначе таблица
+# cache_shared в основной БД (создается миграцией clinic 0014).
+if os.environ.get('REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'KEY_PREFIX': 'clinic',
+    }
+else:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_shared',
+        'OPTIONS': {'MAX_ENTRIES': 200000},
+    }
+SHARED_CACHE_ALIAS = 'shared'
+# Не дольше этого (сек) индекс слотов процесса может не видеть изменений в обход сигналов
+SLOT_INDEX_TTL = 300
+# Как часто (сек) процесс сверяет версию справочника МКБ-10 с shared-кешем
+ICD10_VERSION_CHECK_INTERVAL = 5
+DOCUMENT_CACHE_ALIAS = 'documents'
+DOCUMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -105,6 +227,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',  # Разрешить всем без аутентификации
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # JWT проверяется без запроса к БД: пользователь и роль берутся из токена
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -118,6 +242,9 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'clinic.authentication.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'clinic.authentication.RoleTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'clinic.authentication.ClinicTokenUser',
 }
 
 # CORS Configuration
@@ -129,7 +256,32 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # Encryption
-ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY', 'your-encryption-key-here')
+# ENCRYPTION_KEY — ключ Fernet (Fernet.generate_key()). При смене ключа прежний
+# переносится в ENCRYPTION_OLD_KEYS (через запятую), затем данные
+# перешифровываются командой rotate_encryption_keys. Без DEBUG ключ обязателен:
+# с ключом-заглушкой из репозитория данные пациентов может расшифровать любой
+ENCRYPTION_KEY_PLACEHOLDER = 'your-encryption-key-here'
+ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY', ENCRYPTION_KEY_PLACEHOLDER)
+if not DEBUG and ENCRYPTION_KEY.strip() in ('', ENCRYPTION_KEY_PLACEHOLDER):
+    raise ImproperlyConfigured('Задайте ENCRYPTION_KEY (ключ Fernet): при DEBUG = False ключ-заглушка не допускается')
+ENCRYPTION_OLD_KEYS = [key for key in os.environ.get('ENCRYPTION_OLD_KEYS', '').split(',') if key]
+# BLIND_INDEX_KEY — ключ HMAC слепых индексов зашифрованных полей (поиск и
+# уникальность номеров документов). Отдельный от SECRET_KEY: утечка или смена
+# SECRET_KEY не должна раскрывать или ломать индексы. Без DEBUG обязателен;
+# при смене ключа индексы нужно пересчитать
+BLIND_INDEX_KEY = os.environ.get('BLIND_INDEX_KEY', '')
+if not DEBUG and not BLIND_INDEX_KEY.strip():
+    raise ImproperlyConfigured('Задайте BLIND_INDEX_KEY: при DEBUG = False ключ слепых индексов обязателен')
+
+# Audit log: события пишутся пакетами из фонового потока
+AUDIT_LOG_ASYNC = True
+AUDIT_LOG_BATCH_SIZE = 200
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+
+# Бюджет SQL-запросов (clinic.querybudget): при превышении в DEBUG и тестах —
+# исключение, иначе предупреждение в лог
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_RAISE = DEBUG
 
 # AWS S3 Configuration
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID', '')
@@ -165,6 +317,9 @@ LOGGING = {
     },
 }
 
+# Встроенный планировщик (manage.py run_scheduler): время ежедневной автоотмены приемов
+AUTO_CANCEL_RUN_AT = '02:00'
+
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
@@ -1,12 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 from clinic.views import (
     PatientViewSet, 
     StaffViewSet,
     AppointmentViewSet,
     DepartmentViewSet,
     MedicalRecordViewSet,
+    AuditLogViewSet,
+    DiagnosisViewSet,
 )
 
 # Swagger
@@ -32,13 +36,24 @@ router.register(r'staff', StaffViewSet, basename='staff')
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
 router.register(r'departments', DepartmentViewSet, basename='department')
 router.register(r'medical-records', MedicalRecordViewSet, basename='medical-record')
+router.register(r'audit-logs', AuditLogViewSet, basename='audit-log')
+router.register(r'diagnoses', DiagnosisViewSet, basename='diagnosis')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include(router.urls)),
+    path('api/v1/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/v1/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/v1/auth/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('api-auth/', include('rest_framework.urls')),
     
     # Документация API
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
+
+# Под ASGI читающие действия обслуживаются async-представлениями (те же URL)
+if settings.ASYNC_READ_VIEWS:
+    from clinic.async_views import urlpatterns as async_urlpatterns
+
+    urlpatterns.insert(1, path('api/v1/', include(async_urlpatterns)))